@@ -0,0 +1,67 @@
+"""
+Stands in for ``java -jar server.jar`` so the Minecraft cog can be exercised
+without Java. Point ``JAVA_EXECUTABLE`` to a script that runs this module.
+
+It prints the lines the cog waits for, answers the console and, when the
+server.properties of its folder enables it, RCON, with the stand-in server
+from ``cogs.minecraftserver.rcon``. ``FAKE_MINECRAFT_STARTUP`` is how many
+seconds it takes to be ready.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+from cogs.minecraftserver.properties import read_properties
+from cogs.minecraftserver.rcon import RconServer
+
+MAX_PLAYERS = 20
+
+
+def log(message: str):
+    print(
+        f"[{time.strftime('%H:%M:%S')}] [Server thread/INFO]: {message}",
+        flush=True,
+    )
+
+
+def answer(command: str) -> str:
+    if command == "list":
+        return f"There are 0 of a max of {MAX_PLAYERS} players online: "
+    if command == "tick query":
+        return (
+            "The game is running normally\nTarget tick rate: 20.0 per second."
+            "\nAverage time per tick: 4.2ms (Target: 50.0ms)"
+        )
+    if command.startswith("save-all"):
+        return "Saving the game (this may take a moment!)Saved the game"
+    if command in ("save-off", "save-on"):
+        return f"Automatic saving is now {'disabled' if command == 'save-off' else 'enabled'}"
+    return f"Ran: {command}"
+
+
+async def main():
+    log("Starting minecraft server version 1.20.4")
+    rcon = None
+    properties = read_properties(Path.cwd())
+    if properties.get("enable-rcon") == "true":
+        rcon = RconServer(properties.get("rcon.password", ""), answer)
+        await rcon.start("127.0.0.1", int(properties["rcon.port"]))
+    await asyncio.sleep(float(os.getenv("FAKE_MINECRAFT_STARTUP", "0.5")))
+    log('Done (0.5s)! For help, type "help"')
+    while True:
+        line = await asyncio.to_thread(sys.stdin.readline)
+        command = line.strip()
+        if not line or command == "stop":
+            log("Stopping server")
+            break
+        for output in answer(command).split("\n"):
+            log(output)
+    if rcon is not None:
+        await rcon.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,715 @@
+"""
+Load tests the whole bot without Discord.
+
+The bot is built by ``create_bot`` with every cog, the Minecraft one
+included, but it never connects: the synthetic guilds are added to its
+cache directly, the gateway events are fed to the same parsers and
+listeners the gateway would feed them to, and every REST call goes to a fake
+that answers after ``--api-latency`` ms. A fake Minecraft process stands in
+for Java.
+
+The commands are replayed in bursts of ``--burst-size`` events, spread over
+the guilds and mixed as ``--mix`` says. It reports the event-loop lag (a
+heartbeat is late by as much), how long each kind of event took to get its
+first and last response, and the REST calls it made:
+
+    python -m benchmarks.load --guilds 1000 --bursts 20 --burst-size 100
+"""
+
+import argparse
+import asyncio
+import contextvars
+import datetime
+import itertools
+import os
+import random
+import re
+import shutil
+import statistics
+import stat
+import sys
+import tempfile
+import time
+import zipfile
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import discord
+from discord.ext import commands
+from discord.http import Route
+
+import cogs.minecraftserver
+from benchmarks.loop_lag import monitor_lag
+from benchmarks.movies import (
+    channel_id,
+    load_previous,
+    percentile,
+    print_results,
+    role_id,
+    save_results,
+    StubIMDb,
+    seeded_database,
+)
+from bot import create_bot
+from utils.database import create_database_engine
+
+BOT_ID = 900000000000000001
+USER_ID = 900000000000000002
+JOINED_AT = "2021-01-01T00:00:00+00:00"
+DEFAULT_MIX = (
+    "list=4,list_watched=1,add=2,watch=1,stop=1,click=3,"
+    "mine=1,mine_status=1,mine_cmd=1,help=1"
+)
+# Discord closes the connection of a shard that misses its heartbeat for
+# more than the interval, which it sets to 41.25s.
+HEARTBEAT_INTERVAL = 41.25
+
+# The synthetic event that is being handled, the REST calls are counted
+# against it. Handler tasks inherit it from the dispatch.
+current_event: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "current_event", default=None
+)
+snowflakes = itertools.count(
+    discord.utils.time_snowflake(datetime.datetime.utcnow())
+)
+
+
+def text_channel_id(guild_id: int) -> int:
+    return guild_id * 10 + 3
+
+
+def user_payload(user_id: int) -> dict:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "discriminator": "0001",
+        "avatar": None,
+        "bot": user_id == BOT_ID,
+    }
+
+
+def member_payload(user_id: int) -> dict:
+    return {
+        "user": user_payload(user_id),
+        "roles": [],
+        "joined_at": JOINED_AT,
+        "deaf": False,
+        "mute": False,
+    }
+
+
+def role_payload(role: int, name: str) -> dict:
+    return {
+        "id": str(role),
+        "name": name,
+        "permissions": "0",
+        "position": 0,
+        "color": 0,
+        "hoist": False,
+        "managed": False,
+        "mentionable": True,
+    }
+
+
+def guild_payload(guild_id: int) -> dict:
+    return {
+        "id": str(guild_id),
+        "name": f"Guild {guild_id}",
+        "owner_id": str(USER_ID),
+        "member_count": 2,
+        "channels": [
+            {
+                "id": str(text_channel_id(guild_id)),
+                "type": 0,
+                "name": "general",
+                "position": 0,
+                "permission_overwrites": [],
+            },
+            {
+                "id": str(channel_id(guild_id)),
+                "type": 2,
+                "name": "cinema",
+                "position": 1,
+                "bitrate": 64000,
+                "user_limit": 0,
+                "permission_overwrites": [],
+            },
+        ],
+        "roles": [
+            role_payload(guild_id, "@everyone"),
+            role_payload(role_id(guild_id), "cinema"),
+        ],
+        "members": [member_payload(BOT_ID), member_payload(USER_ID)],
+    }
+
+
+def message_payload(
+    message_id: int, channel: int, author: dict, data: Optional[dict]
+) -> dict:
+    data = data or {}
+    return {
+        "id": str(message_id),
+        "channel_id": str(channel),
+        "author": author,
+        "content": data.get("content") or "",
+        "embeds": data.get("embeds") or [],
+        "components": data.get("components") or [],
+        "attachments": [],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "type": 0,
+        "flags": data.get("flags", 0),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "edited_timestamp": None,
+    }
+
+
+class Event:
+    def __init__(self, kind: str, guild_id: int, dispatched_at: float):
+        self.kind = kind
+        self.guild_id = guild_id
+        self.channel = text_channel_id(guild_id)
+        self.dispatched_at = dispatched_at
+        # The message a click was on.
+        self.message_id: Optional[int] = None
+        self.responses: List[float] = []
+        self.failed = False
+
+
+class FakeDiscord:
+    """
+    Everything the bot would get from Discord. REST calls are answered with
+    payloads built from what was sent, and remembered per route and per
+    event. Interaction responses are matched to their event by token,
+    everything else by ``current_event``.
+    """
+
+    def __init__(self, bot: commands.AutoShardedBot, latency: float):
+        self.bot = bot
+        self.latency = latency
+        self.events: Dict[int, Event] = {}
+        self.tokens: Dict[str, int] = {}
+        self.originals: Dict[str, int] = {}
+        # The messages with buttons, by ID, with their channel.
+        self.buttons: Dict[int, dict] = {}
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.last_call = time.perf_counter()
+        bot.http.request = self.request
+        change_presence = bot.change_presence
+
+        async def count_presence(**kwargs):
+            self.calls["GATEWAY PRESENCE_UPDATE"] += 1
+            await change_presence(**kwargs)
+
+        bot.change_presence = count_presence
+        bot.add_listener(self.on_command_error, "on_command_error")
+        bot.add_listener(self.on_slash_error, "on_slash_command_error")
+
+    def connect(self, guild_ids: List[int]):
+        state = self.bot._connection
+        state.user = discord.ClientUser(state=state, data=user_payload(BOT_ID))
+        for guild_id in guild_ids:
+            state._add_guild_from_data(guild_payload(guild_id))
+        self.bot._ready.set()
+        self.bot.dispatch("ready")
+
+    @staticmethod
+    def route_name(route: Route) -> str:
+        path = route.path
+        path = re.sub(
+            r"/interactions/\d+/[^/]+", "/interactions/{id}/{token}", path
+        )
+        path = re.sub(
+            r"/webhooks/\d+/[^/]+", "/webhooks/{application_id}/{token}", path
+        )
+        path = re.sub(r"/messages/\d+", "/messages/{message_id}", path)
+        return f"{route.method} {path}"
+
+    async def request(self, route: Route, *, files=None, form=None, **kwargs):
+        name = self.route_name(route)
+        self.calls[name] += 1
+        token = re.search(
+            r"/(?:interactions/\d+|webhooks/\d+)/([^/]+)", route.path
+        )
+        event_id = (
+            self.tokens.get(token.group(1)) if token else current_event.get()
+        )
+        await asyncio.sleep(self.latency)
+        self.last_call = time.perf_counter()
+        event = self.events.get(event_id)
+        if event is not None:
+            event.responses.append(self.last_call)
+        return self.respond(route, name, kwargs.get("json"), event)
+
+    def respond(
+        self, route: Route, name: str, data: Optional[dict], event: Event
+    ):
+        if name.endswith("/callback"):
+            # Type 7 edits the message that was clicked, which isn't in the
+            # path, only the click event knows it.
+            if data and data.get("type") == 7 and event is not None:
+                self.track_buttons(event.message_id, event, data["data"])
+            return None
+        if name == "PATCH /channels/{channel_id}":
+            return self.channel_payload(route.channel_id, data)
+        if "/messages" not in name and not name.startswith("POST /webhooks"):
+            return {}
+        message_id = getattr(route, "message_id", None)
+        token = re.search(r"/webhooks/\d+/([^/]+)", route.path)
+        if token:
+            original = name.endswith("@original")
+            message_id = (
+                self.originals.setdefault(token.group(1), next(snowflakes))
+                if original
+                else message_id or next(snowflakes)
+            )
+            channel = event.channel if event is not None else 0
+        else:
+            message_id = message_id or next(snowflakes)
+            channel = route.channel_id
+        self.track_buttons(message_id, event, data)
+        return message_payload(message_id, channel, user_payload(BOT_ID), data)
+
+    def channel_payload(self, channel_id: int, changes: dict) -> dict:
+        channel = self.bot.get_channel(channel_id)
+        return {
+            "id": str(channel_id),
+            "guild_id": str(channel.guild.id),
+            "type": channel.type.value,
+            "name": channel.name,
+            "position": channel.position,
+            "bitrate": getattr(channel, "bitrate", 64000),
+            "user_limit": getattr(channel, "user_limit", 0),
+            "permission_overwrites": [],
+            **changes,
+        }
+
+    def track_buttons(
+        self, message_id: int, event: Optional[Event], data: Optional[dict]
+    ):
+        if event is None or not data or "components" not in data:
+            return
+        if data["components"]:
+            self.buttons[int(message_id)] = {
+                "guild_id": event.guild_id,
+                "components": data["components"],
+            }
+        else:
+            self.buttons.pop(int(message_id), None)
+
+    def new_event(self, kind: str, guild_id: int) -> int:
+        event_id = next(snowflakes)
+        self.events[event_id] = Event(kind, guild_id, time.perf_counter())
+        return event_id
+
+    def send_message(self, kind: str, guild_id: int, content: str):
+        event_id = self.new_event(kind, guild_id)
+        data = message_payload(
+            event_id,
+            text_channel_id(guild_id),
+            user_payload(USER_ID),
+            {"content": content},
+        )
+        data["guild_id"] = str(guild_id)
+        data["member"] = member_payload(USER_ID)
+        token = current_event.set(event_id)
+        try:
+            self.bot._connection.parse_message_create(data)
+        finally:
+            current_event.reset(token)
+
+    def interact(self, kind: str, guild_id: int, payload: dict):
+        event_id = self.new_event(kind, guild_id)
+        self.tokens[f"token{event_id}"] = event_id
+        payload.update(
+            id=str(event_id),
+            token=f"token{event_id}",
+            application_id=str(BOT_ID),
+            guild_id=str(guild_id),
+            channel_id=str(text_channel_id(guild_id)),
+            member=member_payload(USER_ID),
+            version=1,
+        )
+        token = current_event.set(event_id)
+        try:
+            self.bot.dispatch(
+                "socket_response", {"t": "INTERACTION_CREATE", "d": payload}
+            )
+        finally:
+            current_event.reset(token)
+        return event_id
+
+    def slash(self, kind: str, guild_id: int, name: str, options=()):
+        self.interact(
+            kind,
+            guild_id,
+            {
+                "type": 2,
+                "data": {
+                    "id": "1",
+                    "name": "movie",
+                    "type": 1,
+                    "options": [
+                        {"name": name, "type": 1, "options": list(options)}
+                    ],
+                },
+            },
+        )
+
+    def click(self, label: str) -> bool:
+        """
+        Clicks ``label`` on one of the messages that have buttons. False
+        when there is none.
+        """
+        if not self.buttons:
+            return False
+        message_id = random.choice(list(self.buttons))
+        message = self.buttons[message_id]
+        for row in message["components"]:
+            for button in row["components"]:
+                if button.get("label") == label and not button.get("disabled"):
+                    custom_id = button["custom_id"]
+                    break
+            else:
+                continue
+            break
+        else:
+            return False
+        payload = message_payload(
+            message_id,
+            text_channel_id(message["guild_id"]),
+            user_payload(BOT_ID),
+            {"components": message["components"]},
+        )
+        event_id = self.interact(
+            "click",
+            message["guild_id"],
+            {
+                "type": 3,
+                "data": {"custom_id": custom_id, "component_type": 2},
+                "message": payload,
+            },
+        )
+        self.events[event_id].message_id = message_id
+        return True
+
+    def fail(self, event_id: int, error: Exception):
+        error = getattr(error, "original", error)
+        self.errors[f"{type(error).__name__}: {error}"] += 1
+        event = self.events.get(event_id)
+        if event is not None:
+            event.failed = True
+
+    async def on_command_error(self, ctx: commands.Context, error):
+        self.fail(ctx.message.id, error)
+
+    async def on_slash_error(self, ctx, error):
+        self.fail(int(ctx.interaction_id), error)
+
+
+class Scenario:
+    def __init__(self, fake: FakeDiscord, guilds: int, rng: random.Random):
+        self.fake = fake
+        self.guilds = guilds
+        self.rng = rng
+        self.next_imdb_id = 10**7
+
+    def fire(self, kind: str):
+        fake = self.fake
+        guild_id = self.rng.randrange(self.guilds) + 1
+        if kind == "list":
+            fake.slash(kind, guild_id, "list")
+        elif kind == "list_watched":
+            fake.slash(
+                kind,
+                guild_id,
+                "list",
+                [{"name": "filter_by", "type": 3, "value": "watched"}],
+            )
+        elif kind == "add":
+            self.next_imdb_id += 1
+            fake.slash(
+                kind,
+                guild_id,
+                "add",
+                [{"name": "imdb_id", "type": 4, "value": self.next_imdb_id}],
+            )
+        elif kind in ("watch", "stop"):
+            fake.slash(kind, guild_id, kind)
+        elif kind == "click":
+            if not fake.click("Next"):
+                fake.slash("list", guild_id, "list")
+        elif kind == "mine":
+            fake.send_message(kind, guild_id, "$mine")
+        elif kind == "mine_status":
+            fake.send_message(kind, guild_id, "$mine status")
+        elif kind == "mine_cmd":
+            fake.send_message(kind, guild_id, "$mine cmd list")
+        elif kind == "help":
+            fake.send_message(kind, guild_id, "$help")
+        else:
+            raise ValueError(f"Unknown event kind: {kind}")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+
+def prepare_minecraft(folder: Path, versions: int) -> Path:
+    """
+    Creates ``versions`` server folders in ``folder`` and the script that
+    runs the fake server instead of Java.
+    """
+    for number in range(versions):
+        version = folder / "versions" / f"fake-{number}"
+        version.mkdir(parents=True)
+        with zipfile.ZipFile(version / "server.jar", "w") as jar:
+            jar.writestr("version.json", '{"name": "1.20.4"}')
+        (version / "server.properties").write_text("enable-rcon=true\n")
+    java = folder / "java"
+    java.write_text(
+        f"#!/bin/sh\n"
+        f"PYTHONPATH={Path(__file__).parent.parent} "
+        f"exec {sys.executable} -m benchmarks.fake_minecraft\n"
+    )
+    java.chmod(java.stat().st_mode | stat.S_IEXEC)
+    return java
+
+
+async def wait_until_quiet(fake: FakeDiscord, settle: float, limit: float):
+    deadline = time.perf_counter() + limit
+    while time.perf_counter() < deadline:
+        quiet_for = time.perf_counter() - fake.last_call
+        if quiet_for >= settle:
+            return
+        await asyncio.sleep(settle - quiet_for)
+
+
+def summarize(fake: FakeDiscord) -> Dict[str, dict]:
+    by_kind = defaultdict(list)
+    for event in fake.events.values():
+        by_kind[event.kind].append(event)
+    results = {}
+    for kind, events in sorted(by_kind.items()):
+        answered = [event for event in events if event.responses]
+        first = [
+            (event.responses[0] - event.dispatched_at) * 1000
+            for event in answered
+        ]
+        last = [
+            (event.responses[-1] - event.dispatched_at) * 1000
+            for event in answered
+        ]
+        results[kind] = {
+            "events": len(events),
+            "unanswered": len(events) - len(answered),
+            "failed": sum(event.failed for event in events),
+            "first_p50_ms": percentile(first, 0.5) if first else 0.0,
+            "first_p99_ms": percentile(first, 0.99) if first else 0.0,
+            "last_p50_ms": percentile(last, 0.5) if last else 0.0,
+            "last_p99_ms": percentile(last, 0.99) if last else 0.0,
+            "api_calls": statistics.mean(
+                len(event.responses) for event in events
+            ),
+        }
+    return results
+
+
+async def run(args, database: Path, folder: Path) -> dict:
+    os.environ["JAVA_EXECUTABLE"] = str(
+        prepare_minecraft(folder, args.minecraft_servers)
+    )
+    os.environ["FAKE_MINECRAFT_STARTUP"] = str(args.minecraft_startup)
+    # Idle servers would be stopped in the middle of the run.
+    os.environ["MINECRAFT_IDLE_MINUTES"] = "0"
+    os.environ.setdefault("MINECRAFT_MEMORY_BUDGET", "64G")
+    cogs.minecraftserver.BASE_DIR = folder
+    if args.command_stats:
+        os.environ["COMMAND_STATS"] = "true"
+
+    engine = create_database_engine(f"sqlite:///{database}")
+    bot = create_bot(
+        engine,
+        shard_ids=[0],
+        shard_count=1,
+        sync_commands=False,
+        host_minecraft=True,
+    )
+    fake = FakeDiscord(bot, args.api_latency / 1000)
+    instrumentation = bot.get_cog("Status").instrumentation
+    # The fake replaced the request the instrumentation wrapped.
+    instrumentation.watch_http(bot.http)
+    StubIMDb.latency = args.imdb_latency / 1000
+    bot.get_cog("Movies").metadata.imdb_factory = StubIMDb
+    rng = random.Random(args.seed)
+    scenario = Scenario(fake, args.guilds, rng)
+    weights = parse_mix(args.mix)
+
+    fake.connect(list(range(1, args.guilds + 1)))
+    minecraft = bot.get_cog("MinecraftCog")
+    await asyncio.sleep(0.5)
+    for server_id in range(1, args.minecraft_servers + 1):
+        fake.send_message("mine_run", 1, f"$mine run_server {server_id}")
+    await wait_until_quiet(fake, args.minecraft_startup + 1, 30)
+
+    lag: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(lag, args.tick, stop))
+    started = time.perf_counter()
+    for _ in range(args.bursts):
+        for kind in rng.choices(
+            list(weights), list(weights.values()), k=args.burst_size
+        ):
+            scenario.fire(kind)
+        await asyncio.sleep(args.burst_interval)
+    await wait_until_quiet(fake, args.settle, 60)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    minecraft.cog_unload()
+    while minecraft.pool.running():
+        await asyncio.sleep(0.1)
+    for cog in (bot.get_cog("Movies"),):
+        cog.metadata.executor.shutdown()
+        cog.repository.executor.shutdown()
+    engine.dispose()
+
+    events = summarize(fake)
+    lag_ms = sorted(sample * 1000 for sample in lag)
+    events["loop_lag"] = {
+        "p50_ms": percentile(lag_ms, 0.5),
+        "p99_ms": percentile(lag_ms, 0.99),
+        "max_ms": lag_ms[-1],
+    }
+    return {
+        "seconds": elapsed,
+        "events": events,
+        "api_calls": dict(fake.calls.most_common()),
+        "errors": dict(fake.errors.most_common()),
+        "commands": instrumentation.snapshot()["commands"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument(
+        "--max-movies",
+        type=int,
+        default=2000,
+        help="Movies of the biggest guild",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--burst-size", type=int, default=100)
+    parser.add_argument(
+        "--burst-interval", type=float, default=1, help="Seconds"
+    )
+    parser.add_argument(
+        "--mix",
+        default=DEFAULT_MIX,
+        help="Weight of each kind of event, as kind=weight,...",
+    )
+    parser.add_argument(
+        "--api-latency", type=float, default=50, help="Ms per REST call"
+    )
+    parser.add_argument(
+        "--imdb-latency", type=float, default=300, help="Ms per IMDb fetch"
+    )
+    parser.add_argument("--minecraft-servers", type=int, default=1)
+    parser.add_argument(
+        "--minecraft-startup", type=float, default=0.5, help="Seconds"
+    )
+    parser.add_argument(
+        "--tick", type=float, default=0.01, help="Lag sampling interval in s"
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=1,
+        help="Seconds without REST calls after which the run is over",
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        help="Results to compare with, the latest saved ones by default",
+    )
+    parser.add_argument(
+        "--command-stats",
+        action="store_true",
+        help="Run with COMMAND_STATS=true and print what $stats would",
+    )
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    seeded = seeded_database(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / seeded.name
+        shutil.copyfile(seeded, database)
+        results = asyncio.run(run(args, database, Path(tmp)))
+
+    previous = load_previous("load", args)
+    lag = results["events"].pop("loop_lag")
+    previous_lag = (previous or {}).get("events", {}).pop("loop_lag", None)
+    print(
+        f"{sum(e['events'] for e in results['events'].values())} events in "
+        f"{results['seconds']:.1f}s"
+    )
+    print_results(
+        results["events"],
+        (previous or {}).get("events"),
+        [
+            "events",
+            "failed",
+            "first_p50_ms",
+            "first_p99_ms",
+            "last_p99_ms",
+            "api_calls",
+        ],
+    )
+    print_results(
+        {"loop_lag": lag},
+        {"loop_lag": previous_lag} if previous_lag else None,
+        ["p50_ms", "p99_ms", "max_ms"],
+    )
+    if lag["max_ms"] / 1000 > HEARTBEAT_INTERVAL:
+        print("The loop stalled for longer than a heartbeat interval")
+    print("REST calls:")
+    for route, count in results["api_calls"].items():
+        print(f"{count:>8} {route}")
+    if results["errors"]:
+        print("Errors:")
+        for error, count in results["errors"].items():
+            print(f"{count:>8} {error}")
+    if results["commands"]:
+        print_results(
+            results["commands"],
+            (previous or {}).get("commands"),
+            [
+                "calls",
+                "errors",
+                "p50_ms",
+                "p99_ms",
+                "queries",
+                "query_ms",
+                "api_calls",
+                "imdb_ms",
+            ],
+        )
+    results["events"]["loop_lag"] = lag
+    if not args.no_save:
+        save_results("load", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Measures how much the Movies cog database calls stall the event loop.
+
+A ticker coroutine wakes up every few milliseconds while many simulated
+commands hit the database at the same time. The difference between the
+expected and the actual wake up time is the event-loop lag, which is what
+delays heartbeats and every other guild's commands.
+
+Each database statement sleeps for ``--latency`` ms to simulate the network
+round trip to Postgres. The "blocking" mode runs the queries directly inside
+the coroutines (how the cog used to work) and the "offloaded" mode awaits the
+repository, which runs them on its thread pool.
+
+    python -m benchmarks.loop_lag --commands 200 --latency 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from cogs.movies.models import Base, Movie, ConfigVariable
+from cogs.movies.repository import MovieRepository
+from utils.constants import GUILD_CONFIG_VARIABLES
+
+
+def seed(engine, guilds: int, movies_per_guild: int):
+    with Session(engine) as session:
+        for guild_id in range(1, guilds + 1):
+            for var in GUILD_CONFIG_VARIABLES:
+                session.add(
+                    ConfigVariable(guild_id=guild_id, key=var, value="1")
+                )
+            for imdb_id in range(movies_per_guild):
+                session.add(
+                    Movie(
+                        imdb_id=imdb_id,
+                        title=f"Movie {imdb_id}",
+                        year=2000,
+                        rating=7.0,
+                        guild_id=guild_id,
+                    )
+                )
+        session.commit()
+
+
+async def monitor_lag(
+    samples: List[float], interval: float, stop: asyncio.Event
+):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def command(repository: MovieRepository, guild_id: int, blocking: bool):
+    # The kind of queries that a `/movie watch` issues.
+    calls = [
+        (MovieRepository.get_config_variables, (guild_id,)),
+        (MovieRepository.pick_unwatched_movie, (guild_id,)),
+        (MovieRepository.get_movie, (guild_id, 1)),
+    ]
+    for method, args in calls:
+        if blocking:
+            method.__wrapped__(repository, *args)
+            # Yield like the real handlers do between Discord calls.
+            await asyncio.sleep(0)
+        else:
+            await method(repository, *args)
+
+
+async def run(repository: MovieRepository, args, blocking: bool):
+    samples: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(samples, args.interval, stop))
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            command(repository, i % args.guilds + 1, blocking)
+            for i in range(args.commands)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(
+        f"{'blocking' if blocking else 'offloaded':>10}: "
+        f"wall={elapsed * 1000:8.1f}ms "
+        f"lag mean={statistics.mean(samples) * 1000:7.2f}ms "
+        f"p99={p99 * 1000:7.2f}ms max={samples[-1] * 1000:7.2f}ms "
+        f"ticks={len(samples)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--movies", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=5, help="Simulated ms per statement"
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--interval", type=float, default=0.005, help="Ticker interval in s"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            f"sqlite:///{Path(tmp) / 'bench.sqlite3'}", future=True
+        )
+        Base.metadata.create_all(engine)
+        seed(engine, args.guilds, args.movies)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def simulate_round_trip(*_):
+            time.sleep(args.latency / 1000)
+
+        repository = MovieRepository(engine, max_workers=args.workers)
+        for blocking in (True, False):
+            asyncio.run(run(repository, args, blocking))
+        repository.executor.shutdown()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+"""
+Benchmarks the Movies cog commands end to end.
+
+A SQLite database is seeded with synthetic guilds: most have a handful of
+movies and a few have thousands, like the real ones, and every guild has its
+config variables. The cog's handlers are then called with fake contexts,
+messages and button clicks, and IMDb is replaced by a stub, so nothing goes
+to the network. For every command it reports the p50/p99 latency, the
+queries it issues and the peak memory allocated while running it.
+
+The seeded database is kept in ``benchmarks/.data`` and copied for each run,
+so commands that write don't change the data later runs see. Results are
+saved in ``benchmarks/results`` and compared with the previous run:
+
+    python -m benchmarks.movies --guilds 10000 --max-movies 5000
+"""
+
+import argparse
+import asyncio
+import contextvars
+import datetime
+import json
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.future import Engine
+
+from cogs.movies import Movies
+from cogs.movies.metadata import MovieMetadataCache
+from cogs.movies.models import Base, ConfigVariable, Movie
+from cogs.movies.repository import MovieRepository
+from utils.database import create_database_engine
+
+BENCHMARKS_DIR = Path(__file__).parent
+DATA_DIR = BENCHMARKS_DIR / ".data"
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+SEED_BATCH_SIZE = 10000
+PAGES_CLICKED = 5
+
+# Whether the queries of the current task count, setup queries don't. The
+# repository copies the context to its threads, so this follows the queries.
+measuring: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "measuring", default=False
+)
+
+
+class FakeRole:
+    def __init__(self, role_id: int):
+        self.id = role_id
+        self.mention = f"<@&{role_id}>"
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+
+    async def edit(self, **_):
+        pass
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f"Guild {guild_id}"
+        self.channels = [FakeChannel(channel_id(guild_id))]
+        self.roles = [FakeRole(role_id(guild_id))]
+
+
+class FakeMessage:
+    def __init__(self):
+        self.components: List[dict] = []
+
+    async def edit(self, components=None, **_):
+        self.components = components or []
+
+
+class FakeContext:
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+        self.message: Optional[FakeMessage] = None
+
+    async def send(self, *_, **__) -> FakeMessage:
+        self.message = FakeMessage()
+        return self.message
+
+
+class FakeComponentContext:
+    def __init__(self, custom_id: str, message: FakeMessage, guild: FakeGuild):
+        self.custom_id = custom_id
+        self.origin_message_id = None
+        self.message = message
+        self.guild = guild
+
+    async def edit_origin(self, **kwargs):
+        await self.message.edit(**kwargs)
+
+    async def defer(self, **_):
+        pass
+
+
+class FakeBot:
+    """
+    The cog only uses the bot when it's ready, which never happens here.
+    """
+
+
+class StubIMDbMovie:
+    def __init__(self, imdb_id: int):
+        self.data = {
+            "original title": f"Movie {imdb_id}",
+            "year": 1950 + imdb_id % 70,
+            "rating": round(5 + imdb_id % 50 / 10, 1),
+            "cover url": f"https://example.com/{imdb_id}.jpg",
+            "original air date": "01 Jan 2000",
+        }
+
+
+class StubIMDb:
+    """
+    Stands in for ``imdb.IMDb``, waiting ``latency`` seconds per lookup.
+    """
+
+    latency = 0.0
+
+    def get_movie(self, imdb_id: int) -> StubIMDbMovie:
+        time.sleep(self.latency)
+        return StubIMDbMovie(imdb_id)
+
+
+def channel_id(guild_id: int) -> int:
+    return guild_id * 10 + 1
+
+
+def role_id(guild_id: int) -> int:
+    return guild_id * 10 + 2
+
+
+def movie_counts(guilds: int, max_movies: int, seed: int) -> List[int]:
+    """
+    Movies per guild, following a Pareto distribution. The first guild
+    always has ``max_movies``.
+    """
+    rng = random.Random(seed)
+    counts = [
+        min(max_movies, int(rng.paretovariate(1.1) * 10))
+        for _ in range(guilds)
+    ]
+    counts[0] = max_movies
+    return counts
+
+
+def seed_database(engine: Engine, counts: List[int], seed: int):
+    rng = random.Random(seed)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(ConfigVariable),
+            [
+                {"guild_id": guild_id, "key": key, "value": str(value)}
+                for guild_id in range(1, len(counts) + 1)
+                for key, value in (
+                    ("cinema_channel_id", channel_id(guild_id)),
+                    ("cinema_role_id", role_id(guild_id)),
+                )
+            ],
+        )
+        batch = []
+        for guild_id, count in enumerate(counts, start=1):
+            for imdb_id in range(1, count + 1):
+                watched = rng.random() < 0.2
+                batch.append(
+                    {
+                        "imdb_id": imdb_id,
+                        "title": f"Movie {imdb_id}",
+                        "year": 1950 + imdb_id % 70,
+                        "rating": round(rng.uniform(1, 10), 1),
+                        "guild_id": guild_id,
+                        "watched_date": (
+                            datetime.date(2021, 1, 1) if watched else None
+                        ),
+                    }
+                )
+                if len(batch) >= SEED_BATCH_SIZE:
+                    connection.execute(insert(Movie), batch)
+                    batch.clear()
+        if batch:
+            connection.execute(insert(Movie), batch)
+
+
+def seeded_database(args) -> Path:
+    """
+    The path of a database seeded for ``args``, seeding it if needed.
+    """
+    DATA_DIR.mkdir(exist_ok=True)
+    path = DATA_DIR / (
+        f"movies-{args.guilds}-{args.max_movies}-{args.seed}.sqlite3"
+    )
+    if not path.exists():
+        print(f"Seeding {path.name}...")
+        started = time.perf_counter()
+        temporary = path.with_suffix(".tmp")
+        temporary.unlink(missing_ok=True)
+        engine = create_engine(f"sqlite:///{temporary}", future=True)
+        seed_database(
+            engine,
+            movie_counts(args.guilds, args.max_movies, args.seed),
+            args.seed,
+        )
+        engine.dispose()
+        temporary.rename(path)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+class QueryCounter:
+    def __init__(self, engine: Engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.increment)
+
+    def increment(self, *_):
+        if measuring.get():
+            self.count += 1
+
+
+class Benchmark:
+    def __init__(self, cog: Movies, counts: List[int], seed: int):
+        self.cog = cog
+        self.counts = counts
+        self.rng = random.Random(seed)
+        self.next_imdb_id = max(counts) + 1
+
+    def random_guild(self, min_movies: int = 1) -> FakeGuild:
+        while True:
+            guild_id = self.rng.randrange(len(self.counts)) + 1
+            if self.counts[guild_id - 1] >= min_movies:
+                return FakeGuild(guild_id)
+
+    def new_imdb_id(self) -> int:
+        self.next_imdb_id += 1
+        return self.next_imdb_id
+
+    @staticmethod
+    async def timed(awaitable: Awaitable) -> float:
+        measuring.set(True)
+        started = time.perf_counter()
+        try:
+            await awaitable
+            return time.perf_counter() - started
+        finally:
+            measuring.set(False)
+
+    async def call(
+        self, command, guild: FakeGuild, *args, clicks: List[str] = ()
+    ):
+        """
+        Runs ``command``, then clicks the buttons with the ``clicks`` labels
+        on the message it sent, if they are there and enabled.
+        """
+        ctx = FakeContext(guild)
+        await command.func(self.cog, ctx, *args)
+        for label in clicks:
+            button = next(
+                (
+                    button
+                    for row in ctx.message.components
+                    for button in row["components"]
+                    if button["label"] == label and not button.get("disabled")
+                ),
+                None,
+            )
+            if button is not None:
+                await self.cog.show_list_page.func(
+                    self.cog,
+                    FakeComponentContext(
+                        button["custom_id"], ctx.message, guild
+                    ),
+                )
+
+    def timed_call(self, *args, **kwargs) -> Awaitable[float]:
+        return self.timed(self.call(*args, **kwargs))
+
+    def scenarios(self) -> Dict[str, Callable[[], Awaitable[float]]]:
+        """
+        What each command does once, returning how long it took.
+        """
+        cog = self.cog
+
+        async def watch():
+            guild = self.random_guild()
+            elapsed = await self.timed_call(cog.watch_movie, guild)
+            await self.call(cog.stop_watching, guild)
+            return elapsed
+
+        async def stop():
+            guild = self.random_guild()
+            await self.call(cog.watch_movie, guild)
+            return await self.timed_call(cog.stop_watching, guild)
+
+        async def get_config_variables(cold: bool):
+            guild_id = self.random_guild().id
+            if cold:
+                cog.config_cache.evict(guild_id)
+            else:
+                await cog.get_config_variables(guild_id)
+            return await self.timed(cog.get_config_variables(guild_id))
+
+        return {
+            "list": lambda: self.timed_call(
+                cog.list_movies, self.random_guild()
+            ),
+            "list_pages": lambda: self.timed_call(
+                cog.list_movies,
+                self.random_guild(min_movies=100),
+                clicks=["Next"] * PAGES_CLICKED + ["Previous"],
+            ),
+            # The biggest guild, listing its movies again and again.
+            "list_popular": lambda: self.timed_call(
+                cog.list_movies, FakeGuild(1)
+            ),
+            "list_non_watched": lambda: self.timed_call(
+                cog.list_movies, self.random_guild(), "non-watched"
+            ),
+            "add": lambda: self.timed_call(
+                cog.add_movie, self.random_guild(), self.new_imdb_id()
+            ),
+            "add_existing": lambda: self.timed_call(
+                cog.add_movie, self.random_guild(), 1
+            ),
+            "add_many": lambda: self.timed_call(
+                cog.add_many_movies,
+                self.random_guild(),
+                " ".join(str(self.new_imdb_id()) for _ in range(10)),
+            ),
+            "watch": watch,
+            "stop": stop,
+            "watch_rating": lambda: self.timed_call(
+                cog.watch_movie, self.random_guild(), None, "rating"
+            ),
+            "config_cold": lambda: get_config_variables(cold=True),
+            "config_warm": lambda: get_config_variables(cold=False),
+        }
+
+
+async def measure(
+    scenario: Callable[[], Awaitable[float]], commands: int, concurrency: int
+) -> List[float]:
+    """
+    Runs ``commands`` commands, ``concurrency`` at a time, and returns how
+    long each one took.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await scenario()
+
+    return await asyncio.gather(*(limited() for _ in range(commands)))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(args, database: Path) -> Dict[str, dict]:
+    engine = create_database_engine(f"sqlite:///{database}")
+    queries = QueryCounter(engine)
+    repository = MovieRepository(engine, max_workers=args.workers)
+    StubIMDb.latency = args.imdb_latency / 1000
+    cog = Movies(FakeBot(), repository)
+    cog.metadata = MovieMetadataCache(repository, imdb_factory=StubIMDb)
+    benchmark = Benchmark(
+        cog,
+        movie_counts(args.guilds, args.max_movies, args.seed),
+        args.seed,
+    )
+    # Whatever a guild is watching from a previous run is forgotten.
+    cog.currently_watching = dict.fromkeys(range(1, args.guilds + 1))
+
+    results = {}
+    for name, scenario in benchmark.scenarios().items():
+        if args.only and name not in args.only:
+            continue
+        await measure(scenario, args.warmup, args.concurrency)
+        queries.count = 0
+        latencies = await measure(scenario, args.commands, args.concurrency)
+        queries_per_command = queries.count / args.commands
+
+        # Tracing every allocation slows everything down, so memory is
+        # measured in a separate, shorter pass.
+        tracemalloc.start()
+        await measure(scenario, args.memory_commands, args.concurrency)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "mean_ms": statistics.mean(latencies) * 1000,
+            "queries": queries_per_command,
+            "peak_kb": peak / 1024,
+        }
+    cog.metadata.executor.shutdown()
+    repository.executor.shutdown()
+    engine.dispose()
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=BENCHMARKS_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def latest_results(benchmark: str) -> Optional[Path]:
+    files = sorted(RESULTS_DIR.glob(f"{benchmark}-*.json"))
+    return files[-1] if files else None
+
+
+def load_previous(benchmark: str, args) -> Optional[Dict[str, dict]]:
+    """
+    The results to compare this run with: ``--compare`` or the latest
+    saved ones.
+    """
+    compare = args.compare or latest_results(benchmark)
+    if compare is None:
+        return None
+    with open(compare) as previous_file:
+        previous_run = json.load(previous_file)
+    print(f"Compared with {compare.name} ({previous_run['revision']})")
+    if any(
+        previous_run["arguments"].get(key) != value
+        for key, value in vars(args).items()
+        if key not in ("compare", "no_save", "only")
+    ):
+        print("The previous run used different arguments")
+    return previous_run["results"]
+
+
+def print_results(
+    results: Dict[str, dict],
+    previous: Optional[Dict[str, dict]],
+    columns: List[str],
+):
+    print(f"{'command':>18}" + "".join(f"{c:>20}" for c in columns))
+    for name, values in results.items():
+        old = (previous or {}).get(name, {})
+        cells = []
+        for column in columns:
+            cell = f"{values[column]:.2f}"
+            if old.get(column):
+                change = (values[column] - old[column]) / old[column] * 100
+                cell += f" ({change:+.0f}%)"
+            cells.append(f"{cell:>20}")
+        print(f"{name:>18}" + "".join(cells))
+
+
+def save_results(benchmark: str, args, results: dict):
+    RESULTS_DIR.mkdir(exist_ok=True)
+    revision = git_revision()
+    path = RESULTS_DIR / (
+        f"{benchmark}-{datetime.datetime.now():%Y%m%d-%H%M%S}-{revision}.json"
+    )
+    with open(path, "w") as results_file:
+        json.dump(
+            {
+                "revision": revision,
+                "created_at": time.time(),
+                "arguments": {
+                    key: value
+                    for key, value in vars(args).items()
+                    if key != "compare"
+                },
+                "results": results,
+            },
+            results_file,
+            indent=2,
+        )
+    print(f"Saved {path.relative_to(BENCHMARKS_DIR.parent)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--guilds", type=int, default=10000)
+    parser.add_argument(
+        "--max-movies",
+        type=int,
+        default=5000,
+        help="Movies of the biggest guild",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--commands", type=int, default=200, help="Measured runs per command"
+    )
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--memory-commands", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--imdb-latency", type=float, default=0, help="Simulated ms per fetch"
+    )
+    parser.add_argument(
+        "--only", nargs="+", help="Commands to run, all of them by default"
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        help="Results to compare with, the latest saved ones by default",
+    )
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    seeded = seeded_database(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / seeded.name
+        shutil.copyfile(seeded, database)
+        results = asyncio.run(run(args, database))
+
+    previous = load_previous("movies", args)
+    print_results(
+        results, previous, ["p50_ms", "p99_ms", "queries", "peak_kb"]
+    )
+    if not args.no_save:
+        save_results("movies", args, results)
+
+
+if __name__ == "__main__":
+    main()
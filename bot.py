@@ -1,67 +1,128 @@
 import os
+from typing import Optional, Sequence
 
 import discord
 from discord import Guild
-from discord_slash import SlashCommand
 from discord.ext import commands
 from discord.ext.commands import errors
 from dotenv import load_dotenv
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from sqlalchemy.future import Engine
 
+import migrations
 from cogs.help import Help
-from cogs.movies.models import Base, ConfigVariable
+from cogs.minecraftserver import MinecraftCog
 from cogs.movies import Movies
-from utils.constants import GUILD_CONFIG_VARIABLES
+from cogs.movies.repository import MovieRepository
+from cogs.status import Status
+from utils.database import (
+    create_database_engine,
+    current_command,
+    get_pool_size,
+)
 from utils.functions import get_env_variable
+from utils.instrumentation import Instrumentation
+from utils.slash import SlashCommand
 
 load_dotenv()
 
-memory = "4096M"
 
-bot = commands.Bot(command_prefix="$")
-slash = SlashCommand(bot, sync_commands=True, sync_on_cog_reload=True)
-
-I_AM_HEROKU = os.getenv("I_AM_HEROKU") == "true"
-if I_AM_HEROKU:
-    DATABASE_URL: str = get_env_variable("DATABASE_URL").replace(
-        "postgres", "postgresql"
+def create_bot(
+    engine: Engine,
+    shard_ids: Optional[Sequence[int]] = None,
+    shard_count: Optional[int] = None,
+    sync_commands: bool = True,
+    host_minecraft: Optional[bool] = None,
+) -> commands.AutoShardedBot:
+    """
+    Builds the bot with every cog loaded.
+
+    Without ``shard_ids`` the bot connects every shard Discord recommends.
+    When the shards are split between processes only one of them should
+    ``sync_commands``, the slash commands are the same for all of them.
+
+    The Minecraft servers are hosted when ``JAVA_EXECUTABLE`` is set, unless
+    ``host_minecraft`` says otherwise.
+
+    ``COMMAND_STATS=true`` measures every command for ``$stats``, and
+    ``COMMAND_STATS_INTERVAL`` (seconds) also prints the stats that often.
+    """
+    bot = commands.AutoShardedBot(
+        command_prefix="$",
+        shard_ids=list(shard_ids) if shard_ids is not None else None,
+        shard_count=shard_count,
+    )
+    instrumentation = Instrumentation(
+        enabled=os.getenv("COMMAND_STATS") == "true",
+        export_interval=float(os.getenv("COMMAND_STATS_INTERVAL", "0")),
+    )
+    instrumentation.watch_http(bot.http)
+    SlashCommand(
+        bot,
+        instrumentation,
+        sync_commands=sync_commands,
+        sync_on_cog_reload=sync_commands,
     )
-else:
-    DATABASE_URL: str = "sqlite:///db.sqlite3"
-engine = create_engine(DATABASE_URL, echo=True, future=True)
-Base.metadata.create_all(engine)
-
-bot.add_cog(Movies(bot, engine))
-bot.add_cog(Help(bot))
-
-
-@bot.event
-async def on_ready():
-    await bot.change_presence(status=discord.Status.online)
-    print(f"Cheers love, the {bot.user} is here!")
-
-
-@bot.event
-async def on_guild_join(guild: Guild):
-    print(f"New Guild joined: {guild.name} - Creating config vars")
-    with Session(engine) as session:
-        for var in GUILD_CONFIG_VARIABLES:
-            session.add(ConfigVariable(guild_id=guild.id, key=var, value=None))
-        session.flush()
-        session.commit()
-
-
-@bot.event
-async def on_command_error(ctx: commands.Context, error: errors.CommandError):
-    if isinstance(error, errors.CommandNotFound):
-        await ctx.send(
-            "Looks like you're a little lost. "
-            "Try $help to see all the available commands."
-        )
-    else:
-        raise error
-
 
-bot.run(get_env_variable("TOKEN"))
+    # One thread per pooled connection, more would only wait for one.
+    movie_repository = MovieRepository(engine, max_workers=get_pool_size())
+
+    movies = Movies(bot, movie_repository)
+    bot.add_cog(movies)
+    instrumentation.add_cache("Guild configs", movies.config_cache.stats)
+    instrumentation.add_cache("Watchlist pages", movies.page_cache.stats)
+    instrumentation.add_cache("IMDb titles", movies.metadata.titles.stats)
+    bot.add_cog(Help(bot))
+    bot.add_cog(Status(bot, instrumentation))
+    if host_minecraft is None:
+        host_minecraft = bool(os.getenv("JAVA_EXECUTABLE"))
+    if host_minecraft:
+        bot.add_cog(MinecraftCog(bot))
+
+    @bot.before_invoke
+    async def start_command(ctx: commands.Context):
+        name = f"{ctx.prefix}{ctx.command.qualified_name}"
+        current_command.set(name)
+        instrumentation.start(name)
+
+    @bot.after_invoke
+    async def finish_command(ctx: commands.Context):
+        if (
+            ctx.invoked_subcommand not in (None, ctx.command)
+            and not ctx.command_failed
+        ):
+            # The subcommand finishes the measurement.
+            return
+        if ctx.command_failed:
+            instrumentation.fail()
+        instrumentation.finish()
+
+    @bot.event
+    async def on_ready():
+        await bot.change_presence(status=discord.Status.online)
+        print(f"Cheers love, the {bot.user} is here!")
+
+    @bot.event
+    async def on_guild_join(guild: Guild):
+        print(f"New Guild joined: {guild.name} - Creating config vars")
+        await movie_repository.create_config_variables(guild.id)
+
+    @bot.event
+    async def on_command_error(
+        ctx: commands.Context, error: errors.CommandError
+    ):
+        if isinstance(error, errors.CommandNotFound):
+            await ctx.send(
+                "Looks like you're a little lost. "
+                "Try $help to see all the available commands."
+            )
+        else:
+            raise error
+
+    return bot
+
+
+if __name__ == "__main__":
+    engine = create_database_engine()
+    migrations.upgrade(engine)
+    create_bot(engine).run(get_env_variable("TOKEN"))
@@ -0,0 +1,743 @@
+import argparse
+import asyncio
+import datetime
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+from discord.ext.commands import errors
+
+from cogs.minecraftserver.backups import (
+    BackupInProgress,
+    BackupStore,
+    SnapshotNotFound,
+    backup_server,
+)
+from cogs.minecraftserver.logs import LogStream, pack_messages, parse_duration
+from cogs.minecraftserver.pool import (
+    InsufficientMemory,
+    JVM_OVERHEAD_MB,
+    ReservationCancelled,
+    ServerPool,
+    parse_memory,
+)
+from cogs.minecraftserver.presence import IdleMonitor
+from cogs.minecraftserver.profiles import (
+    InvalidProfile,
+    launch_stats,
+    load_profiles,
+    select_profile,
+)
+from cogs.minecraftserver.server import (
+    MinecraftServer,
+    ServerAlreadyRunning,
+    ServerNotRunning,
+    ServerState,
+)
+from cogs.minecraftserver.telemetry import (
+    TelemetrySampler,
+    sparkline,
+    start_metrics_server,
+)
+from cogs.minecraftserver.versions import (
+    VersionIndex,
+    VersionInfo,
+    format_age,
+    format_size,
+)
+from utils.constants import (
+    BASE_DIR,
+    DISCORD_MAX_BODY_LENGTH,
+    MINECRAFT_SERVER_MEMORY,
+    SERVER_HOST_NAME,
+)
+
+# Big modpacks take minutes to generate the spawn on the first run.
+STARTUP_TIMEOUT = 600
+RESTART_EMOJI = "▶️"
+RESTART_MESSAGES_KEPT = 20
+
+
+class LogArgumentParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise errors.BadArgument(message)
+
+
+def duration(value: str) -> datetime.timedelta:
+    try:
+        return parse_duration(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+log_arguments = LogArgumentParser(prog="log_server", add_help=False)
+log_arguments.add_argument("--lines", type=int, default=50)
+log_arguments.add_argument("--since", type=duration)
+log_arguments.add_argument("--grep")
+
+
+class MinecraftCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.pool = ServerPool(
+            VersionIndex(BASE_DIR / "versions"),
+            server_memory=os.getenv(
+                "MINECRAFT_SERVER_MEMORY", MINECRAFT_SERVER_MEMORY
+            ),
+        )
+        self.log_streams: Dict[str, LogStream] = {}
+        self.sampler = TelemetrySampler(
+            self.pool,
+            interval=float(os.getenv("MINECRAFT_SAMPLE_INTERVAL", "15")),
+        )
+        self.metrics_runner = None
+        self.backup_store = BackupStore(
+            Path(os.getenv("MINECRAFT_BACKUP_DIR", BASE_DIR / "backups")),
+            workers=int(os.getenv("MINECRAFT_BACKUP_WORKERS", "0")) or None,
+        )
+        # Where each server was started from, for the idle notices.
+        self.channels: Dict[str, discord.abc.Messageable] = {}
+        self.restart_messages: "OrderedDict[int, str]" = OrderedDict()
+        idle_minutes = float(os.getenv("MINECRAFT_IDLE_MINUTES", "15"))
+        self.idle_monitor = (
+            IdleMonitor(
+                self.pool,
+                idle_after=idle_minutes * 60,
+                warn_before=float(
+                    os.getenv("MINECRAFT_IDLE_WARNING_MINUTES", "2")
+                )
+                * 60,
+                on_warning=self.warn_idle,
+                on_stopped=self.report_idle_stop,
+            )
+            if idle_minutes > 0
+            else None
+        )
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.pool.index.start()
+        self.sampler.start()
+        metrics_port = os.getenv("METRICS_PORT")
+        if metrics_port and self.metrics_runner is None:
+            self.metrics_runner = await start_metrics_server(
+                self.sampler,
+                os.getenv("METRICS_HOST", "127.0.0.1"),
+                int(metrics_port),
+            )
+
+    def cog_unload(self):
+        self.pool.index.stop()
+        self.sampler.stop()
+        self.backup_store.close()
+        if self.idle_monitor is not None:
+            self.idle_monitor.stop()
+        if self.metrics_runner is not None:
+            asyncio.create_task(self.metrics_runner.cleanup())
+        for server in list(self.pool.servers.values()):
+            asyncio.create_task(self.stop_following(server))
+        asyncio.create_task(self.pool.stop_all())
+
+    async def cog_command_error(
+        self, ctx: commands.Context, error: errors.CommandError
+    ):
+        error = getattr(error, "original", error)
+        if isinstance(error, errors.BadArgument):
+            await ctx.send(f"{error}. Try {ctx.prefix}help mine")
+        elif isinstance(error, ServerNotRunning):
+            await ctx.send("There's no server running...")
+        elif isinstance(error, ServerAlreadyRunning):
+            await ctx.send("That server is already running")
+        elif isinstance(error, InvalidProfile):
+            await ctx.send(str(error))
+        elif isinstance(error, BackupInProgress):
+            await ctx.send(str(error))
+        elif isinstance(error, SnapshotNotFound):
+            await ctx.send(f"There's no snapshot called {error}")
+        elif isinstance(error, InsufficientMemory):
+            await ctx.send(f"Not enough memory: {error}")
+        elif isinstance(error, (ConnectionError, asyncio.TimeoutError)):
+            await ctx.send("The server didn't answer the command")
+
+    def get_version(self, server_id: int) -> VersionInfo:
+        version = self.pool.index.get(server_id)
+        if version is None:
+            raise errors.BadArgument(f"There's no server with ID {server_id}")
+        return version
+
+    def get_server(self, server_id: int) -> MinecraftServer:
+        return self.pool.get(self.get_version(server_id))
+
+    def resolve_server(self, server_id: Optional[int]) -> MinecraftServer:
+        """
+        The server with ``server_id`` or, without one, the only running
+        server. When nothing is running the last started server is used,
+        so its log can still be read.
+        """
+        if server_id is not None:
+            return self.get_server(server_id)
+        running = self.pool.running()
+        if len(running) > 1:
+            raise errors.BadArgument(
+                "More than one server is running, specify its ID"
+            )
+        if running:
+            return running[0]
+        if self.pool.last_started is None:
+            raise ServerNotRunning
+        return self.pool.last_started
+
+    def split_server_id(
+        self, args: Tuple[str, ...]
+    ) -> Tuple[MinecraftServer, List[str]]:
+        # Minecraft commands never start with a number, so a leading number
+        # is always a server ID.
+        if args and args[0].isdigit():
+            return self.resolve_server(int(args[0])), list(args[1:])
+        return self.resolve_server(None), list(args)
+
+    async def update_presence(self):
+        running = self.pool.running()
+        if running:
+            names = ", ".join(server.name for server in running)
+            await self.bot.change_presence(
+                activity=discord.Game(name=f"Hosting {names}")
+            )
+        else:
+            await self.bot.change_presence(status=discord.Status.idle)
+
+    async def stop_following(self, server: MinecraftServer) -> Optional[dict]:
+        log_stream = self.log_streams.pop(server.name, None)
+        if log_stream is None:
+            return None
+        server.log_listeners.remove(log_stream.push)
+        await log_stream.close()
+        return log_stream.stats()
+
+    def describe(self, version: VersionInfo) -> str:
+        details = [
+            f"`{version.id}` **{version.name}**",
+            version.minecraft_version or "unknown version",
+            f"world {format_size(version.world_size)}",
+        ]
+        server = self.pool.servers.get(version.name)
+        if server is not None and self.pool.is_queued(server):
+            details.append("queued, waiting for memory")
+        elif server is not None and server.state is not ServerState.STOPPED:
+            details.append(
+                f"{server.state.value} on port {server.port}, {server.memory}"
+            )
+        else:
+            details.append(format_age(version.last_played))
+        return " · ".join(details)
+
+    @commands.group(name="mine", pass_context=True)
+    async def minecraft_group(self, ctx: commands.Context):
+        """
+        Lists all the available servers.
+        """
+        if ctx.invoked_subcommand is None:
+            index = self.pool.index
+            if index.folder_mtime is None:
+                # Nothing was indexed yet, not even in a previous run.
+                await index.refresh()
+            pages = [[]]
+            size = 0
+            for version in index.list():
+                line = self.describe(version)
+                if size + len(line) + 1 > DISCORD_MAX_BODY_LENGTH:
+                    pages.append([])
+                    size = 0
+                pages[-1].append(line)
+                size += len(line) + 1
+            scheduler = self.pool.scheduler
+            for number, lines in enumerate(pages):
+                embed = discord.Embed(
+                    title=(
+                        "Minecraft versions"
+                        if number == 0
+                        else discord.Embed.Empty
+                    ),
+                    description="\n".join(lines)
+                    or "There are no servers to run",
+                )
+                if number == len(pages) - 1:
+                    embed.set_footer(
+                        text=f"Memory: {scheduler.reserved}M of "
+                        f"{scheduler.budget}M in use, "
+                        f"{len(scheduler.waiters)} queued"
+                    )
+                await ctx.send(embed=embed)
+
+    @minecraft_group.command(pass_context=True)
+    async def run_server(
+        self, ctx: commands.Context, server_id: int, memory: str = None
+    ):
+        """
+        Runs the server with the specified ID, next to any other running one.
+        A list of the available server can be retrieved with the "list" command.
+
+        The heap size can be given like 2G or 3072M, it defaults to 4096M.
+        If the servers that are already running leave no memory for it, the
+        server is queued and starts once enough memory is released.
+        The reply comes once the server is ready for players to join.
+        """
+        version = self.get_version(server_id)
+        try:
+            heap = parse_memory(memory) if memory else None
+        except ValueError as error:
+            raise errors.BadArgument(str(error))
+        await self.launch(ctx.channel, version, heap)
+
+    async def launch(
+        self,
+        channel: discord.abc.Messageable,
+        version: VersionInfo,
+        heap: Optional[int] = None,
+    ):
+        """
+        Starts ``version`` and tells ``channel`` how it went, once the
+        server is ready to be joined.
+        """
+        self.backup_store.check_idle(version.name)
+        server = self.pool.get(version)
+        if self.idle_monitor is not None:
+            self.idle_monitor.watch(server)
+        self.channels[server.name] = channel
+        amount = (heap or self.pool.server_memory) + JVM_OVERHEAD_MB
+        scheduler = self.pool.scheduler
+        if amount <= scheduler.budget and not scheduler.fits(amount):
+            await channel.send(
+                f"Not enough memory for {server.name} right now, "
+                f"it will start when {amount}M are free"
+            )
+        try:
+            await self.pool.start(version, heap)
+        except ReservationCancelled:
+            await channel.send(f"{server.name} was removed from the queue")
+            return
+        await channel.send(f"Starting {server.name}...")
+        log_hint = f"check {self.bot.command_prefix}mine log_server"
+        try:
+            ready = await server.wait_ready(STARTUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            await channel.send(
+                f"{server.name} is taking too long to start, {log_hint}"
+            )
+            return
+        if not ready:
+            await channel.send(
+                f"{server.name} stopped while starting, {log_hint}"
+            )
+            return
+        await self.update_presence()
+        await channel.send(
+            embed=discord.Embed(
+                title=f"{server.name} is yours",
+                description=f"Your server is currently running and can be accessed "
+                f"**{SERVER_HOST_NAME}:{server.port}**",
+            ).set_footer(text=f"Ready in {server.ready_seconds:.1f}s")
+        )
+
+    def last_used_version(self) -> Optional[VersionInfo]:
+        index = self.pool.index
+        if self.pool.last_started is not None:
+            return index.versions.get(self.pool.last_started.name)
+        # Nothing ran since the bot started, the last saved world wins.
+        played = [v for v in index.list() if v.last_played is not None]
+        return max(played, key=lambda v: v.last_played, default=None)
+
+    async def warn_idle(self, server: MinecraftServer, remaining: float):
+        minutes = max(round(remaining / 60), 1)
+        minutes = f"{minutes} minute{'s' if minutes > 1 else ''}"
+        try:
+            await server.execute_command(
+                f"say Nobody is playing, stopping the server in {minutes}"
+            )
+        except (ConnectionError, asyncio.TimeoutError, ServerNotRunning):
+            pass
+        channel = self.channels.get(server.name)
+        if channel is not None:
+            try:
+                await channel.send(
+                    f"Nobody is playing on {server.name}, it will be "
+                    f"stopped in {minutes}"
+                )
+            except discord.HTTPException:
+                pass
+
+    async def report_idle_stop(self, server: MinecraftServer, idle: float):
+        await self.update_presence()
+        channel = self.channels.get(server.name)
+        if channel is None:
+            return
+        try:
+            message = await channel.send(
+                embed=discord.Embed(
+                    title=f"{server.name} was stopped",
+                    description=f"Nobody played on it for "
+                    f"{round(idle / 60)} minutes. React with "
+                    f"{RESTART_EMOJI} or use "
+                    f"{self.bot.command_prefix}mine start to start it again.",
+                )
+            )
+            await message.add_reaction(RESTART_EMOJI)
+        except discord.HTTPException:
+            return
+        self.restart_messages[message.id] = server.name
+        while len(self.restart_messages) > RESTART_MESSAGES_KEPT:
+            self.restart_messages.popitem(last=False)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(
+        self, payload: discord.RawReactionActionEvent
+    ):
+        if (
+            payload.message_id not in self.restart_messages
+            or str(payload.emoji) != RESTART_EMOJI
+            or payload.user_id == self.bot.user.id
+        ):
+            return
+        name = self.restart_messages.pop(payload.message_id)
+        version = self.pool.index.versions.get(name)
+        channel = self.bot.get_channel(payload.channel_id)
+        if version is None or channel is None:
+            return
+        try:
+            await self.launch(channel, version, self.last_heap(version))
+        except (
+            ServerAlreadyRunning,
+            InsufficientMemory,
+            InvalidProfile,
+            BackupInProgress,
+        ) as error:
+            await channel.send(
+                f"Can't start {name}: {str(error) or 'it is already running'}"
+            )
+
+    @minecraft_group.command(pass_context=True)
+    async def start(self, ctx: commands.Context):
+        """
+        Starts the last used server again, with the same heap size.
+        """
+        version = self.last_used_version()
+        if version is None:
+            await ctx.send(
+                f"No server was played yet, try {ctx.prefix}mine run_server <id>"
+            )
+            return
+        await self.launch(ctx.channel, version, self.last_heap(version))
+
+    def last_heap(self, version: VersionInfo) -> Optional[int]:
+        server = self.pool.servers.get(version.name)
+        if server is None or server.memory is None:
+            return None
+        return parse_memory(server.memory)
+
+    @run_server.error
+    async def on_run_server_error(
+        self, ctx: commands.Context, error: errors.CommandError
+    ):
+        if isinstance(error, errors.MissingRequiredArgument):
+            await ctx.send("You need to specify a server ID")
+
+    @minecraft_group.command(name="cmd", pass_context=True)
+    async def execute_command(self, ctx: commands.Context, *args):
+        """
+        Sends the input to the minecraft server as a admin command.
+
+        Runs through RCON and replies with the command output when the
+        server has enable-rcon=true, otherwise writes the args to the STDIN
+        of the running Java process. When more than one server is running
+        the first argument is the server ID.
+        """
+        server, args = self.split_server_id(args)
+        if server.is_running:
+            command = " ".join(args)
+            await ctx.send(f"Executing [{command}] on {server.name}")
+            output = await server.execute_command(command)
+            for message in pack_messages(
+                output.splitlines() if output else []
+            ):
+                await ctx.send(message)
+        else:
+            await ctx.send("There's no server running...")
+
+    @minecraft_group.command(pass_context=True)
+    async def stop_server(self, ctx: commands.Context, server_id: int = None):
+        """
+        Stops the server with the specified ID, or the only one running.
+        Queued servers are removed from the queue.
+        """
+        server = self.resolve_server(server_id)
+        if self.pool.is_queued(server):
+            await self.pool.stop(server)
+        elif server.is_running:
+            await ctx.send(f"Shutting down {server.name}...")
+            await self.pool.stop(server)
+            await self.update_presence()
+            await ctx.send(f"{server.name} was stopped")
+        else:
+            await ctx.send("There's no server running...")
+
+    @minecraft_group.command(pass_context=True)
+    async def log_server(self, ctx: commands.Context, *args):
+        """
+        Returns the latest lines printed by the server.
+
+        The first argument is the server ID when more than one is running.
+        --lines N: how many lines to return, 50 by default.
+        --since 10m: only the lines printed in the last 10m (s, m, h or d).
+        --grep text: only the lines that contain the text, in any case.
+        """
+        try:
+            server, args = self.split_server_id(args)
+        except ServerNotRunning:
+            await ctx.send(
+                embed=discord.Embed(
+                    title="No server running",
+                    description=f"You can start one by running {ctx.prefix}run_server <server_id>",
+                )
+            )
+            return
+        options = log_arguments.parse_args(args)
+        since = (
+            datetime.datetime.now() - options.since if options.since else None
+        )
+
+        # A plain search, a regex from anyone could stall the event loop.
+        lines = server.log.tail(max(options.lines, 0), since, options.grep)
+        if not lines:
+            await ctx.send("Nothing to log yet")
+            return
+        for message in pack_messages(map(str, lines)):
+            await ctx.send(message)
+
+    @minecraft_group.command(pass_context=True)
+    async def follow(
+        self,
+        ctx: commands.Context,
+        server_id: Optional[int] = None,
+        channel: discord.TextChannel = None,
+    ):
+        """
+        Mirrors a server console to a channel, the current one by default.
+
+        Lines are sent in batches every few seconds, bursts that would go
+        over the rate limits are dropped. Each server has its own stream.
+        """
+        server = self.resolve_server(server_id)
+        channel = channel or ctx.channel
+        await self.stop_following(server)
+        log_stream = self.log_streams[server.name] = LogStream(channel.send)
+        server.log_listeners.append(log_stream.push)
+        log_stream.start()
+        await ctx.send(
+            f"Following the {server.name} console in {channel.mention}"
+        )
+
+    @minecraft_group.command(pass_context=True)
+    async def unfollow(self, ctx: commands.Context, server_id: int = None):
+        """
+        Stops mirroring a server console.
+        """
+        if server_id is None and len(self.log_streams) == 1:
+            server = self.pool.servers[next(iter(self.log_streams))]
+        else:
+            server = self.resolve_server(server_id)
+        stats = await self.stop_following(server)
+        if stats is None:
+            await ctx.send(f"The {server.name} console is not being followed")
+            return
+        await ctx.send(
+            embed=discord.Embed(
+                title=f"Stopped following the {server.name} console",
+                description=f"{stats['lines']} lines sent in "
+                f"{stats['messages']} messages, {stats['dropped']} dropped.\n"
+                f"Flush latency: {stats['flush_p50']:.1f}s median, "
+                f"{stats['flush_max']:.1f}s max.",
+            )
+        )
+
+    @minecraft_group.command(pass_context=True)
+    async def status(self, ctx: commands.Context, server_id: int = None):
+        """
+        Shows the health of a server: TPS, players, memory and CPU.
+
+        The charts cover the latest samples, taken at the interval the bot
+        is configured with.
+        TPS and players need RCON to be enabled.
+        """
+        server = self.resolve_server(server_id)
+        sample = self.sampler.latest(server)
+        if not server.is_running or sample is None:
+            await ctx.send(f"There are no samples of {server.name} yet")
+            return
+        samples = list(self.sampler.samples[server.name])
+
+        def value(amount, template):
+            return "n/a" if amount is None else template.format(amount)
+
+        embed = discord.Embed(
+            title=f"{server.name} status",
+            description=f"{server.state.value} on port {server.port}",
+        )
+        embed.add_field(
+            name="TPS",
+            value=f"{value(sample.tps, '{:.1f}')} "
+            f"({value(sample.mspt, '{:.1f}')} ms per tick)\n"
+            f"{sparkline([s.tps for s in samples])}",
+            inline=False,
+        )
+        embed.add_field(
+            name="Players",
+            value=f"{value(sample.players, '{}')} of "
+            f"{value(sample.max_players, '{}')}\n"
+            f"{sparkline([s.players for s in samples])}",
+            inline=False,
+        )
+        embed.add_field(
+            name="Heap",
+            value=(
+                f"{format_size(sample.heap_used)} of "
+                f"{format_size(sample.heap_max)}"
+                if sample.heap_used is not None
+                else "n/a"
+            ),
+        )
+        embed.add_field(
+            name="Memory",
+            value=(
+                format_size(sample.rss) if sample.rss is not None else "n/a"
+            ),
+        )
+        embed.add_field(name="CPU", value=value(sample.cpu, "{:.0f}%"))
+        embed.set_footer(
+            text=f"{len(samples)} samples, last one "
+            f"{datetime.datetime.fromtimestamp(sample.timestamp):%H:%M:%S}"
+        )
+        await ctx.send(embed=embed)
+
+    @minecraft_group.command(pass_context=True)
+    async def profile(
+        self, ctx: commands.Context, server_id: int, name: str = None
+    ):
+        """
+        Lists the launch profiles of a server or selects the one to use.
+
+        Profiles choose the GC flags, a class data sharing archive that
+        makes the next starts faster and heap pre-touching. The list shows
+        how long the recent starts of each profile took to be ready.
+        More profiles can be added in the launch.json of the server folder.
+        """
+        version = self.get_version(server_id)
+        path = self.pool.index.path(version)
+        profiles, selected = await asyncio.to_thread(load_profiles, path)
+        if name is not None:
+            if name not in profiles:
+                raise errors.BadArgument(f"There's no profile called {name}")
+            await asyncio.to_thread(select_profile, path, name)
+            await ctx.send(
+                f"{version.name} will use the {name} profile from its next start"
+            )
+            return
+        stats = await asyncio.to_thread(launch_stats, path)
+        embed = discord.Embed(title=f"{version.name} launch profiles")
+        for profile in profiles.values():
+            profile_stats = stats.get(profile.name)
+            timing = (
+                f"ready in {profile_stats['median']:.1f}s "
+                f"(best {profile_stats['best']:.1f}s, "
+                f"{profile_stats['launches']} starts)"
+                if profile_stats
+                else "never started"
+            )
+            embed.add_field(
+                name=(
+                    f"{profile.name} (selected)"
+                    if profile.name == selected
+                    else profile.name
+                ),
+                value=f"{profile.describe()}\n{timing}",
+                inline=False,
+            )
+        await ctx.send(embed=embed)
+
+    @minecraft_group.command(pass_context=True)
+    async def backup(self, ctx: commands.Context, server_id: int = None):
+        """
+        Takes a snapshot of the world of a server, or of the only one running.
+
+        Running servers keep running, autosaving is only paused while the
+        files are read. Only what changed since the last snapshot is read
+        and stored.
+        """
+        server = self.resolve_server(server_id)
+        await ctx.send(f"Backing up {server.name}...")
+        report = await backup_server(self.backup_store, server)
+        stored = (
+            f"stored {format_size(report.stored_bytes)}, "
+            f"dedup ratio {report.dedup_ratio:.1f}:1"
+            if report.stored_bytes
+            else "nothing new to store"
+        )
+        await ctx.send(
+            f"Saved snapshot `{report.snapshot}` of {server.name}: "
+            f"{report.files} files, {format_size(report.total_bytes)}. "
+            f"Read {report.changed_files} changed files "
+            f"({format_size(report.read_bytes)}) in {report.seconds:.1f}s, "
+            f"{format_size(report.throughput)}/s, {stored}"
+        )
+
+    @minecraft_group.command(pass_context=True)
+    async def backups(self, ctx: commands.Context, server_id: int):
+        """
+        Lists the snapshots of the world of a server, newest first.
+        """
+        version = self.get_version(server_id)
+        snapshots = await asyncio.to_thread(
+            self.backup_store.snapshots, version.name
+        )
+        if not snapshots:
+            await ctx.send(
+                f"{version.name} has no snapshots, try "
+                f"{ctx.prefix}mine backup {version.id}"
+            )
+            return
+        lines = [
+            f"{snapshot['snapshot']} · "
+            f"{datetime.datetime.fromtimestamp(snapshot['created_at']):%Y-%m-%d %H:%M}"
+            f" · {format_size(snapshot['total_bytes'])}"
+            f" · {format_size(snapshot['stored_bytes'])} new"
+            for snapshot in snapshots
+        ]
+        for message in pack_messages(lines):
+            await ctx.send(message)
+
+    @minecraft_group.command(pass_context=True)
+    async def restore(
+        self, ctx: commands.Context, server_id: int, snapshot: str
+    ):
+        """
+        Replaces the world of a stopped server with one of its snapshots.
+
+        The world it had is kept next to it, with a .before-restore suffix,
+        until the next restore.
+        """
+        version = self.get_version(server_id)
+        server = self.pool.servers.get(version.name)
+        if server is not None and (
+            server.state is not ServerState.STOPPED
+            or self.pool.is_queued(server)
+        ):
+            await ctx.send(f"Stop {version.name} before restoring its world")
+            return
+        await ctx.send(f"Restoring {version.name} to `{snapshot}`...")
+        await self.backup_store.restore(
+            version.name, snapshot, self.pool.index.path(version)
+        )
+        await self.pool.index.refresh_version(version.name)
+        await ctx.send(f"{version.name} was restored to `{snapshot}`")
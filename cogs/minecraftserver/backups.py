@@ -0,0 +1,437 @@
+"""
+Incremental, deduplicated world backups.
+
+Files are split in pieces that are stored once, compressed and named after
+the SHA-256 of their content. Region files are split in their 8 KiB header
+and one piece per chunk, so a chunk nobody touched is never stored again,
+even if the server moved it inside the file. Other files are split in
+fixed size blocks.
+
+A snapshot is a manifest with the pieces of every file, and a small summary
+that is all listing the snapshots reads. Files with the same size and mtime
+as in the previous snapshot reuse its pieces without being read, so a backup
+only reads what changed since the last one. Hashing and
+compressing runs in a process pool, the event loop only waits for it.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from cogs.minecraftserver.server import MinecraftServer
+from cogs.minecraftserver.versions import level_name
+
+SECTOR_SIZE = 4096
+REGION_HEADER_SIZE = 2 * SECTOR_SIZE
+BLOCK_SIZE = 1024 * 1024
+COMPRESSION_LEVEL = 6
+SAVE_TIMEOUT = 120
+
+Pieces = List[Tuple[int, str]]
+
+
+class BackupInProgress(Exception):
+    pass
+
+
+class SnapshotNotFound(Exception):
+    pass
+
+
+class BackupReport(NamedTuple):
+    snapshot: str
+    files: int
+    changed_files: int
+    total_bytes: int
+    read_bytes: int
+    stored_bytes: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """Bytes read and hashed per second."""
+        return self.read_bytes / self.seconds if self.seconds else 0.0
+
+    @property
+    def dedup_ratio(self) -> float:
+        """How many bytes of world each new stored byte stands for."""
+        return self.total_bytes / max(self.stored_bytes, 1)
+
+
+def object_path(root: Path, digest: str) -> Path:
+    return root / "objects" / digest[:2] / digest[2:]
+
+
+def put_object(root: Path, data: bytes) -> Tuple[str, int]:
+    """
+    Stores ``data`` unless it already is, returns its hash and how many
+    bytes were written.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = object_path(root, digest)
+    if path.exists():
+        return digest, 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    compressed = zlib.compress(data, COMPRESSION_LEVEL)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temporary.write_bytes(compressed)
+    os.replace(temporary, path)
+    return digest, len(compressed)
+
+
+def split_region(data: bytes) -> Optional[List[Tuple[int, bytes]]]:
+    """
+    The header and the chunks of a region file, each with its offset.
+    None if the location table doesn't make sense.
+    """
+    if len(data) < REGION_HEADER_SIZE:
+        return None
+    pieces = [(0, data[:REGION_HEADER_SIZE])]
+    for slot in range(1024):
+        location = data[slot * 4 : slot * 4 + 4]
+        sector, count = int.from_bytes(location[:3], "big"), location[3]
+        if sector == 0 or count == 0:
+            continue
+        start = sector * SECTOR_SIZE
+        end = start + count * SECTOR_SIZE
+        if start < REGION_HEADER_SIZE or end > len(data):
+            return None
+        pieces.append((start, data[start:end]))
+    return pieces
+
+
+def store_file(root: Path, path: Path) -> Tuple[Pieces, int, int]:
+    """
+    Stores the pieces of ``path``. Returns them with the number of bytes
+    read and written. Runs in the worker processes.
+    """
+    pieces = []
+    read = stored = 0
+    with open(path, "rb") as file:
+        if path.suffix in (".mca", ".mcr"):
+            data = file.read()
+            read = len(data)
+            region = split_region(data)
+            blocks = region or [
+                (offset, data[offset : offset + BLOCK_SIZE])
+                for offset in range(0, len(data), BLOCK_SIZE)
+            ]
+        else:
+            blocks = []
+            offset = 0
+            for block in iter(lambda: file.read(BLOCK_SIZE), b""):
+                blocks.append((offset, block))
+                offset += len(block)
+                read += len(block)
+        for offset, block in blocks:
+            digest, written = put_object(root, block)
+            pieces.append((offset, digest))
+            stored += written
+    return pieces, read, stored
+
+
+def restore_file(root: Path, path: Path, entry: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as file:
+        # Sectors no chunk uses are left as zeros.
+        file.truncate(entry["size"])
+        for offset, digest in entry["pieces"]:
+            file.seek(offset)
+            file.write(zlib.decompress(object_path(root, digest).read_bytes()))
+    # The next backup can reuse the pieces without reading the file again.
+    os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+
+def world_folders(path: Path) -> List[str]:
+    """
+    The world of the server in ``path``, with the nether and end folders
+    Bukkit based servers keep next to it.
+    """
+    level = level_name(path)
+    return [
+        folder
+        for folder in (level, f"{level}_nether", f"{level}_the_end")
+        if (path / folder).is_dir()
+    ]
+
+
+def list_files(path: Path, folders: List[str]) -> Dict[str, os.stat_result]:
+    files = {}
+    for folder in folders:
+        for directory, _, names in os.walk(path / folder):
+            for name in names:
+                # The lock is held by the running server.
+                if name == "session.lock":
+                    continue
+                file_path = Path(directory) / name
+                files[file_path.relative_to(path).as_posix()] = (
+                    file_path.stat()
+                )
+    return files
+
+
+def write_json(path: Path, data: dict):
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(temporary, path)
+
+
+class BackupStore:
+    """
+    Snapshots of the worlds of every version, in ``root``.
+    """
+
+    def __init__(self, root: Path, workers: Optional[int] = None):
+        self.root = root
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.in_progress: Set[str] = set()
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # Forking a process that runs an event loop and the gateway
+            # threads isn't safe.
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def check_idle(self, version: str):
+        if version in self.in_progress:
+            raise BackupInProgress(
+                f"A backup or restore of {version} is running"
+            )
+
+    @contextlib.contextmanager
+    def reserve(self, version: str):
+        """
+        Keeps other backups and restores of ``version`` out while the block
+        runs, raises BackupInProgress if one is already running.
+        """
+        self.check_idle(version)
+        self.in_progress.add(version)
+        try:
+            yield
+        finally:
+            self.in_progress.discard(version)
+
+    def snapshot_folder(self, version: str) -> Path:
+        return self.root / "snapshots" / version
+
+    def read_manifest(self, version: str, snapshot: str) -> dict:
+        path = self.snapshot_folder(version) / f"{snapshot}.json"
+        try:
+            with open(path) as manifest:
+                return json.load(manifest)
+        except FileNotFoundError:
+            raise SnapshotNotFound(snapshot)
+
+    def snapshots(self, version: str) -> List[dict]:
+        """
+        The summaries of the snapshots of ``version``, newest first.
+        """
+        folder = self.snapshot_folder(version)
+        if not folder.is_dir():
+            return []
+        snapshots = []
+        for path in folder.glob("*.json"):
+            if path.name.endswith(".summary.json"):
+                continue
+            summary_path = path.with_name(f"{path.stem}.summary.json")
+            try:
+                with open(summary_path) as summary_file:
+                    summary = json.load(summary_file)
+            except FileNotFoundError:
+                # The backup was interrupted between the two files.
+                summary = self.read_manifest(version, path.stem)
+                del summary["files"]
+                write_json(summary_path, summary)
+            snapshots.append(summary)
+        snapshots.sort(key=lambda snapshot: snapshot["created_at"])
+        return snapshots[::-1]
+
+    async def backup(self, version: str, path: Path) -> BackupReport:
+        with self.reserve(version):
+            return await self.take_snapshot(version, path)
+
+    async def take_snapshot(self, version: str, path: Path) -> BackupReport:
+        started = time.perf_counter()
+        folders = await asyncio.to_thread(world_folders, path)
+        files = await asyncio.to_thread(list_files, path, folders)
+        previous = await asyncio.to_thread(self.snapshots, version)
+        previous_files = (
+            (
+                await asyncio.to_thread(
+                    self.read_manifest, version, previous[0]["snapshot"]
+                )
+            )["files"]
+            if previous
+            else {}
+        )
+
+        loop = asyncio.get_running_loop()
+        manifest_files = {}
+        changed = {}
+        for name, stat in files.items():
+            entry = previous_files.get(name)
+            if (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns
+            ):
+                manifest_files[name] = entry
+            else:
+                changed[name] = loop.run_in_executor(
+                    self.get_executor(), store_file, self.root, path / name
+                )
+        read_bytes = stored_bytes = 0
+        for name, future in changed.items():
+            pieces, read, stored = await future
+            read_bytes += read
+            stored_bytes += stored
+            manifest_files[name] = {
+                "size": files[name].st_size,
+                "mtime_ns": files[name].st_mtime_ns,
+                "pieces": pieces,
+            }
+
+        snapshot = self.new_snapshot_id(version)
+        report = BackupReport(
+            snapshot=snapshot,
+            files=len(files),
+            changed_files=len(changed),
+            total_bytes=sum(stat.st_size for stat in files.values()),
+            read_bytes=read_bytes,
+            stored_bytes=stored_bytes,
+            seconds=time.perf_counter() - started,
+        )
+        manifest = {
+            "snapshot": snapshot,
+            "version": version,
+            "folders": folders,
+            "created_at": time.time(),
+            **report._asdict(),
+            "files": manifest_files,
+        }
+        await asyncio.to_thread(self.write_manifest, version, manifest)
+        return report
+
+    def new_snapshot_id(self, version: str) -> str:
+        snapshot = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        folder = self.snapshot_folder(version)
+        taken = 1
+        while (folder / f"{snapshot}.json").exists():
+            taken += 1
+            snapshot = f"{snapshot.partition('.')[0]}.{taken}"
+        return snapshot
+
+    def write_manifest(self, version: str, manifest: dict):
+        folder = self.snapshot_folder(version)
+        folder.mkdir(parents=True, exist_ok=True)
+        snapshot = manifest["snapshot"]
+        write_json(folder / f"{snapshot}.json", manifest)
+        summary = {key: manifest[key] for key in manifest if key != "files"}
+        write_json(folder / f"{snapshot}.summary.json", summary)
+
+    async def restore(self, version: str, snapshot: str, path: Path):
+        """
+        Replaces the world of the stopped server in ``path`` with
+        ``snapshot``. The current world is kept in ``<world>.before-restore``
+        until the next restore.
+        """
+        with self.reserve(version):
+            manifest = await asyncio.to_thread(
+                self.read_manifest, version, snapshot
+            )
+            staging = path / ".restore"
+            await asyncio.to_thread(shutil.rmtree, staging, True)
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        self.get_executor(),
+                        restore_file,
+                        self.root,
+                        staging / name,
+                        entry,
+                    )
+                    for name, entry in manifest["files"].items()
+                )
+            )
+            await asyncio.to_thread(
+                self.swap_folders, path, staging, manifest["folders"]
+            )
+
+    @staticmethod
+    def swap_folders(path: Path, staging: Path, folders: List[str]):
+        for folder in folders:
+            current = path / folder
+            kept = path / f"{folder}.before-restore"
+            if kept.exists():
+                shutil.rmtree(kept)
+            if current.exists():
+                current.rename(kept)
+            restored = staging / folder
+            if restored.exists():
+                restored.rename(current)
+            else:
+                current.mkdir()
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+async def save_all(server: MinecraftServer, timeout: float = SAVE_TIMEOUT):
+    """
+    Flushes the world to disk. Through RCON the command only returns when
+    it's done, on the console it's done when the server says so.
+    """
+    saved = asyncio.get_running_loop().create_future()
+
+    def wait_for_saved(line):
+        if "Saved the game" in line.text and not saved.done():
+            saved.set_result(None)
+
+    server.log_listeners.append(wait_for_saved)
+    try:
+        output = await server.execute_command("save-all flush")
+        if output is None:
+            await asyncio.wait_for(saved, timeout)
+    finally:
+        server.log_listeners.remove(wait_for_saved)
+
+
+async def backup_server(
+    store: BackupStore, server: MinecraftServer
+) -> BackupReport:
+    """
+    Takes a snapshot of the world of ``server``. While it runs, autosaving
+    is turned off and everything it has in memory is flushed first, so the
+    files don't change while they are read.
+    """
+    # Reserved before autosaving is touched, a backup that is already
+    # running must not get it turned back on under it.
+    with store.reserve(server.name):
+        if not server.is_running:
+            return await store.take_snapshot(server.name, server.path)
+        await server.execute_command("save-off")
+        try:
+            await save_all(server)
+            return await store.take_snapshot(server.name, server.path)
+        finally:
+            if server.is_running:
+                await server.execute_command("save-on")
@@ -0,0 +1,221 @@
+import asyncio
+import datetime
+import re
+import statistics
+import time
+from collections import deque
+from typing import (
+    Awaitable,
+    Callable,
+    Deque,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+import discord
+
+from utils.constants import DISCORD_MAX_BODY_LENGTH
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+class LogLine(NamedTuple):
+    timestamp: datetime.datetime
+    text: str
+
+    def __str__(self):
+        return f"{self.timestamp:%H:%M:%S} {self.text}"
+
+
+class LogBuffer:
+    """
+    The last ``maxlen`` lines the server printed, with the time they were
+    read. Older lines are dropped, so memory stays bounded no matter how
+    long the server runs.
+    """
+
+    def __init__(self, maxlen: int = 5000):
+        self.lines: Deque[LogLine] = deque(maxlen=maxlen)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def append(self, text: str) -> LogLine:
+        line = LogLine(datetime.datetime.now(), text.rstrip())
+        self.lines.append(line)
+        return line
+
+    def clear(self):
+        self.lines.clear()
+
+    def tail(
+        self,
+        count: int,
+        since: Optional[datetime.datetime] = None,
+        contains: Optional[str] = None,
+    ) -> List[LogLine]:
+        """
+        Returns up to ``count`` of the most recent lines that were read
+        after ``since`` and contain ``contains``, ignoring case, oldest
+        first.
+        """
+        if contains is not None:
+            contains = contains.casefold()
+        matches = []
+        for line in reversed(self.lines):
+            if len(matches) >= count:
+                break
+            if since is not None and line.timestamp < since:
+                break
+            if contains is None or contains in line.text.casefold():
+                matches.append(line)
+        matches.reverse()
+        return matches
+
+
+def parse_duration(value: str) -> datetime.timedelta:
+    """
+    Parses durations like ``90s``, ``10m``, ``2h`` or ``1d``.
+    """
+    match = re.fullmatch(r"(\d+)([smhd])", value.strip().lower())
+    if match is None:
+        raise ValueError(f'"{value}" is not a duration like 10m or 2h')
+    amount, unit = match.groups()
+    return datetime.timedelta(seconds=int(amount) * DURATION_UNITS[unit])
+
+
+def pack_messages(
+    lines: Iterable[str], limit: int = DISCORD_MAX_BODY_LENGTH
+) -> List[str]:
+    """
+    Packs the lines into as few code block messages as possible, each one
+    at most ``limit`` characters long. Lines that don't fit in a message on
+    their own are truncated.
+    """
+    wrapper = "```\n{}```"
+    room = limit - len(wrapper.format(""))
+    messages = []
+    current = []
+    size = 0
+    for line in lines:
+        line = f"{line}\n"
+        if len(line) > room:
+            line = f"{line[:room - 2]}…\n"
+        if size + len(line) > room:
+            messages.append(wrapper.format("".join(current)))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        messages.append(wrapper.format("".join(current)))
+    return messages
+
+
+class LogStream:
+    """
+    Mirrors server output to Discord in batched messages.
+
+    Lines are collected and sent every ``flush_interval`` seconds, or right
+    away once they fill a message. At most ``max_messages`` messages worth
+    of lines wait to be sent, anything above that is dropped and replaced by
+    a line saying how many were lost, so bursts like chunk loading can't
+    build an unbounded send queue or hit the rate limits.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable],
+        flush_interval: float = 2,
+        max_messages: int = 3,
+        limit: int = DISCORD_MAX_BODY_LENGTH,
+    ):
+        self.send = send
+        self.flush_interval = flush_interval
+        self.limit = limit
+        self.max_pending_size = max_messages * limit
+        # What fits in a code block message with its newline.
+        self.max_line_length = limit - len("```\n```") - 1
+        self.pending: List[str] = []
+        self.pending_size = 0
+        self.pending_since: Optional[float] = None
+        self.dropped = 0
+        self.has_lines = asyncio.Event()
+        self.is_full = asyncio.Event()
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self.total_lines = 0
+        self.total_dropped = 0
+        self.sent_messages = 0
+        self.failed_messages = 0
+        self.flush_latencies: Deque[float] = deque(maxlen=100)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self):
+        self.closed = True
+        self.has_lines.set()
+        self.is_full.set()
+        if self.task:
+            await self.task
+
+    def push(self, line: LogLine):
+        text = str(line)
+        if len(text) > self.max_line_length:
+            text = f"{text[:self.max_line_length - 1]}…"
+        if self.pending_size + len(text) > self.max_pending_size:
+            self.dropped += 1
+            self.total_dropped += 1
+            return
+        if not self.pending:
+            self.pending_since = time.monotonic()
+            self.has_lines.set()
+        self.pending.append(text)
+        self.pending_size += len(text) + 1
+        self.total_lines += 1
+        if self.pending_size >= self.limit:
+            self.is_full.set()
+
+    async def run(self):
+        while not self.closed or self.pending or self.dropped:
+            await self.has_lines.wait()
+            try:
+                await asyncio.wait_for(
+                    self.is_full.wait(), self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        lines, self.pending, self.pending_size = self.pending, [], 0
+        since, self.pending_since = self.pending_since, None
+        self.has_lines.clear()
+        self.is_full.clear()
+        if self.dropped:
+            lines.append(f"... {self.dropped} lines dropped")
+            self.dropped = 0
+        if not lines:
+            return
+        for message in pack_messages(lines, self.limit):
+            try:
+                await self.send(message)
+                self.sent_messages += 1
+            except discord.HTTPException:
+                self.failed_messages += 1
+        # Nothing was pending when only dropped lines are reported.
+        if since is not None:
+            self.flush_latencies.append(time.monotonic() - since)
+
+    def stats(self):
+        latencies = sorted(self.flush_latencies)
+        return {
+            "lines": self.total_lines,
+            "dropped": self.total_dropped,
+            "messages": self.sent_messages,
+            "failed": self.failed_messages,
+            "flush_p50": statistics.median(latencies) if latencies else 0.0,
+            "flush_max": latencies[-1] if latencies else 0.0,
+        }
@@ -0,0 +1,328 @@
+import asyncio
+import atexit
+import os
+import re
+import secrets
+import socket
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from cogs.minecraftserver.profiles import (
+    LaunchProfile,
+    jvm_flags,
+    load_profiles,
+    record_launch,
+)
+from cogs.minecraftserver.properties import (
+    read_properties,
+    update_properties,
+)
+from cogs.minecraftserver.server import (
+    MinecraftServer,
+    ServerAlreadyRunning,
+    ServerState,
+)
+from cogs.minecraftserver.versions import VersionIndex, VersionInfo
+from utils.constants import MINECRAFT_SERVER_MEMORY
+
+MEMORY_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+# Off-heap memory of a server (metaspace, threads, GC and JIT structures)
+# that has to fit in the budget next to the heap.
+JVM_OVERHEAD_MB = 512
+CGROUP_MEMORY_LIMITS = [
+    Path("/sys/fs/cgroup/memory.max"),
+    Path("/sys/fs/cgroup/memory/memory.limit_in_bytes"),
+]
+
+
+class InsufficientMemory(Exception):
+    pass
+
+
+class ReservationCancelled(Exception):
+    pass
+
+
+def parse_memory(value: str) -> int:
+    """
+    Parses JVM style sizes like ``4096M`` or ``4G`` into megabytes.
+    """
+    match = re.fullmatch(r"(\d+)([kmg]?)", value.strip().lower())
+    if match is None:
+        raise ValueError(f'"{value}" is not a memory size like 512M or 4G')
+    amount, unit = match.groups()
+    return int(amount) * MEMORY_UNITS[unit] // MEMORY_UNITS["m"]
+
+
+def detect_memory_limit() -> Optional[int]:
+    """
+    The memory of the host in megabytes, or the limit of the cgroup the bot
+    runs in when it is lower. None where neither can be read.
+    """
+    limits = []
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemTotal:"):
+                    limits.append(int(line.split()[1]) // 1024)
+                    break
+    except OSError:
+        pass
+    for path in CGROUP_MEMORY_LIMITS:
+        try:
+            value = path.read_text().strip()
+        except OSError:
+            continue
+        # cgroup v2 says "max" when there's no limit.
+        if value.isdigit():
+            limits.append(int(value) // MEMORY_UNITS["m"])
+    return min(limits) if limits else None
+
+
+def get_memory_budget(server_memory: int) -> int:
+    """
+    How many megabytes the servers may use together.
+
+    ``MINECRAFT_MEMORY_BUDGET`` sets it explicitly, otherwise it is the
+    detected memory limit minus ``MINECRAFT_MEMORY_RESERVE`` (1G by default)
+    for the bot and the system. When no limit can be detected only one
+    server of ``server_memory`` fits, like before servers were pooled.
+    """
+    budget = os.getenv("MINECRAFT_MEMORY_BUDGET")
+    if budget:
+        return parse_memory(budget)
+    limit = detect_memory_limit()
+    if limit is None:
+        return server_memory + JVM_OVERHEAD_MB
+    reserve = parse_memory(os.getenv("MINECRAFT_MEMORY_RESERVE", "1G"))
+    return max(limit - reserve, 0)
+
+
+class MemoryScheduler:
+    """
+    Hands out the memory budget to the servers.
+
+    A reservation that doesn't fit waits in a FIFO queue until enough
+    memory is released, one that is bigger than the whole budget is refused
+    right away.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.reservations: Dict[str, int] = {}
+        self.waiters: "OrderedDict[str, Tuple[int, asyncio.Future]]" = (
+            OrderedDict()
+        )
+
+    @property
+    def reserved(self) -> int:
+        return sum(self.reservations.values())
+
+    @property
+    def available(self) -> int:
+        return self.budget - self.reserved
+
+    def fits(self, amount: int) -> bool:
+        # Nothing jumps the queue, even if it would fit.
+        return amount <= self.available and not self.waiters
+
+    async def reserve(self, name: str, amount: int, wait: bool = True):
+        if amount > self.budget:
+            raise InsufficientMemory(
+                f"{amount}M is more than the {self.budget}M budget"
+            )
+        if self.fits(amount):
+            self.reservations[name] = amount
+            return
+        if not wait:
+            raise InsufficientMemory(
+                f"{amount}M requested but only {self.available}M available"
+            )
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[name] = (amount, future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if self.waiters.pop(name, None) is None:
+                # Granted right before being cancelled.
+                self.release(name)
+            else:
+                self.grant()
+            raise
+
+    def release(self, name: str):
+        self.reservations.pop(name, None)
+        self.grant()
+
+    def cancel(self, name: str) -> bool:
+        if name not in self.waiters:
+            return False
+        amount, future = self.waiters.pop(name)
+        future.set_exception(ReservationCancelled(name))
+        self.grant()
+        return True
+
+    def grant(self):
+        while self.waiters:
+            name, (amount, future) = next(iter(self.waiters.items()))
+            if amount > self.available:
+                break
+            del self.waiters[name]
+            self.reservations[name] = amount
+            future.set_result(None)
+
+
+def port_is_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("", port))
+        except OSError:
+            return False
+    return True
+
+
+class ServerPool:
+    """
+    The Minecraft servers in ``versions/``, any number of them running at
+    once as long as their heaps fit in the memory budget. Each running
+    server listens on its own port, starting at ``base_port``.
+
+    Servers that have ``enable-rcon=true`` in their server.properties also
+    get their own RCON port, starting at ``base_rcon_port``, which is
+    written to the file before they start.
+    """
+
+    def __init__(
+        self,
+        index: VersionIndex,
+        server_memory: str = MINECRAFT_SERVER_MEMORY,
+        budget: Optional[int] = None,
+        base_port: int = 25565,
+        base_rcon_port: int = 25575,
+    ):
+        self.server_memory = parse_memory(server_memory)
+        self.scheduler = MemoryScheduler(
+            budget
+            if budget is not None
+            else get_memory_budget(self.server_memory)
+        )
+        self.base_port = base_port
+        self.base_rcon_port = base_rcon_port
+        self.index = index
+        self.servers: Dict[str, MinecraftServer] = {}
+        self.last_started: Optional[MinecraftServer] = None
+        # Set whenever a server starts, for whoever waits for one.
+        self.started = asyncio.Event()
+        atexit.register(self.terminate)
+
+    def get(self, version: VersionInfo) -> MinecraftServer:
+        server = self.servers.get(version.name)
+        if server is None:
+            server = self.servers[version.name] = MinecraftServer(
+                self.index.path(version)
+            )
+        return server
+
+    def running(self) -> List[MinecraftServer]:
+        return [
+            server for server in self.servers.values() if server.is_running
+        ]
+
+    def is_queued(self, server: MinecraftServer) -> bool:
+        return server.name in self.scheduler.waiters
+
+    def allocate_port(self, start: int, exclude=()) -> int:
+        used = set(exclude)
+        for server in self.running():
+            used.update((server.port, server.rcon_port))
+        port = start
+        while port in used or not port_is_free(port):
+            port += 1
+        return port
+
+    def configure_rcon(
+        self, server: MinecraftServer, exclude=()
+    ) -> Tuple[Optional[int], Optional[str]]:
+        properties = read_properties(server.path)
+        if properties.get("enable-rcon") != "true":
+            return None, None
+        port = self.allocate_port(self.base_rcon_port, exclude)
+        password = properties.get("rcon.password") or secrets.token_urlsafe(16)
+        update_properties(
+            server.path, {"rcon.port": str(port), "rcon.password": password}
+        )
+        return port, password
+
+    async def start(
+        self,
+        version: VersionInfo,
+        memory: Optional[int] = None,
+        wait: bool = True,
+    ) -> MinecraftServer:
+        """
+        Starts the ``version`` server with ``memory`` megabytes of heap,
+        waiting for other servers to release memory if it doesn't fit.
+        """
+        server = self.get(version)
+        if server.state is not ServerState.STOPPED or self.is_queued(server):
+            raise ServerAlreadyRunning
+        memory = memory or self.server_memory
+        await self.scheduler.reserve(
+            server.name, memory + JVM_OVERHEAD_MB, wait
+        )
+        try:
+            # The jar may have been replaced since the index last saw it,
+            # and the CDS archive is keyed on its hash.
+            version = await self.index.refresh_version(version.name) or version
+            profiles, selected = load_profiles(server.path)
+            profile = profiles[selected]
+            flags, cds = jvm_flags(profile, server.path, version.jar_sha1)
+            port = self.allocate_port(self.base_port)
+            rcon_port, rcon_password = self.configure_rcon(server, {port})
+            await server.run(
+                f"{memory}M", port, rcon_port, rcon_password, flags
+            )
+        except BaseException:
+            self.scheduler.release(server.name)
+            raise
+        self.last_started = server
+        self.started.set()
+        asyncio.create_task(self.record_time_to_ready(server, profile, cds))
+        asyncio.create_task(self.release_when_stopped(server))
+        return server
+
+    async def record_time_to_ready(
+        self, server: MinecraftServer, profile: LaunchProfile, cds: str
+    ):
+        if await server.wait_ready():
+            print(
+                f"{server.name} ready in {server.ready_seconds:.1f}s "
+                f"with the {profile.name} profile, CDS {cds}"
+            )
+            await asyncio.to_thread(
+                record_launch,
+                server.path,
+                profile.name,
+                cds,
+                server.ready_seconds,
+            )
+
+    async def release_when_stopped(self, server: MinecraftServer):
+        await server.wait_stopped()
+        self.scheduler.release(server.name)
+        # The world changed and the log may have told the version.
+        await self.index.refresh_version(server.name, server.minecraft_version)
+
+    async def stop(self, server: MinecraftServer):
+        if not self.scheduler.cancel(server.name):
+            await server.stop()
+
+    async def stop_all(self):
+        for name in list(self.scheduler.waiters):
+            self.scheduler.cancel(name)
+        await asyncio.gather(*(server.stop() for server in self.running()))
+
+    def terminate(self):
+        for server in self.servers.values():
+            server.terminate()
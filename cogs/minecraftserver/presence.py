@@ -0,0 +1,157 @@
+import asyncio
+import re
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from cogs.minecraftserver.logs import LogLine
+from cogs.minecraftserver.pool import ServerPool
+from cogs.minecraftserver.rcon import RconError
+from cogs.minecraftserver.server import MinecraftServer, ServerNotRunning
+from cogs.minecraftserver.telemetry import parse_players, strip_formatting
+
+# Matched against the whole line: a player can type "]: Alice left the
+# game" in chat, but their message comes after "<name>", not right after
+# the server thread prefix.
+JOINED = re.compile(
+    r"^\[[^\]]+\] \[Server thread/INFO\]: (\w{1,16}) joined the game$"
+)
+LEFT = re.compile(
+    r"^\[[^\]]+\] \[Server thread/INFO\]: (\w{1,16}) left the game$"
+)
+
+
+def parse_player_names(text: str) -> Optional[Set[str]]:
+    """
+    The names in the output of the ``list`` command.
+    """
+    count, _ = parse_players(text)
+    if count is None:
+        return None
+    names = strip_formatting(text).partition("online:")[2]
+    return {name.strip() for name in names.split(",") if name.strip()}
+
+
+class IdleMonitor:
+    """
+    Stops servers nobody is playing on.
+
+    Who is online is followed from the join and leave lines of the server
+    output, nothing is polled. When the last player leaves, or the server
+    becomes ready without anyone joining, a countdown starts: ``on_warning``
+    is called ``warn_before`` seconds before the end of ``idle_after``, and
+    then the world is saved, the server stopped and ``on_stopped`` called.
+    Anyone joining cancels it. RCON ``list`` is checked before warning and
+    stopping, in case a line was missed.
+    """
+
+    def __init__(
+        self,
+        pool: ServerPool,
+        idle_after: float,
+        warn_before: float,
+        on_warning: Callable[[MinecraftServer, float], Awaitable],
+        on_stopped: Callable[[MinecraftServer, float], Awaitable],
+    ):
+        self.pool = pool
+        self.idle_after = idle_after
+        self.warn_before = min(warn_before, idle_after)
+        self.on_warning = on_warning
+        self.on_stopped = on_stopped
+        self.players: Dict[str, Set[str]] = {}
+        # The process each server was last seen getting ready in.
+        self.ready_pids: Dict[str, int] = {}
+        self.countdowns: Dict[str, asyncio.Task] = {}
+
+    def watch(self, server: MinecraftServer):
+        if server.name in self.players:
+            return
+        self.players[server.name] = set()
+        server.log_listeners.append(
+            lambda line: self.handle_line(server, line)
+        )
+
+    def handle_line(self, server: MinecraftServer, line: LogLine):
+        players = self.players[server.name]
+        joined = JOINED.match(line.text)
+        if joined:
+            players.add(joined.group(1))
+            self.cancel(server)
+            return
+        left = LEFT.match(line.text)
+        if left:
+            players.discard(left.group(1))
+            if not players:
+                self.start_countdown(server)
+        elif (
+            "Done (" in line.text
+            and server.ready_seconds is not None
+            and self.ready_pids.get(server.name) != server.process.pid
+        ):
+            self.ready_pids[server.name] = server.process.pid
+            players.clear()
+            self.start_countdown(server)
+
+    def cancel(self, server: MinecraftServer):
+        countdown = self.countdowns.pop(server.name, None)
+        if countdown is not None:
+            countdown.cancel()
+
+    def start_countdown(self, server: MinecraftServer):
+        self.cancel(server)
+        self.countdowns[server.name] = asyncio.create_task(
+            self.count_down(server)
+        )
+
+    async def has_players(self, server: MinecraftServer) -> bool:
+        players = self.players[server.name]
+        if not players and server.rcon is not None:
+            try:
+                names = parse_player_names(await server.rcon.command("list"))
+            except (RconError, ConnectionError, asyncio.TimeoutError):
+                names = None
+            if names:
+                players.update(names)
+        return bool(players)
+
+    async def count_down(self, server: MinecraftServer):
+        process = server.process
+
+        async def still_idle():
+            # A restart in between gets its own countdown.
+            return (
+                server.process is process
+                and server.is_running
+                and not await self.has_players(server)
+            )
+
+        try:
+            await asyncio.sleep(self.idle_after - self.warn_before)
+            if not await still_idle():
+                return
+            await self.on_warning(server, self.warn_before)
+            await asyncio.sleep(self.warn_before)
+            if not await still_idle():
+                return
+            # Anyone joining from here on finds the server stopping.
+            self.countdowns.pop(server.name, None)
+            try:
+                await server.execute_command("save-all")
+            except (
+                RconError,
+                ConnectionError,
+                asyncio.TimeoutError,
+                ServerNotRunning,
+            ) as error:
+                # Stopping saves the world anyway.
+                print(
+                    f"Couldn't save {server.name} before stopping: {error!r}"
+                )
+            await self.pool.stop(server)
+            await self.on_stopped(server, self.idle_after)
+        finally:
+            if self.countdowns.get(server.name) is asyncio.current_task():
+                del self.countdowns[server.name]
+
+    def stop(self):
+        for countdown in self.countdowns.values():
+            countdown.cancel()
+        self.countdowns.clear()
@@ -0,0 +1,188 @@
+"""
+JVM launch profiles.
+
+A profile picks a GC preset, whether to use an AppCDS archive and whether
+to pre-touch the heap. The built-in profiles can be extended per version in
+``versions/<name>/launch.json``, which also selects the profile to use:
+
+    {
+        "profile": "mine",
+        "profiles": {
+            "mine": {"gc": "zgc", "cds": true, "flags": ["-XX:+UseNUMA"]}
+        }
+    }
+
+The archive of a CDS profile is dumped when the server exits cleanly after
+its first run and loaded by every run after that, it needs Java 13 or
+newer. How long each launch took to be ready is kept in
+``versions/<name>/.launches.json`` to compare the profiles.
+"""
+
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+LAUNCH_FILE_NAME = "launch.json"
+HISTORY_FILE_NAME = ".launches.json"
+CDS_FOLDER_NAME = ".cds"
+HISTORY_LENGTH = 20
+
+GC_PRESETS = {
+    "default": [],
+    # Aikar's flags, without -XX:+PerfDisableSharedMem which would hide the
+    # heap from the telemetry.
+    "g1": [
+        "-XX:+UseG1GC",
+        "-XX:+ParallelRefProcEnabled",
+        "-XX:MaxGCPauseMillis=200",
+        "-XX:+UnlockExperimentalVMOptions",
+        "-XX:+DisableExplicitGC",
+        "-XX:G1NewSizePercent=30",
+        "-XX:G1MaxNewSizePercent=40",
+        "-XX:G1HeapRegionSize=8M",
+        "-XX:G1ReservePercent=20",
+        "-XX:G1HeapWastePercent=5",
+        "-XX:G1MixedGCCountTarget=4",
+        "-XX:InitiatingHeapOccupancyPercent=15",
+        "-XX:G1MixedGCLiveThresholdPercent=90",
+        "-XX:G1RSetUpdatingPauseTimePercent=5",
+        "-XX:SurvivorRatio=32",
+        "-XX:MaxTenuringThreshold=1",
+    ],
+    "zgc": ["-XX:+UseZGC"],
+    "shenandoah": ["-XX:+UseShenandoahGC"],
+    "parallel": ["-XX:+UseParallelGC"],
+}
+
+
+class InvalidProfile(Exception):
+    pass
+
+
+class LaunchProfile(NamedTuple):
+    name: str
+    gc: str = "default"
+    cds: bool = False
+    pre_touch: bool = False
+    flags: Tuple[str, ...] = ()
+
+    def describe(self) -> str:
+        options = [f"{self.gc} GC"]
+        if self.cds:
+            options.append("CDS")
+        if self.pre_touch:
+            options.append("pre-touch")
+        options.extend(self.flags)
+        return ", ".join(options)
+
+
+BUILTIN_PROFILES = {
+    # How servers always ran, no tuning at all.
+    "default": LaunchProfile("default"),
+    "g1": LaunchProfile("g1", gc="g1"),
+    "fast-start": LaunchProfile("fast-start", gc="g1", cds=True),
+    "pre-touch": LaunchProfile("pre-touch", gc="g1", cds=True, pre_touch=True),
+}
+
+
+def read_json(path: Path, default):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path: Path, data):
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "w") as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(temporary, path)
+
+
+def load_profiles(folder: Path) -> Tuple[Dict[str, LaunchProfile], str]:
+    """
+    The profiles available to the version in ``folder`` and the name of the
+    one it uses.
+    """
+    config = read_json(folder / LAUNCH_FILE_NAME, {})
+    profiles = dict(BUILTIN_PROFILES)
+    for name, options in config.get("profiles", {}).items():
+        if options.get("gc", "default") not in GC_PRESETS:
+            raise InvalidProfile(f"Unknown GC preset in profile {name}")
+        profiles[name] = LaunchProfile(
+            name,
+            gc=options.get("gc", "default"),
+            cds=options.get("cds", False),
+            pre_touch=options.get("pre_touch", False),
+            flags=tuple(options.get("flags", ())),
+        )
+    selected = config.get("profile", "default")
+    if selected not in profiles:
+        selected = "default"
+    return profiles, selected
+
+
+def select_profile(folder: Path, name: str):
+    path = folder / LAUNCH_FILE_NAME
+    config = read_json(path, {})
+    config["profile"] = name
+    write_json(path, config)
+
+
+def jvm_flags(
+    profile: LaunchProfile, folder: Path, jar_hash: Optional[str]
+) -> Tuple[List[str], str]:
+    """
+    The JVM flags of ``profile`` and what happens with its CDS archive:
+    "off", "dump" on the first run or "load" after that. The archive is
+    named after the jar hash, so a new jar gets a new archive.
+    """
+    flags = list(GC_PRESETS[profile.gc])
+    if profile.pre_touch:
+        flags.append("-XX:+AlwaysPreTouch")
+    cds = "off"
+    if profile.cds:
+        archives = folder / CDS_FOLDER_NAME
+        archives.mkdir(exist_ok=True)
+        archive = archives / f"{profile.name}-{(jar_hash or 'jar')[:12]}.jsa"
+        if archive.is_file() and archive.stat().st_size > 0:
+            flags.append(f"-XX:SharedArchiveFile={archive}")
+            cds = "load"
+        else:
+            flags.append(f"-XX:ArchiveClassesAtExit={archive}")
+            cds = "dump"
+    flags.extend(profile.flags)
+    return flags, cds
+
+
+def record_launch(folder: Path, profile: str, cds: str, seconds: float):
+    path = folder / HISTORY_FILE_NAME
+    history = read_json(path, {})
+    launches = history.setdefault(profile, [])
+    launches.append({"at": time.time(), "cds": cds, "seconds": seconds})
+    del launches[:-HISTORY_LENGTH]
+    write_json(path, history)
+
+
+def launch_stats(folder: Path) -> Dict[str, Dict[str, float]]:
+    """
+    The median and best time to ready of the recent launches of each
+    profile. Launches that dumped a CDS archive are left out, they aren't
+    representative of the profile.
+    """
+    stats = {}
+    for profile, launches in read_json(folder / HISTORY_FILE_NAME, {}).items():
+        seconds = [
+            launch["seconds"] for launch in launches if launch["cds"] != "dump"
+        ]
+        if seconds:
+            stats[profile] = {
+                "launches": len(seconds),
+                "median": statistics.median(seconds),
+                "best": min(seconds),
+            }
+    return stats
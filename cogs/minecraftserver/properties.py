@@ -0,0 +1,38 @@
+from pathlib import Path
+from typing import Dict
+
+PROPERTIES_FILE_NAME = "server.properties"
+
+
+def read_properties(folder: Path) -> Dict[str, str]:
+    properties = {}
+    try:
+        with open(folder / PROPERTIES_FILE_NAME) as properties_file:
+            for line in properties_file:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                key, _, value = line.partition("=")
+                properties[key.strip()] = value.strip()
+    except OSError:
+        pass
+    return properties
+
+
+def update_properties(folder: Path, changes: Dict[str, str]):
+    """
+    Sets the ``changes`` in the server.properties of ``folder``, keeping
+    every other line as it was.
+    """
+    path = folder / PROPERTIES_FILE_NAME
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        lines = []
+    remaining = dict(changes)
+    for number, line in enumerate(lines):
+        key = line.partition("=")[0].strip()
+        if key in remaining and not line.lstrip().startswith("#"):
+            lines[number] = f"{key}={remaining.pop(key)}"
+    lines.extend(f"{key}={value}" for key, value in remaining.items())
+    path.write_text("\n".join(lines) + "\n")
@@ -0,0 +1,267 @@
+"""
+Minecraft RCON over asyncio.
+
+A packet is its length, a request ID, a type and a null terminated payload,
+all integers little endian. Responses longer than 4096 bytes are split in
+several packets with no end marker, so after each command the client sends
+a packet of an unknown type: the server answers requests in order, and the
+"Unknown request" reply to it means the command response is complete.
+
+The module also runs a stand-in RCON server, to try the client without a
+JVM:
+
+    python -m cogs.minecraftserver.rcon --port 25575 --password secret
+"""
+
+import argparse
+import asyncio
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+
+LOGIN = 3
+COMMAND = 2
+AUTH_RESPONSE = 2
+RESPONSE_VALUE = 0
+MAX_RESPONSE_PAYLOAD = 4096
+
+
+class RconError(Exception):
+    pass
+
+
+class RconUnavailable(RconError):
+    """
+    The connection couldn't be opened or the password was rejected, no
+    command was sent.
+    """
+
+
+def encode_packet(request_id: int, packet_type: int, payload: str) -> bytes:
+    body = (
+        struct.pack("<ii", request_id, packet_type)
+        + payload.encode("utf-8")
+        + b"\x00\x00"
+    )
+    return struct.pack("<i", len(body)) + body
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, int, str]:
+    (length,) = struct.unpack("<i", await reader.readexactly(4))
+    body = await reader.readexactly(length)
+    request_id, packet_type = struct.unpack("<ii", body[:8])
+    return request_id, packet_type, body[8:-2].decode("utf-8", "replace")
+
+
+class RconClient:
+    """
+    A persistent RCON connection to one server.
+
+    Commands are pipelined: each one gets its own request ID and many can
+    wait for their responses on the same connection at once. A lost
+    connection fails the commands that were waiting on it and is opened
+    again by the next command.
+    """
+
+    def __init__(
+        self, host: str, port: int, password: str, timeout: float = 5
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.read_task: Optional[asyncio.Task] = None
+        self.connecting = asyncio.Lock()
+        self.last_id = 0
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.fragments: Dict[int, List[str]] = {}
+        # The ID of the unknown packet sent after each command, to the ID
+        # of the command.
+        self.markers: Dict[int, int] = {}
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    def allocate_id(self) -> int:
+        self.last_id = self.last_id % 0x7FFFFFFF + 1
+        return self.last_id
+
+    async def connect(self):
+        async with self.connecting:
+            if self.connected:
+                return
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port),
+                    self.timeout,
+                )
+            except (OSError, asyncio.TimeoutError) as error:
+                raise RconUnavailable(f"Can't connect: {error}") from error
+            try:
+                login_id = self.allocate_id()
+                writer.write(encode_packet(login_id, LOGIN, self.password))
+                # Some servers send an empty response before the auth one.
+                packet_type = None
+                while packet_type != AUTH_RESPONSE:
+                    request_id, packet_type, _ = await asyncio.wait_for(
+                        read_packet(reader), self.timeout
+                    )
+            except (
+                OSError,
+                asyncio.TimeoutError,
+                asyncio.IncompleteReadError,
+            ) as error:
+                writer.close()
+                raise RconUnavailable(f"Can't log in: {error}") from error
+            if request_id == -1:
+                writer.close()
+                raise RconUnavailable("Wrong RCON password")
+            self.reader, self.writer = reader, writer
+            self.read_task = asyncio.create_task(self.read_responses())
+
+    async def read_responses(self):
+        try:
+            while True:
+                request_id, _, payload = await read_packet(self.reader)
+                if request_id in self.markers:
+                    self.finish(self.markers.pop(request_id))
+                elif request_id in self.fragments:
+                    self.fragments[request_id].append(payload)
+        except (asyncio.IncompleteReadError, OSError):
+            self.close(ConnectionError("RCON connection lost"))
+
+    def finish(self, command_id: int):
+        future = self.pending.pop(command_id, None)
+        fragments = self.fragments.pop(command_id, [])
+        if future is not None and not future.done():
+            future.set_result("".join(fragments))
+
+    async def command(self, command: str) -> str:
+        """
+        Runs ``command`` and returns its response. Raises RconUnavailable
+        if it couldn't be sent, and ConnectionError or TimeoutError when it
+        was sent but the response never came.
+        """
+        await self.connect()
+        command_id = self.allocate_id()
+        marker_id = self.allocate_id()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[command_id] = future
+        self.fragments[command_id] = []
+        self.markers[marker_id] = command_id
+        self.writer.write(
+            encode_packet(command_id, COMMAND, command)
+            + encode_packet(marker_id, RESPONSE_VALUE, "")
+        )
+        try:
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.pending.pop(command_id, None)
+            self.fragments.pop(command_id, None)
+            self.markers.pop(marker_id, None)
+
+    def close(self, error: Optional[Exception] = None):
+        if self.writer is not None:
+            self.writer.close()
+        if self.read_task is not None and (
+            self.read_task is not asyncio.current_task()
+        ):
+            self.read_task.cancel()
+        self.reader = self.writer = self.read_task = None
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(
+                    error or ConnectionError("RCON connection closed")
+                )
+        self.pending.clear()
+        self.fragments.clear()
+        self.markers.clear()
+
+
+class RconServer:
+    """
+    Stands in for the RCON listener of a Minecraft server. Commands are
+    answered by ``handler`` and long answers are split in 4096 byte packets,
+    like the real server does.
+    """
+
+    def __init__(
+        self,
+        password: str,
+        handler: Optional[Callable[[str], str]] = None,
+    ):
+        self.password = password
+        self.handler = handler or (lambda command: f"Ran: {command}")
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        authenticated = False
+        try:
+            while True:
+                request_id, packet_type, payload = await read_packet(reader)
+                if packet_type == LOGIN:
+                    authenticated = payload == self.password
+                    writer.write(
+                        encode_packet(
+                            request_id if authenticated else -1,
+                            AUTH_RESPONSE,
+                            "",
+                        )
+                    )
+                elif not authenticated:
+                    writer.write(encode_packet(-1, AUTH_RESPONSE, ""))
+                elif packet_type == COMMAND:
+                    response = self.handler(payload)
+                    for start in range(
+                        0, max(len(response), 1), MAX_RESPONSE_PAYLOAD
+                    ):
+                        writer.write(
+                            encode_packet(
+                                request_id,
+                                RESPONSE_VALUE,
+                                response[start : start + MAX_RESPONSE_PAYLOAD],
+                            )
+                        )
+                else:
+                    writer.write(
+                        encode_packet(
+                            request_id,
+                            RESPONSE_VALUE,
+                            f"Unknown request {packet_type:x}",
+                        )
+                    )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, password: str):
+    server = RconServer(password)
+    port = await server.start(host, port)
+    print(f"RCON stand-in listening on {host}:{port}")
+    await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RCON stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=25575)
+    parser.add_argument("--password", required=True)
+    options = parser.parse_args()
+    asyncio.run(serve(options.host, options.port, options.password))
@@ -0,0 +1,254 @@
+import asyncio
+import enum
+import os
+import re
+import signal
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+from cogs.minecraftserver.logs import LogBuffer, LogLine
+from cogs.minecraftserver.rcon import RconClient, RconUnavailable
+from utils.functions import get_env_variable
+
+# Longest console line kept whole, longer ones are truncated. asyncio's
+# default of 64 KiB is too little for some mod stack traces.
+OUTPUT_LINE_LIMIT = 1024 * 1024
+
+
+class ServerNotRunning(Exception):
+    pass
+
+
+class ServerAlreadyRunning(Exception):
+    pass
+
+
+async def read_line(stream: asyncio.StreamReader) -> bytes:
+    """
+    The next line of ``stream``, cut at ``OUTPUT_LINE_LIMIT`` bytes when
+    it's longer, or an empty string at the end of the stream.
+    """
+    try:
+        return await stream.readuntil(b"\n")
+    except asyncio.IncompleteReadError as error:
+        return error.partial
+    except asyncio.LimitOverrunError as error:
+        line = (await stream.readexactly(error.consumed))[:OUTPUT_LINE_LIMIT]
+    # The rest of the line is dropped.
+    while True:
+        try:
+            await stream.readuntil(b"\n")
+            return line + b"\n"
+        except asyncio.IncompleteReadError:
+            return line
+        except asyncio.LimitOverrunError as error:
+            await stream.readexactly(error.consumed)
+
+
+def detect_version(line: str) -> Optional[str]:
+    match = re.search(r"Starting minecraft server version (\S+)", line)
+    return match.group(1) if match else None
+
+
+class ServerState(enum.Enum):
+    STOPPED = "stopped"
+    STARTING = "starting"
+    RUNNING = "running"
+    STOPPING = "stopping"
+
+
+class MinecraftServer:
+    """
+    Runs the Minecraft server in ``path`` as an asyncio subprocess.
+
+    Nothing here waits on the JVM: commands are written to its stdin without
+    blocking, its output is consumed by a reader task and stopping it is
+    bounded by timeouts that escalate to terminate and then kill. Servers
+    with RCON enabled run commands through it instead, so their output can
+    be returned.
+
+    The same instance is reused every time the version is started, so its
+    log and listeners outlive a single run.
+    """
+
+    minecraft_executable = "server.jar"
+
+    def __init__(self, path: Path, stop_timeout: float = 60):
+        self.path = path
+        self.name = path.name
+        self.stop_timeout = stop_timeout
+        self.java_executable = get_env_variable("JAVA_EXECUTABLE")
+        self.memory: Optional[str] = None
+        self.port: Optional[int] = None
+        self.rcon: Optional[RconClient] = None
+        self.launched_at: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+        self.ready = asyncio.Event()
+        self.minecraft_version: Optional[str] = None
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.state = ServerState.STOPPED
+        self.reader_task: Optional[asyncio.Task] = None
+        self.log = LogBuffer()
+        self.log_listeners: List[Callable[[LogLine], None]] = []
+
+    @property
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def rcon_port(self) -> Optional[int]:
+        return self.rcon.port if self.rcon else None
+
+    async def run(
+        self,
+        memory: str,
+        port: int,
+        rcon_port: Optional[int] = None,
+        rcon_password: Optional[str] = None,
+        jvm_flags: Sequence[str] = (),
+    ):
+        if self.state is not ServerState.STOPPED:
+            raise ServerAlreadyRunning
+        command = [
+            self.java_executable,
+            f"-Xmx{memory}",
+            f"-Xms{memory}",
+            *jvm_flags,
+            "-jar",
+            f"{self.path}/{self.minecraft_executable}",
+            "--port",
+            str(port),
+            "nogui",
+        ]
+        self.state = ServerState.STARTING
+        self.memory = memory
+        self.port = port
+        self.rcon = (
+            RconClient("127.0.0.1", rcon_port, rcon_password)
+            if rcon_port
+            else None
+        )
+        self.log.clear()
+        self.ready = asyncio.Event()
+        self.ready_seconds = None
+        self.launched_at = time.monotonic()
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                stdin=asyncio.subprocess.PIPE,
+                cwd=self.path,
+                limit=OUTPUT_LINE_LIMIT,
+            )
+        except OSError:
+            self.state = ServerState.STOPPED
+            raise
+        self.reader_task = asyncio.create_task(self.read_output())
+        print(f"Started {self.name} on port {port}: {self.process.pid}")
+
+    async def read_output(self):
+        # If this stopped reading, the JVM would block once the pipe is full,
+        # and the server would never be seen as stopped.
+        try:
+            while True:
+                raw_line = await read_line(self.process.stdout)
+                if not raw_line:
+                    break
+                line = self.log.append(raw_line.decode(errors="replace"))
+                if self.state is ServerState.STARTING:
+                    if "Done (" in line.text:
+                        self.state = ServerState.RUNNING
+                        self.ready_seconds = (
+                            time.monotonic() - self.launched_at
+                        )
+                        self.ready.set()
+                    self.minecraft_version = (
+                        detect_version(line.text) or self.minecraft_version
+                    )
+                for listener in list(self.log_listeners):
+                    try:
+                        listener(line)
+                    except Exception as error:
+                        print(f"Log listener of {self.name} failed: {error!r}")
+            await self.process.wait()
+            print(
+                f"Process {self.process.pid} exited: "
+                f"{self.process.returncode}"
+            )
+        finally:
+            if self.rcon:
+                self.rcon.close()
+            self.state = ServerState.STOPPED
+            self.ready.set()
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until the server printed its "Done" line and players can
+        join. False if it exited before that.
+        """
+        await asyncio.wait_for(self.ready.wait(), timeout)
+        return self.ready_seconds is not None
+
+    async def wait_stopped(self):
+        if self.reader_task:
+            await asyncio.shield(self.reader_task)
+
+    async def stop(self):
+        if not self.is_running:
+            return
+        self.state = ServerState.STOPPING
+        print(f"Stopping process: {self.process.pid}")
+        try:
+            await self.write_command("stop")
+            await asyncio.wait_for(self.process.wait(), self.stop_timeout)
+        except (asyncio.TimeoutError, ConnectionError, ServerNotRunning):
+            await self.escalate_stop()
+        await self.wait_stopped()
+        self.state = ServerState.STOPPED
+
+    async def escalate_stop(self, grace_period: float = 10):
+        if not self.is_running:
+            return
+        print(f"Terminating process: {self.process.pid}")
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), grace_period)
+        except asyncio.TimeoutError:
+            print(f"Killing process: {self.process.pid}")
+            self.process.kill()
+            await self.process.wait()
+
+    async def execute_command(
+        self, cmd: str, timeout: float = 5
+    ) -> Optional[str]:
+        """
+        Runs ``cmd`` and returns its output, or None when the server has no
+        RCON and the command could only be written to its console.
+        """
+        if not self.is_running:
+            raise ServerNotRunning
+        if self.rcon and self.state is ServerState.RUNNING:
+            try:
+                return await self.rcon.command(cmd)
+            except RconUnavailable as error:
+                print(f"RCON unavailable on {self.name}, using stdin: {error}")
+        await self.write_command(cmd, timeout)
+        return None
+
+    async def write_command(self, cmd: str, timeout: float = 5):
+        if not self.is_running:
+            raise ServerNotRunning
+        self.process.stdin.write(f"{cmd}\n".encode())
+        # Only waits if the pipe is full, which means the JVM is stuck.
+        await asyncio.wait_for(self.process.stdin.drain(), timeout)
+
+    def terminate(self):
+        # Runs at interpreter exit, when the event loop is already gone.
+        # The server saves the worlds in its SIGTERM shutdown hook.
+        if self.is_running:
+            try:
+                os.kill(self.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
@@ -0,0 +1,340 @@
+"""
+Health samples of the running servers.
+
+Tick times and players come from RCON, heap usage from the hsperfdata file
+the JVM keeps updated in /tmp, and memory and CPU from /proc. The files are
+read in a worker thread, and the sampler sleeps on an event while no server
+runs, so an idle bot does no work at all.
+"""
+
+import asyncio
+import getpass
+import os
+import re
+import struct
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from aiohttp import web
+
+from cogs.minecraftserver.pool import ServerPool
+from cogs.minecraftserver.rcon import RconError
+from cogs.minecraftserver.server import MinecraftServer, ServerState
+
+HSPERFDATA_MAGIC = b"\xca\xfe\xc0\xc0"
+# Queried in order until one answers, "tick query" is vanilla since 1.20.3
+# and "mspt" is Paper.
+TICK_COMMANDS = ["tick query", "mspt"]
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    tps: Optional[float]
+    mspt: Optional[float]
+    players: Optional[int]
+    max_players: Optional[int]
+    heap_used: Optional[int]
+    heap_max: Optional[int]
+    rss: Optional[int]
+    cpu: Optional[float]
+
+
+def strip_formatting(text: str) -> str:
+    return re.sub(r"§.", "", text)
+
+
+def parse_players(text: str) -> Tuple[Optional[int], Optional[int]]:
+    match = re.search(
+        r"There are (\d+)(?:/| of a max(?: of)? )(\d+) players online",
+        strip_formatting(text),
+    )
+    if match is None:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+def parse_tick_times(text: str) -> Tuple[Optional[float], Optional[float]]:
+    """
+    The TPS and MSPT in the output of ``tick query`` or Paper's ``mspt``.
+    """
+    text = strip_formatting(text)
+    match = re.search(r"Average time per tick: ([\d.]+)ms", text) or (
+        re.search(r"◴\s*([\d.]+)", text)
+    )
+    if match is None:
+        return None, None
+    mspt = float(match.group(1))
+    rate = re.search(r"Target tick rate: ([\d.]+)", text)
+    target = float(rate.group(1)) if rate else 20.0
+    return min(target, 1000 / mspt) if mspt else target, mspt
+
+
+def read_perf_counters(pid: int) -> Dict[str, int]:
+    """
+    The long counters in the hsperfdata file of the JVM ``pid``, the same
+    ones jstat reads. Empty if the JVM runs with -XX:-UsePerfData.
+    """
+    path = Path("/tmp") / f"hsperfdata_{getpass.getuser()}" / str(pid)
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return {}
+    if data[:4] != HSPERFDATA_MAGIC:
+        return {}
+    order = ">" if data[4] == 0 else "<"
+    entry_offset, entries = struct.unpack_from(f"{order}ii", data, 24)
+    counters = {}
+    for _ in range(entries):
+        (
+            length,
+            name_offset,
+            vector_length,
+            data_type,
+            _,
+            _,
+            _,
+            data_offset,
+        ) = struct.unpack_from(f"{order}iiicbbbi", data, entry_offset)
+        if data_type == b"J" and vector_length == 0:
+            name_start = entry_offset + name_offset
+            name = data[name_start : data.index(b"\0", name_start)]
+            (counters[name.decode("ascii", "replace")],) = struct.unpack_from(
+                f"{order}q", data, entry_offset + data_offset
+            )
+        entry_offset += length
+    return counters
+
+
+def read_heap(pid: int) -> Tuple[Optional[int], Optional[int]]:
+    counters = read_perf_counters(pid)
+    if not counters:
+        return None, None
+    used = max_capacity = 0
+    for name, value in counters.items():
+        # Generation 0 is young and 1 is old, the rest isn't heap.
+        if re.fullmatch(r"sun\.gc\.generation\.[01]\.space\.\d+\.used", name):
+            used += value
+        elif re.fullmatch(r"sun\.gc\.generation\.[01]\.maxCapacity", name):
+            max_capacity += value
+    return used, max_capacity
+
+
+def read_process(pid: int) -> Tuple[Optional[int], Optional[float]]:
+    """
+    The resident memory of ``pid`` in bytes and the CPU seconds it used.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            # The command name can have spaces, the fields start after it.
+            fields = stat_file.read().rpartition(")")[2].split()
+        with open(f"/proc/{pid}/status") as status_file:
+            rss = next(
+                int(line.split()[1]) * 1024
+                for line in status_file
+                if line.startswith("VmRSS:")
+            )
+    except (OSError, StopIteration):
+        return None, None
+    cpu_time = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss, cpu_time
+
+
+def read_process_sample(pid: int):
+    return read_process(pid), read_heap(pid)
+
+
+def escape_label(value: str) -> str:
+    """
+    ``value`` as a Prometheus label value, which is quoted.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def sparkline(values: List[Optional[float]]) -> str:
+    known = [value for value in values if value is not None]
+    if not known:
+        return ""
+    low, high = min(known), max(known)
+    steps = len(SPARK_BLOCKS) - 1
+    return "".join(
+        (
+            " "
+            if value is None
+            else SPARK_BLOCKS[
+                (
+                    round((value - low) / (high - low) * steps)
+                    if high > low
+                    else 0
+                )
+            ]
+        )
+        for value in values
+    )
+
+
+class TelemetrySampler:
+    """
+    Samples every running server each ``interval`` seconds and keeps the
+    last ``maxlen`` samples of each one.
+    """
+
+    def __init__(self, pool: ServerPool, interval: float = 15, maxlen=240):
+        self.pool = pool
+        self.interval = interval
+        self.maxlen = maxlen
+        self.samples: Dict[str, Deque[Sample]] = {}
+        # CPU seconds and when they were read, per process.
+        self.cpu_times: Dict[int, Tuple[float, float]] = {}
+        # The command that reports tick times, per process. None when the
+        # server understood none of them.
+        self.tick_commands: Dict[int, Optional[str]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def latest(self, server: MinecraftServer) -> Optional[Sample]:
+        samples = self.samples.get(server.name)
+        return samples[-1] if samples else None
+
+    async def run(self):
+        while True:
+            if not self.pool.running():
+                self.cpu_times.clear()
+                self.tick_commands.clear()
+                self.pool.started.clear()
+                await self.pool.started.wait()
+                continue
+            started = time.monotonic()
+            running = self.pool.running()
+            await asyncio.gather(
+                *(
+                    self.sample(server)
+                    for server in running
+                    if server.state is ServerState.RUNNING
+                )
+            )
+            alive = {server.process.pid for server in running}
+            for per_process in (self.cpu_times, self.tick_commands):
+                for pid in per_process.keys() - alive:
+                    del per_process[pid]
+            await asyncio.sleep(
+                max(self.interval - (time.monotonic() - started), 0)
+            )
+
+    async def sample(self, server: MinecraftServer):
+        pid = server.process.pid
+        (rss, cpu_time), (heap_used, heap_max) = await asyncio.to_thread(
+            read_process_sample, pid
+        )
+        now = time.monotonic()
+        cpu = None
+        if cpu_time is not None:
+            previous = self.cpu_times.get(pid)
+            if previous is not None and now > previous[1]:
+                cpu = (cpu_time - previous[0]) / (now - previous[1]) * 100
+            self.cpu_times[pid] = cpu_time, now
+
+        players = max_players = tps = mspt = None
+        if server.rcon is not None:
+            try:
+                players, max_players = parse_players(
+                    await server.rcon.command("list")
+                )
+                tps, mspt = await self.query_tick_times(server)
+            except (RconError, ConnectionError, asyncio.TimeoutError):
+                pass
+
+        samples = self.samples.get(server.name)
+        if samples is None:
+            samples = self.samples[server.name] = deque(maxlen=self.maxlen)
+        samples.append(
+            Sample(
+                time.time(),
+                tps,
+                mspt,
+                players,
+                max_players,
+                heap_used,
+                heap_max,
+                rss,
+                cpu,
+            )
+        )
+
+    async def query_tick_times(self, server: MinecraftServer):
+        pid = server.process.pid
+        if pid in self.tick_commands:
+            command = self.tick_commands[pid]
+            if command is None:
+                return None, None
+            return parse_tick_times(await server.rcon.command(command))
+        for command in TICK_COMMANDS:
+            tps, mspt = parse_tick_times(await server.rcon.command(command))
+            if mspt is not None:
+                self.tick_commands[pid] = command
+                return tps, mspt
+        self.tick_commands[pid] = None
+        return None, None
+
+    def render_metrics(self) -> str:
+        """
+        The latest sample of every running server in the Prometheus text
+        format.
+        """
+        metrics = [
+            ("minecraft_tps", "Ticks per second", "tps"),
+            ("minecraft_mspt", "Milliseconds per tick", "mspt"),
+            ("minecraft_players", "Players online", "players"),
+            ("minecraft_heap_used_bytes", "JVM heap in use", "heap_used"),
+            ("minecraft_heap_max_bytes", "JVM heap limit", "heap_max"),
+            ("minecraft_rss_bytes", "Resident memory", "rss"),
+            ("minecraft_cpu_percent", "CPU usage", "cpu"),
+        ]
+        running = self.pool.running()
+        lines = [
+            "# HELP minecraft_up Whether the server is running",
+            "# TYPE minecraft_up gauge",
+        ]
+        labels = {
+            server.name: f'{{server="{escape_label(server.name)}"}}'
+            for server in running
+        }
+        lines.extend(
+            f"minecraft_up{labels[server.name]} 1" for server in running
+        )
+        for name, description, field in metrics:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            for server in running:
+                sample = self.latest(server)
+                value = getattr(sample, field) if sample else None
+                if value is not None:
+                    lines.append(f"{name}{labels[server.name]} {value}")
+        return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(
+    sampler: TelemetrySampler, host: str, port: int
+) -> web.AppRunner:
+    async def metrics(_):
+        return web.Response(
+            text=sampler.render_metrics(), content_type="text/plain"
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Serving Minecraft metrics on http://{host}:{port}/metrics")
+    return runner
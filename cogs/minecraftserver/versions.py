@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from cogs.minecraftserver.properties import read_properties
+from cogs.minecraftserver.server import MinecraftServer
+
+INDEX_FILE_NAME = ".versions.json"
+
+
+class VersionInfo(NamedTuple):
+    id: int
+    name: str
+    jar_size: Optional[int] = None
+    jar_mtime: Optional[float] = None
+    jar_sha1: Optional[str] = None
+    minecraft_version: Optional[str] = None
+    level_mtime: Optional[float] = None
+    world_size: Optional[int] = None
+
+    @property
+    def last_played(self) -> Optional[float]:
+        # The server writes level.dat on every save, the last one is when
+        # it stopped.
+        return self.level_mtime
+
+
+def read_jar_version(jar: Path) -> Optional[str]:
+    """
+    The Minecraft version in the ``version.json`` that server jars include
+    since 1.14, None for older jars.
+    """
+    try:
+        with zipfile.ZipFile(jar) as archive:
+            with archive.open("version.json") as version_file:
+                return json.load(version_file).get("name")
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def directory_size(path: Path) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def level_name(path: Path) -> str:
+    return read_properties(path).get("level-name") or "world"
+
+
+def jar_changed(path: Path, info: VersionInfo) -> bool:
+    """
+    Whether the jar of the ``path`` folder was replaced, added or removed
+    since ``info`` was scanned.
+    """
+    try:
+        jar_stat = (path / MinecraftServer.minecraft_executable).stat()
+    except OSError:
+        return info.jar_size is not None
+    return (jar_stat.st_size, jar_stat.st_mtime) != (
+        info.jar_size,
+        info.jar_mtime,
+    )
+
+
+def scan_version(path: Path, previous: VersionInfo) -> VersionInfo:
+    """
+    Updates ``previous`` with what changed on disk. The jar is only hashed
+    when its size or mtime changed and the world is only measured when its
+    level.dat was written, so rescanning an idle folder costs a few stats.
+    """
+    info = previous
+    jar = path / MinecraftServer.minecraft_executable
+    try:
+        jar_stat = jar.stat()
+    except OSError:
+        info = info._replace(jar_size=None, jar_mtime=None, jar_sha1=None)
+    else:
+        if (jar_stat.st_size, jar_stat.st_mtime) != (
+            info.jar_size,
+            info.jar_mtime,
+        ):
+            info = info._replace(
+                jar_size=jar_stat.st_size,
+                jar_mtime=jar_stat.st_mtime,
+                jar_sha1=hash_file(jar),
+                minecraft_version=read_jar_version(jar)
+                or info.minecraft_version,
+            )
+
+    world = path / level_name(path)
+    try:
+        level_mtime = (world / "level.dat").stat().st_mtime
+    except OSError:
+        level_mtime = None
+    if level_mtime != info.level_mtime or info.world_size is None:
+        info = info._replace(
+            level_mtime=level_mtime,
+            world_size=directory_size(world) if level_mtime else 0,
+        )
+    return info
+
+
+class VersionIndex:
+    """
+    The server folders in ``versions/`` and what is known about them, kept
+    in memory and saved next to the folder in ``.versions.json``.
+
+    A folder keeps its ID for as long as it exists and IDs are never
+    reused, so the ID someone read in a listing always points to the same
+    server. The index is rescanned off the event loop when the mtime of
+    ``versions/`` changes, which happens when folders are added, removed or
+    renamed. Otherwise only the versions whose jar changed are rescanned,
+    and a single version is rescanned after it runs.
+    """
+
+    def __init__(self, folder: Path, poll_interval: float = 30):
+        self.folder = folder
+        # Outside the folder, otherwise saving it would change the mtime
+        # that tells when to rescan.
+        self.index_file = folder.with_name(INDEX_FILE_NAME)
+        self.poll_interval = poll_interval
+        self.versions: Dict[str, VersionInfo] = {}
+        self.next_id = 1
+        self.folder_mtime: Optional[float] = None
+        self.lock = asyncio.Lock()
+        self.watch_task: Optional[asyncio.Task] = None
+        self.load()
+
+    def __len__(self):
+        return len(self.versions)
+
+    def list(self) -> List[VersionInfo]:
+        return sorted(self.versions.values(), key=lambda info: info.id)
+
+    def get(self, version_id: int) -> Optional[VersionInfo]:
+        for info in self.versions.values():
+            if info.id == version_id:
+                return info
+        return None
+
+    def path(self, info: VersionInfo) -> Path:
+        return (self.folder / info.name).resolve()
+
+    def load(self):
+        try:
+            with open(self.index_file) as index_file:
+                data = json.load(index_file)
+        except (OSError, ValueError):
+            return
+        self.next_id = data["next_id"]
+        self.folder_mtime = data["folder_mtime"]
+        self.versions = {
+            version["name"]: VersionInfo(**version)
+            for version in data["versions"]
+        }
+
+    def save(self):
+        data = {
+            "next_id": self.next_id,
+            "folder_mtime": self.folder_mtime,
+            "versions": [info._asdict() for info in self.list()],
+        }
+        temporary = self.index_file.with_suffix(".tmp")
+        with open(temporary, "w") as index_file:
+            json.dump(data, index_file, indent=2)
+        os.replace(temporary, self.index_file)
+
+    def scan(self, force: bool = False) -> bool:
+        """
+        Rescans the folders if ``versions/`` changed since the last scan, or
+        only the ones whose jar changed if it didn't. Blocks on the disk,
+        the event loop should go through ``refresh``.
+        """
+        try:
+            folder_mtime = self.folder.stat().st_mtime
+        except OSError:
+            return False
+        if folder_mtime == self.folder_mtime and not force:
+            changed = [
+                name
+                for name, info in self.versions.items()
+                if jar_changed(self.folder / name, info)
+            ]
+            for name in changed:
+                self.versions[name] = scan_version(
+                    self.folder / name, self.versions[name]
+                )
+            if changed:
+                self.save()
+            return bool(changed)
+        versions = {}
+        next_id = self.next_id
+        for path in sorted(self.folder.iterdir()):
+            if not path.is_dir():
+                continue
+            previous = self.versions.get(path.name)
+            if previous is None:
+                previous = VersionInfo(id=next_id, name=path.name)
+                next_id += 1
+            versions[path.name] = scan_version(path, previous)
+        self.versions = versions
+        self.next_id = next_id
+        self.folder_mtime = folder_mtime
+        self.save()
+        return True
+
+    def scan_one(
+        self, name: str, minecraft_version: Optional[str] = None
+    ) -> Optional[VersionInfo]:
+        info = self.versions.get(name)
+        if info is None:
+            return None
+        if minecraft_version and not info.minecraft_version:
+            info = info._replace(minecraft_version=minecraft_version)
+        info = self.versions[name] = scan_version(self.folder / name, info)
+        self.save()
+        return info
+
+    async def refresh(self, force: bool = False) -> bool:
+        async with self.lock:
+            return await asyncio.to_thread(self.scan, force)
+
+    async def refresh_version(
+        self, name: str, minecraft_version: Optional[str] = None
+    ) -> Optional[VersionInfo]:
+        async with self.lock:
+            return await asyncio.to_thread(
+                self.scan_one, name, minecraft_version
+            )
+
+    def start(self):
+        if self.watch_task is None:
+            self.watch_task = asyncio.create_task(self.watch())
+
+    def stop(self):
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            self.watch_task = None
+
+    async def watch(self):
+        while True:
+            started = time.perf_counter()
+            if await self.refresh():
+                print(
+                    f"Indexed {len(self)} server versions in "
+                    f"{time.perf_counter() - started:.2f}s"
+                )
+            await asyncio.sleep(self.poll_interval)
+
+
+def format_size(size: Optional[int]) -> str:
+    size = size or 0
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+def format_age(timestamp: Optional[float]) -> str:
+    if timestamp is None:
+        return "never played"
+    seconds = max(time.time() - timestamp, 0)
+    for unit, length in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= length:
+            return f"played {seconds // length:.0f}{unit} ago"
+    return "played just now"
@@ -1,7 +1,7 @@
-import asyncio
 import datetime
-from random import choice
-from typing import Dict, List
+import re
+from math import ceil
+from typing import Dict, List, Optional, Tuple
 
 import discord
 from discord import Embed
@@ -11,65 +11,119 @@ from discord_slash.utils.manage_commands import create_option
 from discord_slash.utils.manage_components import (
     create_button,
     create_actionrow,
-    wait_for_component,
 )
-from imdb import IMDb, IMDbError, Person
-from sqlalchemy import select, update
-from sqlalchemy.exc import NoResultFound
-from sqlalchemy.future import Engine
-from sqlalchemy.orm import Session
-
-from cogs.movies.models import Movie, ConfigVariable
-from utils.constants import EMBED_COLORS, GUILD_CONFIG_VARIABLES
+
+from cogs.movies.cache import (
+    LIST_FILTERS,
+    GuildConfigCache,
+    PageCache,
+    RenderedPage,
+)
+from cogs.movies.metadata import ImdbUnavailable, MovieMetadataCache
+from cogs.movies.models import Movie
+from cogs.movies.repository import MovieRepository
+from utils.constants import (
+    EMBED_COLORS,
+    MOVIES_BULK_ADD_LIMIT,
+    MOVIES_PAGE_CACHE_SIZE,
+    MOVIES_PAGE_SIZE,
+)
 from utils.functions import generate_loading_embed
 
+# Custom IDs of the watchlist buttons are this, the filter, the direction
+# and the movie ID to seek from, and the number of the page they lead to.
+LIST_PAGE_COMPONENT = "movie_list_page"
+
 
 class MovieCogNotConfigured(Exception):
     pass
 
 
+def parse_page_button_id(
+    custom_id: str,
+) -> Tuple[Optional[str], Optional[int], Optional[int], int]:
+    """
+    The filter, the ``after_id`` or ``before_id`` and the page number in
+    the custom ID of a watchlist button. Raises ValueError if it isn't one.
+    """
+    component, filter_name, direction, movie_id, number = custom_id.split(":")
+    filter_by = None if filter_name == "all" else filter_name
+    if (
+        component != LIST_PAGE_COMPONENT
+        or filter_by not in LIST_FILTERS
+        or direction not in ("after", "before")
+    ):
+        raise ValueError(f"Not a watchlist button: {custom_id}")
+    if direction == "after":
+        return filter_by, int(movie_id), None, max(int(number), 0)
+    return filter_by, None, int(movie_id), max(int(number), 0)
+
+
+def page_count(page: RenderedPage, number: int) -> int:
+    return max(ceil(page.total / MOVIES_PAGE_SIZE), number + 1)
+
+
 class Movies(commands.Cog):
     group_name = "movie"
 
-    def __init__(self, bot: commands.Bot, db_engine: Engine):
+    def __init__(self, bot: commands.Bot, repository: MovieRepository):
         self.bot = bot
-        self.db = db_engine
-        self.imdb = IMDb()
-        self.currently_watching: Dict[int, Movie] = dict()
+        self.repository = repository
+        self.metadata = MovieMetadataCache(repository)
+        self.config_cache = GuildConfigCache()
+        # Every change to a guild's movies goes through this cog, which
+        # invalidates the guild's pages.
+        self.page_cache = PageCache(MOVIES_PAGE_CACHE_SIZE)
+        # Read-through copy of the watch_sessions table. A guild's commands
+        # are always handled by the process that owns its shard, so this
+        # copy can't go stale, starting a session is still guarded by the
+        # table's primary key.
+        self.currently_watching: Dict[int, Optional[Movie]] = dict()
         self.default_idle_message = "Assistindo nada 😴"
 
-    def get_config_variable(self, guild_id: int, var_name: str):
-        with Session(self.db) as session:
-            config_var = session.execute(
-                select(ConfigVariable).where(
-                    ConfigVariable.guild_id == str(guild_id),
-                    ConfigVariable.key == var_name,
-                )
-            ).one()
-
-        return config_var[0].value
-
-    def get_config_variables(self, guild_id: int):
-        configs = dict()
-        with Session(self.db) as session:
-            for var_name in GUILD_CONFIG_VARIABLES:
-                var_model = session.execute(
-                    select(ConfigVariable).where(
-                        ConfigVariable.guild_id == str(guild_id),
-                        ConfigVariable.key == var_name,
-                    )
-                ).scalar_one()
-                if var_model.value is None:
-                    raise MovieCogNotConfigured
-                configs[var_name] = var_model.value
+    @commands.Cog.listener()
+    async def on_ready(self):
+        guild_ids = [guild.id for guild in self.bot.guilds]
+        self.config_cache.warm(
+            await self.repository.load_config_variables(guild_ids)
+        )
+        self.currently_watching = await self.repository.load_watching_movies(
+            guild_ids
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.config_cache.evict(guild.id)
+        self.currently_watching.pop(guild.id, None)
+        self.page_cache.evict(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_update(
+        self, before: discord.Guild, after: discord.Guild
+    ):
+        # The name is the title of the pages.
+        if before.name != after.name:
+            self.page_cache.invalidate(after.id)
+
+    async def get_currently_watching(self, guild_id: int) -> Optional[Movie]:
+        if guild_id not in self.currently_watching:
+            self.currently_watching[guild_id] = (
+                await self.repository.get_watching_movie(guild_id)
+            )
+        return self.currently_watching[guild_id]
+
+    async def get_config_variables(self, guild_id: int):
+        configs = self.config_cache.get(guild_id)
+        if configs is None:
+            configs = await self.repository.get_config_variables(guild_id)
+            self.config_cache.set(guild_id, configs)
+        if any(value is None for value in configs.values()):
+            raise MovieCogNotConfigured
         return configs
 
-    @staticmethod
-    def get_directors_string(directors_data):
-        director_names = [director.data["name"] for director in directors_data]
-        if len(director_names) == 1:
-            return director_names[0]
-        return f"{', '.join(director_names[:-1])} and {director_names[-1]}"
+    async def set_config_variable(self, guild_id: int, key: str, value):
+        await self.repository.set_config_variable(guild_id, key, str(value))
+        self.config_cache.update(guild_id, key, str(value))
 
     @cog_ext.cog_subcommand(
         base=group_name,
@@ -87,94 +141,135 @@ class Movies(commands.Cog):
         ],
     )
     async def list_movies(self, ctx: commands.Context, filter_by: str = None):
-        buttons = [
-            create_button(
-                style=ButtonStyle.primary,
-                label="Previous",
-            ),
-            create_button(style=ButtonStyle.primary, label="Next"),
-        ]
-        current_embed = 0
         message = await ctx.send(embed=generate_loading_embed())
-        embeds: List[Embed] = []
-
-        with Session(self.db) as session:
-            filters = [Movie.guild_id == ctx.guild.id]
-            if filter_by == "watched":
-                filters.append(Movie.watched_date.is_not(None))
-            elif filter_by == "non-watched":
-                filters.append(Movie.watched_date.is_(None))
-            for rows in session.execute(
-                select(Movie).where(*filters)
-            ).partitions(size=10):
-                description = ":white_check_mark:=Watched --- :x:=Not Watched"
-                if filter_by == "watched":
-                    description = ":white_check_mark:=Watched"
-                elif filter_by == "non-watched":
-                    description = ":x:=Not Watched"
-                embed = discord.Embed(
-                    title=f"{ctx.guild.name} watchlist",
-                    description=description,
-                    color=EMBED_COLORS["ready"],
-                )
-                for movie in rows:
-                    movie = movie[0]
 
-                    emote = (
-                        ":white_check_mark:" if movie.watched_date else ":x:"
-                    )
-                    embed.add_field(
-                        name=f"{emote} {movie.imdb_id} - {movie.title}",
-                        value=f"IMDb rating: {movie.rating}"
-                        f"{f' - Watched on: {movie.watched_date}' if movie.watched_date else ''}",
-                        inline=False,
-                    )
-                embeds.append(embed)
-        action_row = create_actionrow(*buttons)
-        if embeds:
-            embeds[current_embed].set_footer(
-                text=f"Page {current_embed + 1} of {len(embeds)}"
-            )
-            await message.edit(
-                embed=embeds[current_embed], components=[action_row]
-            )
-        else:
+        page = await self.get_list_page(ctx.guild, filter_by)
+        if page.first_id is None:
             await message.edit(
                 embed=Embed(
                     title="Movie list is empty", color=EMBED_COLORS["ready"]
                 )
             )
-        while True:
-            try:
-                button_ctx: ComponentContext = await wait_for_component(
-                    self.bot, components=action_row, timeout=60
-                )
-            except asyncio.exceptions.TimeoutError:
-                await message.edit(components=None)
-                break
-
-            if button_ctx.custom_id == buttons[0]["custom_id"]:
-                if current_embed == 0:
-                    await button_ctx.edit_origin(embed=embeds[current_embed])
-                else:
-                    current_embed -= 1
-                    embeds[current_embed].set_footer(
-                        text=f"Page {current_embed + 1} of {len(embeds)}"
-                    )
-                    await button_ctx.edit_origin(
-                        embed=embeds[current_embed], components=[action_row]
-                    )
-            elif button_ctx.custom_id == buttons[1]["custom_id"]:
-                if current_embed == len(embeds) - 1:
-                    await button_ctx.edit_origin(embed=embeds[current_embed])
-                else:
-                    current_embed += 1
-                    embeds[current_embed].set_footer(
-                        text=f"Page {current_embed + 1} of {len(embeds)}"
-                    )
-                    await button_ctx.edit_origin(
-                        embed=embeds[current_embed], components=[action_row]
-                    )
+            return
+
+        await message.edit(
+            embed=self.page_embed(page, 0),
+            components=self.page_buttons(filter_by, page, 0),
+        )
+
+    @cog_ext.cog_component(components=LIST_PAGE_COMPONENT)
+    async def show_list_page(self, ctx: ComponentContext):
+        """
+        Handles the buttons of every watchlist, also the ones sent before
+        a restart or by another process: what to show is in their custom
+        ID, nothing is kept between clicks.
+        """
+        try:
+            filter_by, after_id, before_id, number = parse_page_button_id(
+                ctx.custom_id
+            )
+        except ValueError:
+            await ctx.defer(edit_origin=True)
+            return
+        # The guild is the one the button was clicked in, not one the ID
+        # could name.
+        page = await self.get_list_page(
+            ctx.guild, filter_by, after_id=after_id, before_id=before_id
+        )
+        if page.first_id is None:
+            # The movies around it were removed since the page was sent.
+            await ctx.defer(edit_origin=True)
+            return
+        await ctx.edit_origin(
+            embed=self.page_embed(page, number),
+            components=self.page_buttons(filter_by, page, number),
+        )
+
+    @staticmethod
+    def page_buttons(
+        filter_by: Optional[str], page: RenderedPage, number: int
+    ) -> List[dict]:
+        filter_name = filter_by or "all"
+        return [
+            create_actionrow(
+                create_button(
+                    style=ButtonStyle.primary,
+                    label="Previous",
+                    custom_id=f"{LIST_PAGE_COMPONENT}:{filter_name}:"
+                    f"before:{page.first_id}:{number - 1}",
+                    disabled=number == 0,
+                ),
+                create_button(
+                    style=ButtonStyle.primary,
+                    label="Next",
+                    custom_id=f"{LIST_PAGE_COMPONENT}:{filter_name}:"
+                    f"after:{page.last_id}:{number + 1}",
+                    disabled=number + 1 >= page_count(page, number),
+                ),
+            )
+        ]
+
+    async def get_list_page(
+        self,
+        guild: discord.Guild,
+        filter_by: Optional[str],
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+    ) -> RenderedPage:
+        """
+        The page of the watchlist seeked from ``after_id`` or ``before_id``,
+        rendered. Only read and rendered if it isn't cached.
+        """
+        cursor: Tuple[Optional[int], Optional[int]] = (after_id, before_id)
+        page = self.page_cache.get(guild.id, filter_by, cursor)
+        if page is not None:
+            return page
+        generation = self.page_cache.generation(guild.id, filter_by)
+        movies, total = await self.repository.get_movies_page(
+            guild.id, filter_by, after_id=after_id, before_id=before_id
+        )
+        page = RenderedPage(
+            embed=self.build_list_embed(guild, filter_by, movies).to_dict(),
+            first_id=movies[0].id if movies else None,
+            last_id=movies[-1].id if movies else None,
+            total=total,
+        )
+        self.page_cache.put(guild.id, filter_by, generation, cursor, page)
+        return page
+
+    @staticmethod
+    def page_embed(page: RenderedPage, number: int) -> Embed:
+        embed = Embed.from_dict(page.embed)
+        embed.set_footer(
+            text=f"Page {number + 1} of {page_count(page, number)}"
+        )
+        return embed
+
+    @staticmethod
+    def build_list_embed(
+        guild: discord.Guild,
+        filter_by: Optional[str],
+        movies: List[Movie],
+    ) -> Embed:
+        description = ":white_check_mark:=Watched --- :x:=Not Watched"
+        if filter_by == "watched":
+            description = ":white_check_mark:=Watched"
+        elif filter_by == "non-watched":
+            description = ":x:=Not Watched"
+        embed = discord.Embed(
+            title=f"{guild.name} watchlist",
+            description=description,
+            color=EMBED_COLORS["ready"],
+        )
+        for movie in movies:
+            emote = ":white_check_mark:" if movie.watched_date else ":x:"
+            embed.add_field(
+                name=f"{emote} {movie.imdb_id} - {movie.title}",
+                value=f"IMDb rating: {movie.rating}"
+                f"{f' - Watched on: {movie.watched_date}' if movie.watched_date else ''}",
+                inline=False,
+            )
+        return embed
 
     @cog_ext.cog_subcommand(
         base=group_name,
@@ -185,72 +280,193 @@ class Movies(commands.Cog):
         message = await ctx.send(
             embed=generate_loading_embed("Searching for your movie...")
         )
-        with Session(self.db) as session:
-            try:
-                session.execute(
-                    select(Movie).filter_by(
-                        imdb_id=imdb_id, guild_id=ctx.guild.id
-                    )
-                ).scalar_one()
-                await message.edit(
-                    embed=Embed(
-                        title="This movie is already in the list!",
-                        color=EMBED_COLORS["error"],
-                    )
+        if await self.repository.get_movie(ctx.guild.id, imdb_id):
+            await message.edit(
+                embed=Embed(
+                    title="This movie is already in the list!",
+                    color=EMBED_COLORS["error"],
                 )
-            except NoResultFound:
-                try:
-                    data = self.imdb.get_movie(imdb_id).data
-                    title = data.get(
-                        "original title", data.get("localized title", "")
-                    )
-                    new_movie = Movie(
-                        imdb_id=imdb_id,
-                        title=title,
-                        year=data["year"],
-                        rating=data["rating"],
-                        guild_id=ctx.guild.id,
-                    )
-                except (IMDbError, KeyError):
-                    await message.edit(
-                        embed=Embed(
-                            title="Invalid movie ID",
-                            color=EMBED_COLORS["error"],
-                        )
-                    )
-                    return
+            )
+            return
 
-                session.add(new_movie)
-                session.flush()
-                session.commit()
+        try:
+            imdb_title = await self.metadata.get(imdb_id)
+        except ImdbUnavailable:
+            await message.edit(
+                embed=Embed(
+                    title="Couldn't reach IMDb, try again",
+                    color=EMBED_COLORS["error"],
+                )
+            )
+            return
+        if imdb_title is None:
+            await message.edit(
+                embed=Embed(
+                    title="Invalid movie ID",
+                    color=EMBED_COLORS["error"],
+                )
+            )
+            return
 
-                embed = Embed(
-                    title=f'{title} (:star: {data["rating"]})',
-                    description=f"[IMDb page](https://www.imdb.com/title/tt{imdb_id}/)",
-                    color=EMBED_COLORS["ready"],
+        new_movie = Movie(
+            imdb_id=imdb_id,
+            title=imdb_title.title,
+            year=imdb_title.year,
+            rating=imdb_title.rating,
+            guild_id=ctx.guild.id,
+        )
+        if not await self.repository.add_movie(new_movie):
+            await message.edit(
+                embed=Embed(
+                    title="This movie is already in the list!",
+                    color=EMBED_COLORS["error"],
                 )
-                embed.set_author(name="New movie added")
-                embed.add_field(
-                    name="Original Air Date", value=data["original air date"]
+            )
+            return
+        # New movies aren't watched, the watched pages don't change.
+        self.page_cache.invalidate(ctx.guild.id, (None, "non-watched"))
+
+        embed = Embed(
+            title=f"{imdb_title.title} (:star: {imdb_title.rating})",
+            description=f"[IMDb page](https://www.imdb.com/title/tt{imdb_id}/)",
+            color=EMBED_COLORS["ready"],
+        )
+        embed.set_author(name="New movie added")
+        if imdb_title.original_air_date:
+            embed.add_field(
+                name="Original Air Date", value=imdb_title.original_air_date
+            )
+        if imdb_title.directors:
+            embed.add_field(
+                name="Directed by", value=imdb_title.directors, inline=False
+            )
+        if imdb_title.cover_url:
+            embed.set_thumbnail(url=imdb_title.cover_url)
+        await message.edit(embed=embed)
+
+    @cog_ext.cog_subcommand(
+        base=group_name,
+        name="add_many",
+        description="Adds several movies to the list at once, "
+        "based on their IMDb IDs.",
+        options=[
+            create_option(
+                name="imdb_ids",
+                description="IMDb IDs separated by spaces or commas",
+                option_type=3,
+                required=True,
+            )
+        ],
+    )
+    async def add_many_movies(self, ctx: commands.Context, imdb_ids: str):
+        message = await ctx.send(
+            embed=generate_loading_embed("Searching for your movies...")
+        )
+        tokens = list(dict.fromkeys(re.split(r"[\s,]+", imdb_ids.strip())))
+        tokens = [token for token in tokens if token]
+        if len(tokens) > MOVIES_BULK_ADD_LIMIT:
+            await message.edit(
+                embed=Embed(
+                    title="Too many movies",
+                    description=f"You can add up to {MOVIES_BULK_ADD_LIMIT} "
+                    f"movies at once.",
+                    color=EMBED_COLORS["error"],
                 )
-                embed.add_field(
-                    name="Directed by",
-                    value=self.get_directors_string(data["directors"]),
-                    inline=False,
+            )
+            return
+
+        results: Dict[str, str] = dict.fromkeys(tokens, "Invalid movie ID")
+        tokens_by_id: Dict[int, str] = dict()
+        for token in tokens:
+            try:
+                imdb_id = int(token.lower().removeprefix("tt"))
+            except ValueError:
+                continue
+            if imdb_id in tokens_by_id:
+                results[token] = "Duplicated ID"
+            else:
+                tokens_by_id[imdb_id] = token
+
+        existing = await self.repository.get_existing_imdb_ids(
+            ctx.guild.id, list(tokens_by_id)
+        )
+        for imdb_id in existing:
+            results[tokens_by_id[imdb_id]] = "Already in the list"
+
+        to_fetch = [i for i in tokens_by_id if i not in existing]
+        imdb_titles = await self.metadata.get_many(to_fetch)
+        new_movies = []
+        for imdb_id in to_fetch:
+            if imdb_id not in imdb_titles:
+                results[tokens_by_id[imdb_id]] = (
+                    "Couldn't reach IMDb, try again"
                 )
-                embed.set_thumbnail(url=data["cover url"])
-                await message.edit(embed=embed)
+            elif imdb_titles[imdb_id] is not None:
+                imdb_title = imdb_titles[imdb_id]
+                new_movies.append(
+                    Movie(
+                        imdb_id=imdb_id,
+                        title=imdb_title.title,
+                        year=imdb_title.year,
+                        rating=imdb_title.rating,
+                        guild_id=ctx.guild.id,
+                    )
+                )
+        added = await self.repository.add_movies(ctx.guild.id, new_movies)
+        if added:
+            self.page_cache.invalidate(ctx.guild.id, (None, "non-watched"))
+        for movie in new_movies:
+            results[tokens_by_id[movie.imdb_id]] = (
+                movie.title
+                if movie.imdb_id in added
+                else "Already in the list"
+            )
+
+        added_tokens = {tokens_by_id[imdb_id] for imdb_id in added}
+        lines = [
+            f"{':white_check_mark:' if token in added_tokens else ':x:'} "
+            f"{token} - {result}"
+            for token, result in results.items()
+        ]
+        await message.edit(
+            embed=Embed(
+                title=f"{len(added)} of {len(tokens)} movies added",
+                description="\n".join(lines),
+                color=(
+                    EMBED_COLORS["ready"] if added else EMBED_COLORS["error"]
+                ),
+            )
+        )
 
     @cog_ext.cog_subcommand(
         base=group_name,
         name="watch",
         description="Select a random movie from the list. "
         "You can also specify a movie ID that is already in the list",
+        options=[
+            create_option(
+                name="imdb_id",
+                description="The movie to watch. "
+                "Leave it blank to pick a random one",
+                option_type=4,
+                required=False,
+            ),
+            create_option(
+                name="mode",
+                description="How the random movie is picked: all movies "
+                "equally, better rated first or oldest added first",
+                option_type=3,
+                required=False,
+                choices=["random", "rating", "oldest"],
+            ),
+        ],
     )
-    async def watch_movie(self, ctx: commands.Context, imdb_id: int = None):
+    async def watch_movie(
+        self, ctx: commands.Context, imdb_id: int = None, mode: str = "random"
+    ):
         message = await ctx.send(embed=generate_loading_embed("beep boop"))
         try:
-            configs = self.get_config_variables(ctx.guild.id)
+            configs = await self.get_config_variables(ctx.guild.id)
         except MovieCogNotConfigured:
             await message.edit(
                 embed=Embed(
@@ -261,7 +477,7 @@ class Movies(commands.Cog):
                 )
             )
             return
-        if self.currently_watching.get(ctx.guild.id):
+        if await self.get_currently_watching(ctx.guild.id):
             await message.edit(
                 embed=Embed(
                     title="A movie is already being watched!",
@@ -270,71 +486,69 @@ class Movies(commands.Cog):
             )
             return
 
-        with Session(self.db) as session:
-            if imdb_id:
-                try:
-                    chosen: Movie = session.execute(
-                        select(Movie).filter_by(
-                            imdb_id=imdb_id,
-                            guild_id=ctx.guild.id,
-                        )
-                    ).scalar_one()
-                    if chosen.watched_date:
-                        await message.edit(
-                            embed=Embed(
-                                title="This movie was already watched!",
-                                color=EMBED_COLORS["error"],
-                            )
-                        )
-                        return
-                except NoResultFound:
-                    await message.edit(
-                        embed=Embed(
-                            title="Movie is not on the list.",
-                            color=EMBED_COLORS["error"],
-                        )
-                    )
-                    return
-
-            else:
-                movies = session.execute(
-                    select(Movie).filter_by(
-                        watched_date=None, guild_id=ctx.guild.id
+        if imdb_id:
+            chosen = await self.repository.get_movie(ctx.guild.id, imdb_id)
+            if chosen is None:
+                await message.edit(
+                    embed=Embed(
+                        title="Movie is not on the list.",
+                        color=EMBED_COLORS["error"],
                     )
-                ).all()
-                if not movies:
-                    await message.edit(
-                        embed=Embed(
-                            title="All movies were watched!",
-                            color=EMBED_COLORS["error"],
-                        )
+                )
+                return
+            if chosen.watched_date:
+                await message.edit(
+                    embed=Embed(
+                        title="This movie was already watched!",
+                        color=EMBED_COLORS["error"],
                     )
-                    return
-
-                chosen: Movie = choice(movies)[0]
+                )
+                return
 
-            self.currently_watching[ctx.guild.id] = chosen
-            channel = discord.utils.get(
-                ctx.guild.channels,
-                id=int(configs["cinema_channel_id"]),
-            )
-            role = discord.utils.get(
-                ctx.guild.roles,
-                id=int(configs["cinema_role_id"]),
+        else:
+            chosen = await self.repository.pick_unwatched_movie(
+                ctx.guild.id, mode
             )
+            if chosen is None:
+                await message.edit(
+                    embed=Embed(
+                        title="All movies were watched!",
+                        color=EMBED_COLORS["error"],
+                    )
+                )
+                return
 
-            embed = Embed(
-                title="The movie will begin right now!",
-                color=EMBED_COLORS["ready"],
-            )
-            embed.add_field(
-                name=f"{chosen.title} ({chosen.year})",
-                value=f"IMDb rating: {chosen.rating}",
+        if not await self.repository.start_watching(ctx.guild.id, chosen):
+            self.currently_watching.pop(ctx.guild.id, None)
+            await message.edit(
+                embed=Embed(
+                    title="A movie is already being watched!",
+                    color=EMBED_COLORS["error"],
+                )
             )
+            return
+        self.currently_watching[ctx.guild.id] = chosen
+        channel = discord.utils.get(
+            ctx.guild.channels,
+            id=int(configs["cinema_channel_id"]),
+        )
+        role = discord.utils.get(
+            ctx.guild.roles,
+            id=int(configs["cinema_role_id"]),
+        )
 
-            await message.edit(content=role.mention, embed=embed)
+        embed = Embed(
+            title="The movie will begin right now!",
+            color=EMBED_COLORS["ready"],
+        )
+        embed.add_field(
+            name=f"{chosen.title} ({chosen.year})",
+            value=f"IMDb rating: {chosen.rating}",
+        )
+
+        await message.edit(content=role.mention, embed=embed)
 
-            await channel.edit(name=f"🎬🔴 {chosen.title}")
+        await channel.edit(name=f"🎬🔴 {chosen.title}")
 
     @cog_ext.cog_subcommand(
         base=group_name,
@@ -344,7 +558,7 @@ class Movies(commands.Cog):
     async def stop_watching(self, ctx: commands.Context):
         message = await ctx.send(embed=generate_loading_embed())
         try:
-            configs = self.get_config_variables(ctx.guild.id)
+            configs = await self.get_config_variables(ctx.guild.id)
         except MovieCogNotConfigured:
             await message.edit(
                 embed=Embed(
@@ -356,7 +570,15 @@ class Movies(commands.Cog):
             )
             return
 
-        if not self.currently_watching.get(ctx.guild.id):
+        movie = None
+        if await self.get_currently_watching(ctx.guild.id):
+            movie = await self.repository.stop_watching(
+                ctx.guild.id, datetime.datetime.now()
+            )
+            if movie is not None:
+                self.page_cache.invalidate(ctx.guild.id)
+        self.currently_watching[ctx.guild.id] = None
+        if movie is None:
             await message.edit(
                 embed=Embed(
                     title="No movie being watched", color=EMBED_COLORS["error"]
@@ -364,19 +586,6 @@ class Movies(commands.Cog):
             )
             return
 
-        with Session(self.db) as session:
-            session.execute(
-                update(Movie)
-                .where(
-                    Movie.imdb_id
-                    == self.currently_watching[ctx.guild.id].imdb_id,
-                    Movie.guild_id == ctx.guild.id,
-                )
-                .values(watched_date=datetime.datetime.now())
-            )
-            session.flush()
-            session.commit()
-
         channel = discord.utils.get(
             ctx.guild.channels,
             id=int(configs["cinema_channel_id"]),
@@ -384,12 +593,10 @@ class Movies(commands.Cog):
         await message.edit(
             embed=Embed(
                 title="Movie tagged as watched :)",
-                description=f"{self.currently_watching[ctx.guild.id].title} "
-                f"({self.currently_watching[ctx.guild.id].year})",
+                description=f"{movie.title} ({movie.year})",
                 color=EMBED_COLORS["ready"],
             )
         )
-        del self.currently_watching[ctx.guild.id]
         await channel.edit(name=self.default_idle_message)
 
     @cog_ext.cog_subcommand(
@@ -408,17 +615,9 @@ class Movies(commands.Cog):
     async def set_cinema_channel(self, ctx: commands.Context, voice_channel):
         message = await ctx.send(embed=generate_loading_embed())
 
-        with Session(self.db) as session:
-            session.execute(
-                update(ConfigVariable)
-                .where(
-                    ConfigVariable.guild_id == str(ctx.guild.id),
-                    ConfigVariable.key == "cinema_channel_id",
-                )
-                .values(value=voice_channel.id)
-            )
-            session.flush()
-            session.commit()
+        await self.set_config_variable(
+            ctx.guild.id, "cinema_channel_id", voice_channel.id
+        )
 
         await voice_channel.edit(name=self.default_idle_message, bitrate=96000)
         await message.edit(
@@ -447,17 +646,7 @@ class Movies(commands.Cog):
     async def set_mention(self, ctx: commands.Context, role):
         message = await ctx.send(embed=generate_loading_embed())
 
-        with Session(self.db) as session:
-            session.execute(
-                update(ConfigVariable)
-                .where(
-                    ConfigVariable.key == "cinema_role_id",
-                    ConfigVariable.guild_id == str(ctx.guild.id),
-                )
-                .values(value=role.id)
-            )
-            session.flush()
-            session.commit()
+        await self.set_config_variable(ctx.guild.id, "cinema_role_id", role.id)
 
         await message.edit(
             embed=Embed(
@@ -475,26 +664,18 @@ class Movies(commands.Cog):
     )
     async def remove_movie(self, ctx: commands.Context, imdb_id: int):
         message = await ctx.send(embed=generate_loading_embed())
-        with Session(self.db) as session:
-            try:
-                movie = session.execute(
-                    select(Movie).filter_by(
-                        imdb_id=imdb_id, guild_id=ctx.guild.id
-                    )
-                ).scalar_one()
-            except NoResultFound:
-                await message.edit(
-                    embed=Embed(
-                        title="This movie is not on the list",
-                        color=EMBED_COLORS["error"],
-                    )
-                )
-                return
-            session.delete(movie)
-            session.flush()
-            session.commit()
+        if not await self.repository.remove_movie(ctx.guild.id, imdb_id):
             await message.edit(
                 embed=Embed(
-                    title="Movie removed :)", color=EMBED_COLORS["ready"]
+                    title="This movie is not on the list",
+                    color=EMBED_COLORS["error"],
                 )
             )
+            return
+        self.page_cache.invalidate(ctx.guild.id)
+        watching = self.currently_watching.get(ctx.guild.id)
+        if watching and watching.imdb_id == imdb_id:
+            self.currently_watching[ctx.guild.id] = None
+        await message.edit(
+            embed=Embed(title="Movie removed :)", color=EMBED_COLORS["ready"])
+        )
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+# The filters of /movie list, None lists every movie.
+LIST_FILTERS = (None, "watched", "non-watched")
+
+
+class GuildConfigCache:
+    """
+    In-memory copy of the config variables of the bot's guilds.
+
+    The values only change through the cog's setters, which write to the
+    database first and then update the cache, so a cached guild never needs
+    to be read from the database again.
+    """
+
+    def __init__(self):
+        self.configs: Dict[int, Dict[str, Optional[str]]] = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.configs)
+
+    def get(self, guild_id: int) -> Optional[Dict[str, Optional[str]]]:
+        configs = self.configs.get(guild_id)
+        if configs is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return configs
+
+    def set(self, guild_id: int, configs: Dict[str, Optional[str]]):
+        self.configs[guild_id] = dict(configs)
+
+    def warm(self, configs: Dict[int, Dict[str, Optional[str]]]):
+        for guild_id, guild_configs in configs.items():
+            self.set(guild_id, guild_configs)
+
+    def update(self, guild_id: int, key: str, value: Optional[str]):
+        # Guilds that were never loaded are left alone, the next read
+        # fetches every key from the database anyway.
+        if guild_id in self.configs:
+            self.configs[guild_id][key] = value
+
+    def evict(self, guild_id: int):
+        self.configs.pop(guild_id, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "guilds": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class LRUCache:
+    """
+    Mapping that keeps at most ``maxsize`` items, dropping the least
+    recently used one when it is full.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key: Hashable):
+        return key in self.items
+
+    def get(self, key: Hashable, default=None):
+        try:
+            value = self.items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def pop(self, key: Hashable, default=None):
+        return self.items.pop(key, default)
+
+    def clear(self):
+        self.items.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RenderedPage(NamedTuple):
+    """
+    A page of a watchlist as the embed sent for it, without its footer,
+    which depends on how the page was reached. The ids at its edges are the
+    cursors of the pages around it, both are None when it's empty.
+    """
+
+    embed: dict
+    first_id: Optional[int]
+    last_id: Optional[int]
+    total: int
+
+
+class PageCache:
+    """
+    Rendered watchlist pages by guild, filter and the cursor they were
+    seeked from, at most ``maxsize`` of them.
+
+    Each guild and filter has a generation that is part of the keys of its
+    pages. Changing a list bumps it instead of looking for the pages, the
+    LRU drops them eventually. A page read while the list was changed is
+    stored with the old generation, so it's never served.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.pages = LRUCache(maxsize)
+        self.generations: Dict[Tuple[int, Optional[str]], int] = dict()
+
+    def generation(self, guild_id: int, filter_by: Optional[str]) -> int:
+        return self.generations.get((guild_id, filter_by), 0)
+
+    def get(
+        self, guild_id: int, filter_by: Optional[str], cursor: Hashable
+    ) -> Optional[RenderedPage]:
+        generation = self.generation(guild_id, filter_by)
+        return self.pages.get((guild_id, filter_by, generation, cursor))
+
+    def put(
+        self,
+        guild_id: int,
+        filter_by: Optional[str],
+        generation: int,
+        cursor: Hashable,
+        page: RenderedPage,
+    ):
+        self.pages.put((guild_id, filter_by, generation, cursor), page)
+
+    def invalidate(
+        self, guild_id: int, filters: Iterable[Optional[str]] = LIST_FILTERS
+    ):
+        for filter_by in filters:
+            key = (guild_id, filter_by)
+            self.generations[key] = self.generations.get(key, 0) + 1
+
+    def evict(self, guild_id: int):
+        """
+        Forgets a guild the bot left, its pages and its generations. Going
+        through every page is fine for something this rare, and the pages
+        must go before their generations start over.
+        """
+        for key in [key for key in self.pages.items if key[0] == guild_id]:
+            self.pages.pop(key)
+        for filter_by in LIST_FILTERS:
+            self.generations.pop((guild_id, filter_by), None)
+
+    def stats(self):
+        return self.pages.stats()
@@ -0,0 +1,198 @@
+import asyncio
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from imdb import IMDb, IMDbError
+
+from cogs.movies.cache import LRUCache
+from cogs.movies.models import ImdbTitle
+from cogs.movies.repository import MovieRepository
+from utils.constants import IMDB_FETCH_CONCURRENCY
+from utils.instrumentation import record_imdb_fetch
+
+
+def get_directors_string(directors_data) -> Optional[str]:
+    director_names = [director.data["name"] for director in directors_data]
+    if not director_names:
+        return None
+    if len(director_names) == 1:
+        return director_names[0]
+    return f"{', '.join(director_names[:-1])} and {director_names[-1]}"
+
+
+class ImdbUnavailable(Exception):
+    pass
+
+
+class MovieMetadataCache:
+    """
+    IMDb metadata shared by every guild.
+
+    Lookups go through an in-process LRU, then the ``imdb_titles`` table and
+    only then to IMDb. Titles older than ``ttl`` are fetched again, but the
+    stored copy is still used if IMDb can't be reached. Without a stored
+    copy lookups raise ``ImdbUnavailable`` instead. Concurrent lookups
+    for the same ID wait on a single fetch.
+    """
+
+    def __init__(
+        self,
+        repository: MovieRepository,
+        imdb_factory: Callable[[], IMDb] = IMDb,
+        ttl: datetime.timedelta = datetime.timedelta(days=7),
+        maxsize: int = 1024,
+        max_workers: int = 4,
+    ):
+        self.repository = repository
+        self.imdb_factory = imdb_factory
+        self.ttl = ttl
+        self.titles = LRUCache(maxsize)
+        self.pending: Dict[int, asyncio.Future] = dict()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="imdb"
+        )
+        # IMDb instances hold their own HTTP opener, each worker thread
+        # gets its own one instead of sharing it.
+        self.local = threading.local()
+        self.fetches = 0
+
+    def is_expired(self, imdb_title: ImdbTitle) -> bool:
+        return datetime.datetime.utcnow() - imdb_title.fetched_at > self.ttl
+
+    async def get(self, imdb_id: int) -> Optional[ImdbTitle]:
+        """
+        Returns the metadata for ``imdb_id`` or ``None`` if IMDb doesn't
+        know a movie with that ID. Raises ``ImdbUnavailable`` if IMDb
+        couldn't be reached and the title wasn't stored.
+        """
+        imdb_title = self.titles.get(imdb_id)
+        if imdb_title is not None and not self.is_expired(imdb_title):
+            return imdb_title
+
+        pending = self.pending.get(imdb_id)
+        if pending is None:
+            pending = self.share(imdb_id, self.load(imdb_id))
+        # A cancelled command must not cancel the fetch other commands
+        # are waiting for.
+        return await asyncio.shield(pending)
+
+    def share(self, imdb_id: int, lookup: Awaitable) -> asyncio.Future:
+        """
+        Runs ``lookup`` as the one lookup of ``imdb_id`` every other lookup
+        waits for until it's done.
+        """
+        pending = asyncio.ensure_future(lookup)
+        self.pending[imdb_id] = pending
+        pending.add_done_callback(lambda _: self.pending.pop(imdb_id, None))
+        return pending
+
+    async def get_many(
+        self, imdb_ids: List[int]
+    ) -> Dict[int, Optional[ImdbTitle]]:
+        """
+        ``get`` for several IDs at once. The titles that aren't in the LRU
+        are read in a single query and the ones this call fetched from IMDb
+        are saved together. IDs IMDb couldn't be reached for are left out.
+        """
+        titles: Dict[int, Optional[ImdbTitle]] = dict()
+        to_load = []
+        for imdb_id in imdb_ids:
+            imdb_title = self.titles.get(imdb_id)
+            if imdb_title is not None and not self.is_expired(imdb_title):
+                titles[imdb_id] = imdb_title
+            else:
+                to_load.append(imdb_id)
+        if not to_load:
+            return titles
+
+        stored = await self.repository.get_imdb_titles(to_load)
+        fetched = []
+        semaphore = asyncio.Semaphore(IMDB_FETCH_CONCURRENCY)
+
+        async def refresh(imdb_id: int) -> Optional[ImdbTitle]:
+            async with semaphore:
+                imdb_title = await self.refresh(imdb_id, stored.get(imdb_id))
+            if imdb_title is not None:
+                if imdb_title is not stored.get(imdb_id):
+                    fetched.append(imdb_title)
+                self.titles.put(imdb_id, imdb_title)
+            return imdb_title
+
+        async def load(imdb_id: int):
+            pending = self.pending.get(imdb_id)
+            if pending is None:
+                pending = self.share(imdb_id, refresh(imdb_id))
+            try:
+                titles[imdb_id] = await asyncio.shield(pending)
+            except ImdbUnavailable:
+                pass
+
+        await asyncio.gather(*map(load, to_load))
+        if fetched:
+            await self.repository.save_imdb_titles(fetched)
+        return titles
+
+    async def load(self, imdb_id: int) -> Optional[ImdbTitle]:
+        stored = await self.repository.get_imdb_title(imdb_id)
+        imdb_title = await self.refresh(imdb_id, stored)
+        if imdb_title is not None:
+            if imdb_title is not stored:
+                await self.repository.save_imdb_title(imdb_title)
+            self.titles.put(imdb_id, imdb_title)
+        return imdb_title
+
+    async def refresh(
+        self, imdb_id: int, stored: Optional[ImdbTitle]
+    ) -> Optional[ImdbTitle]:
+        """
+        Fetches the title again if the stored copy is missing or expired.
+        The stored copy is returned as is if it's still fresh or if IMDb
+        can't be reached.
+        """
+        if stored is not None and not self.is_expired(stored):
+            return stored
+        self.fetches += 1
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            fetched = await loop.run_in_executor(
+                self.executor, self.fetch, imdb_id
+            )
+        except ImdbUnavailable:
+            if stored is None:
+                raise
+            return stored
+        finally:
+            record_imdb_fetch((time.perf_counter() - started) * 1000)
+        return stored if fetched is None else fetched
+
+    def fetch(self, imdb_id: int) -> Optional[ImdbTitle]:
+        """
+        Returns ``None`` if IMDb answered without a title, which is what it
+        does for IDs it doesn't know. Any other failure means IMDb couldn't
+        be reached and raises ``ImdbUnavailable``.
+        """
+        if not hasattr(self.local, "imdb"):
+            self.local.imdb = self.imdb_factory()
+        try:
+            data = self.local.imdb.get_movie(imdb_id).data
+        except IMDbError as error:
+            raise ImdbUnavailable(imdb_id) from error
+        try:
+            return ImdbTitle(
+                imdb_id=imdb_id,
+                title=data.get(
+                    "original title", data.get("localized title", "")
+                ),
+                year=data["year"],
+                rating=data["rating"],
+                directors=get_directors_string(data.get("directors", [])),
+                cover_url=data.get("cover url"),
+                original_air_date=data.get("original air date"),
+                fetched_at=datetime.datetime.utcnow(),
+            )
+        except KeyError:
+            return None
@@ -1,12 +1,28 @@
-from sqlalchemy import Column, Integer, String, Float, Date, BigInteger
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Float,
+    Date,
+    DateTime,
+    BigInteger,
+    ForeignKey,
+    Index,
+)
 from sqlalchemy.orm import declarative_base
 
-
 Base = declarative_base()
 
 
 class Movie(Base):
     __tablename__ = "movies"
+    __table_args__ = (
+        Index(
+            "uq_movies_guild_id_imdb_id", "guild_id", "imdb_id", unique=True
+        ),
+        Index("ix_movies_guild_id_watched_date", "guild_id", "watched_date"),
+        Index("ix_movies_guild_id_id", "guild_id", "id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     imdb_id = Column(Integer)
     title = Column(String)
@@ -16,9 +32,29 @@ class Movie(Base):
     watched_date = Column(Date, nullable=True)
 
 
+class WatchSession(Base):
+    __tablename__ = "watch_sessions"
+    guild_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    movie_id = Column(
+        Integer, ForeignKey("movies.id", ondelete="CASCADE"), nullable=False
+    )
+    started_at = Column(DateTime, nullable=False)
+
+
 class ConfigVariable(Base):
     __tablename__ = "configs"
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    key = Column(String)
+    guild_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    key = Column(String, primary_key=True)
     value = Column(String, nullable=True)
-    guild_id = Column(String)
+
+
+class ImdbTitle(Base):
+    __tablename__ = "imdb_titles"
+    imdb_id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String)
+    year = Column(Integer)
+    rating = Column(Float)
+    directors = Column(String, nullable=True)
+    cover_url = Column(String, nullable=True)
+    original_air_date = Column(String, nullable=True)
+    fetched_at = Column(DateTime)
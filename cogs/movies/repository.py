@@ -0,0 +1,469 @@
+import asyncio
+import contextvars
+import datetime
+import functools
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import Session
+
+from cogs.movies.models import (
+    Movie,
+    ConfigVariable,
+    ImdbTitle,
+    WatchSession,
+)
+from utils.constants import GUILD_CONFIG_VARIABLES, MOVIES_PAGE_SIZE
+
+# Guild IDs per IN list, older SQLite versions accept up to 999 parameters
+# per statement.
+GUILD_IDS_PER_QUERY = 500
+
+
+def offload(func):
+    """
+    Turns a blocking repository method into a coroutine that runs it on the
+    repository's thread pool, so awaiting it never stalls the event loop.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self: "MovieRepository", *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Executors don't carry the caller's context vars over, copy them so
+        # the queries still know which command issued them.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(context.run, func, self, *args, **kwargs),
+        )
+
+    return wrapper
+
+
+class MovieRepository:
+    """
+    Data access for the Movies cog.
+
+    Every public method is awaitable and runs its query on a bounded pool of
+    worker threads. The pool size caps how many connections the cog can hold
+    at the same time, so it should not be larger than the engine pool.
+    """
+
+    def __init__(self, engine: Engine, max_workers: int = 4):
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="movies-db"
+        )
+
+    def session(self) -> Session:
+        # Returned models are used after the session is closed, so they
+        # must keep their loaded attributes around after the commit.
+        return Session(self.engine, expire_on_commit=False)
+
+    @staticmethod
+    def movie_filters(guild_id: int, filter_by: Optional[str] = None):
+        filters = [Movie.guild_id == guild_id]
+        if filter_by == "watched":
+            filters.append(Movie.watched_date.is_not(None))
+        elif filter_by == "non-watched":
+            filters.append(Movie.watched_date.is_(None))
+        return filters
+
+    @offload
+    def get_movie(self, guild_id: int, imdb_id: int) -> Optional[Movie]:
+        with self.session() as session:
+            return session.execute(
+                select(Movie).filter_by(imdb_id=imdb_id, guild_id=guild_id)
+            ).scalar_one_or_none()
+
+    @offload
+    def get_movies_page(
+        self,
+        guild_id: int,
+        filter_by: Optional[str] = None,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        page_size: int = MOVIES_PAGE_SIZE,
+    ) -> Tuple[List[Movie], int]:
+        """
+        Returns the page of movies right after ``after_id`` or right before
+        ``before_id`` (the first page if neither is given) and the number of
+        movies that match the filter.
+
+        Pages are seeked on ``(guild_id, id)`` instead of using an offset,
+        so every page costs the same no matter how deep it is.
+        """
+        filters = self.movie_filters(guild_id, filter_by)
+        query = select(Movie).where(*filters).limit(page_size)
+        if before_id is not None:
+            query = query.where(Movie.id < before_id).order_by(Movie.id.desc())
+        else:
+            if after_id is not None:
+                query = query.where(Movie.id > after_id)
+            query = query.order_by(Movie.id)
+
+        with self.session() as session:
+            movies = session.execute(query).scalars().all()
+            total = session.execute(
+                select(func.count()).select_from(Movie).where(*filters)
+            ).scalar_one()
+        if before_id is not None:
+            movies.reverse()
+        return movies, total
+
+    @offload
+    def pick_unwatched_movie(
+        self, guild_id: int, mode: str = "random"
+    ) -> Optional[Movie]:
+        """
+        Picks one of the guild's unwatched movies without loading the rest.
+
+        ``random`` gives every movie the same chance by counting them and
+        jumping to a random offset. ``rating`` favours better rated movies
+        and ``oldest`` favours the movies that were added first, both with
+        a weighted sample (Efraimidis-Spirakis) done by the database: the
+        movie with the largest ``ln(u) / weight`` wins, ``u`` being uniform
+        in (0, 1].
+        """
+        filters = [Movie.guild_id == guild_id, Movie.watched_date.is_(None)]
+        with self.session() as session:
+            if mode == "random":
+                count = session.execute(
+                    select(func.count()).select_from(Movie).where(*filters)
+                ).scalar_one()
+                if count == 0:
+                    return None
+                return session.execute(
+                    select(Movie)
+                    .where(*filters)
+                    .order_by(Movie.id)
+                    .offset(random.randrange(count))
+                    .limit(1)
+                ).scalar_one_or_none()
+
+            if mode == "rating":
+                weight = Movie.rating
+            elif mode == "oldest":
+                newest_id = session.execute(
+                    select(func.max(Movie.id)).where(*filters)
+                ).scalar_one()
+                if newest_id is None:
+                    return None
+                weight = newest_id - Movie.id + 1
+            else:
+                raise ValueError(f"Unknown pick mode: {mode}")
+
+            if session.get_bind().dialect.name == "sqlite":
+                # random() is a signed 64-bit integer in SQLite.
+                uniform = 0.5 - func.random() / 18446744073709551616.0
+            else:
+                uniform = 1 - func.random()
+            return session.execute(
+                select(Movie)
+                .where(*filters)
+                .order_by(
+                    (
+                        func.ln(uniform)
+                        / func.coalesce(func.nullif(weight, 0), 1.0)
+                    ).desc()
+                )
+                .limit(1)
+            ).scalar_one_or_none()
+
+    @offload
+    def add_movie(self, movie: Movie) -> bool:
+        with self.session() as session:
+            session.add(movie)
+            try:
+                session.commit()
+            except IntegrityError:
+                # Someone else added the same movie to the guild since it
+                # was checked.
+                return False
+        return True
+
+    @staticmethod
+    def _existing_imdb_ids(
+        session: Session, guild_id: int, imdb_ids: Iterable[int]
+    ) -> Set[int]:
+        return set(
+            session.execute(
+                select(Movie.imdb_id).where(
+                    Movie.guild_id == guild_id, Movie.imdb_id.in_(imdb_ids)
+                )
+            ).scalars()
+        )
+
+    @offload
+    def get_existing_imdb_ids(
+        self, guild_id: int, imdb_ids: List[int]
+    ) -> Set[int]:
+        with self.session() as session:
+            return self._existing_imdb_ids(session, guild_id, imdb_ids)
+
+    @offload
+    def add_movies(self, guild_id: int, movies: List[Movie]) -> Set[int]:
+        """
+        Inserts every movie in a single statement and returns the IMDb IDs
+        that were added.
+        """
+        values = [
+            {
+                "imdb_id": movie.imdb_id,
+                "title": movie.title,
+                "year": movie.year,
+                "rating": movie.rating,
+                "guild_id": guild_id,
+            }
+            for movie in movies
+        ]
+        if not values:
+            return set()
+        with self.session() as session:
+            try:
+                session.execute(insert(Movie), values)
+                session.commit()
+            except IntegrityError:
+                # Some of them were added since they were checked, insert
+                # only the ones that are still missing.
+                session.rollback()
+                existing = self._existing_imdb_ids(
+                    session, guild_id, [value["imdb_id"] for value in values]
+                )
+                values = [
+                    value
+                    for value in values
+                    if value["imdb_id"] not in existing
+                ]
+                if values:
+                    session.execute(insert(Movie), values)
+                session.commit()
+        return {value["imdb_id"] for value in values}
+
+    @offload
+    def remove_movie(self, guild_id: int, imdb_id: int) -> bool:
+        with self.session() as session:
+            movie = session.execute(
+                select(Movie).filter_by(imdb_id=imdb_id, guild_id=guild_id)
+            ).scalar_one_or_none()
+            if movie is None:
+                return False
+            # SQLite doesn't enforce the foreign key cascade.
+            session.execute(
+                delete(WatchSession).where(WatchSession.movie_id == movie.id)
+            )
+            session.delete(movie)
+            session.commit()
+        return True
+
+    @offload
+    def get_watching_movie(self, guild_id: int) -> Optional[Movie]:
+        with self.session() as session:
+            return session.execute(
+                select(Movie)
+                .join(WatchSession, WatchSession.movie_id == Movie.id)
+                .where(WatchSession.guild_id == guild_id)
+            ).scalar_one_or_none()
+
+    @offload
+    def load_watching_movies(
+        self, guild_ids: List[int]
+    ) -> Dict[int, Optional[Movie]]:
+        """
+        Returns the movie being watched in each of the given guilds, or
+        ``None`` for the guilds that aren't watching anything, and drops
+        sessions whose movie was removed or already tagged as watched.
+        The guilds are queried ``GUILD_IDS_PER_QUERY`` at a time.
+        """
+        watching = dict.fromkeys(guild_ids)
+        with self.session() as session:
+            for start in range(0, len(guild_ids), GUILD_IDS_PER_QUERY):
+                chunk = guild_ids[start : start + GUILD_IDS_PER_QUERY]
+                rows = session.execute(
+                    select(WatchSession.guild_id, Movie)
+                    .outerjoin(Movie, WatchSession.movie_id == Movie.id)
+                    .where(WatchSession.guild_id.in_(chunk))
+                ).all()
+                stale = []
+                for guild_id, movie in rows:
+                    if movie is None or movie.watched_date is not None:
+                        stale.append(guild_id)
+                    else:
+                        watching[guild_id] = movie
+                if stale:
+                    session.execute(
+                        delete(WatchSession).where(
+                            WatchSession.guild_id.in_(stale)
+                        )
+                    )
+            session.commit()
+        return watching
+
+    @offload
+    def start_watching(self, guild_id: int, movie: Movie) -> bool:
+        """
+        Records that the guild started watching ``movie``. Returns ``False``
+        if the guild is already watching something, which the primary key
+        guarantees even when several bot processes race for it.
+        """
+        with self.session() as session:
+            session.add(
+                WatchSession(
+                    guild_id=guild_id,
+                    movie_id=movie.id,
+                    started_at=datetime.datetime.utcnow(),
+                )
+            )
+            try:
+                session.commit()
+            except IntegrityError:
+                return False
+        return True
+
+    @offload
+    def stop_watching(
+        self, guild_id: int, watched_date: datetime.date
+    ) -> Optional[Movie]:
+        """
+        Tags the movie the guild is watching as watched and ends the
+        session. Returns the movie or ``None`` if nothing was being watched.
+        """
+        with self.session() as session:
+            watch_session = session.get(WatchSession, guild_id)
+            if watch_session is None:
+                return None
+            movie = session.get(Movie, watch_session.movie_id)
+            session.delete(watch_session)
+            if movie is not None:
+                movie.watched_date = watched_date
+            session.commit()
+        return movie
+
+    @offload
+    def get_imdb_title(self, imdb_id: int) -> Optional[ImdbTitle]:
+        with self.session() as session:
+            return session.get(ImdbTitle, imdb_id)
+
+    @offload
+    def get_imdb_titles(self, imdb_ids: List[int]) -> Dict[int, ImdbTitle]:
+        with self.session() as session:
+            return {
+                imdb_title.imdb_id: imdb_title
+                for imdb_title in session.execute(
+                    select(ImdbTitle).where(ImdbTitle.imdb_id.in_(imdb_ids))
+                ).scalars()
+            }
+
+    @offload
+    def save_imdb_title(self, imdb_title: ImdbTitle):
+        with self.session() as session:
+            session.merge(imdb_title)
+            session.commit()
+
+    @offload
+    def save_imdb_titles(self, imdb_titles: List[ImdbTitle]):
+        """
+        Replaces the stored copies of the titles in two statements, instead
+        of the lookup ``merge`` does for each of them.
+        """
+        with self.session() as session:
+            try:
+                session.execute(
+                    delete(ImdbTitle).where(
+                        ImdbTitle.imdb_id.in_(
+                            [imdb_title.imdb_id for imdb_title in imdb_titles]
+                        )
+                    )
+                )
+                session.add_all(imdb_titles)
+                session.commit()
+            except IntegrityError:
+                # Another process stored some of them in the meantime.
+                session.rollback()
+                for imdb_title in imdb_titles:
+                    session.merge(imdb_title)
+                session.commit()
+
+    @offload
+    def get_config_variables(self, guild_id: int) -> Dict[str, Optional[str]]:
+        configs = dict.fromkeys(GUILD_CONFIG_VARIABLES)
+        with self.session() as session:
+            rows = session.execute(
+                select(ConfigVariable.key, ConfigVariable.value).where(
+                    ConfigVariable.guild_id == guild_id,
+                    ConfigVariable.key.in_(GUILD_CONFIG_VARIABLES),
+                )
+            )
+            configs.update((key, value) for key, value in rows)
+        return configs
+
+    @offload
+    def load_config_variables(
+        self, guild_ids: List[int]
+    ) -> Dict[int, Dict[str, Optional[str]]]:
+        """
+        ``get_config_variables`` for each of the given guilds, queried
+        ``GUILD_IDS_PER_QUERY`` at a time.
+        """
+        configs = {
+            guild_id: dict.fromkeys(GUILD_CONFIG_VARIABLES)
+            for guild_id in guild_ids
+        }
+        with self.session() as session:
+            for start in range(0, len(guild_ids), GUILD_IDS_PER_QUERY):
+                rows = session.execute(
+                    select(
+                        ConfigVariable.guild_id,
+                        ConfigVariable.key,
+                        ConfigVariable.value,
+                    ).where(
+                        ConfigVariable.guild_id.in_(
+                            guild_ids[start : start + GUILD_IDS_PER_QUERY]
+                        ),
+                        ConfigVariable.key.in_(GUILD_CONFIG_VARIABLES),
+                    )
+                )
+                for guild_id, key, value in rows:
+                    configs[guild_id][key] = value
+        return configs
+
+    @offload
+    def set_config_variable(self, guild_id: int, key: str, value: str):
+        with self.session() as session:
+            result = session.execute(
+                update(ConfigVariable)
+                .where(
+                    ConfigVariable.guild_id == guild_id,
+                    ConfigVariable.key == key,
+                )
+                .values(value=value)
+            )
+            # Guilds that were joined while the bot was offline never got
+            # their rows, create it so the config cache and the table agree.
+            if result.rowcount == 0:
+                session.add(
+                    ConfigVariable(guild_id=guild_id, key=key, value=value)
+                )
+            session.commit()
+
+    @offload
+    def create_config_variables(self, guild_id: int):
+        with self.session() as session:
+            # Guilds that are joined again still have their old values.
+            existing = set(
+                session.execute(
+                    select(ConfigVariable.key).where(
+                        ConfigVariable.guild_id == guild_id
+                    )
+                ).scalars()
+            )
+            for var in GUILD_CONFIG_VARIABLES:
+                if var not in existing:
+                    session.add(
+                        ConfigVariable(guild_id=guild_id, key=var, value=None)
+                    )
+            session.commit()
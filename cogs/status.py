@@ -0,0 +1,109 @@
+import datetime
+import math
+import os
+from collections import Counter
+
+import discord
+from discord.ext import commands
+
+from utils.instrumentation import Instrumentation
+
+# Embed descriptions hold up to 4096 characters.
+STATS_MAX_COMMANDS = 30
+
+
+class Status(commands.Cog):
+    def __init__(self, bot, instrumentation: Instrumentation):
+        self.bot: commands.AutoShardedBot = bot
+        self.instrumentation = instrumentation
+
+    def cog_unload(self):
+        self.instrumentation.stop_export()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.instrumentation.start_export()
+
+    @commands.command(name="status")
+    async def show_status(self, ctx: commands.Context):
+        """
+        Shows the gateway latency of the shards handled by this process.
+        """
+        shard_ids = sorted(self.bot.shards)
+        embed = discord.Embed(
+            title="Bot status",
+            description=f"Process {os.getpid()} is running "
+            f"{len(shard_ids)} of {self.bot.shard_count} shards.",
+        )
+        guilds_per_shard = Counter(guild.shard_id for guild in self.bot.guilds)
+        # Embeds hold up to 25 fields.
+        for shard_id, latency in self.bot.latencies[:25]:
+            here = (
+                " (this server)"
+                if ctx.guild and ctx.guild.shard_id == shard_id
+                else ""
+            )
+            ping = (
+                "connecting"
+                if math.isinf(latency)
+                else f"{latency * 1000:.0f} ms"
+            )
+            embed.add_field(
+                name=f"Shard {shard_id}{here}",
+                value=f"{ping} - {guilds_per_shard[shard_id]} servers",
+            )
+        await ctx.send(embed=embed)
+
+    @commands.command(name="stats")
+    @commands.is_owner()
+    async def show_stats(self, ctx: commands.Context):
+        """
+        Shows what the commands handled by this process cost: their latency,
+        and the queries, IMDb fetches and Discord API calls they made on
+        average. Also how often the caches were hit.
+        """
+        embed = discord.Embed(title="Command stats")
+        if self.instrumentation.enabled:
+            since = datetime.datetime.fromtimestamp(self.instrumentation.since)
+            embed.description = self.render_command_stats()
+            embed.set_footer(
+                text=f"Since {since:%Y-%m-%d %H:%M}. Latencies in ms, the "
+                "rest per call."
+            )
+        else:
+            embed.description = (
+                "Command stats are disabled, set COMMAND_STATS=true to "
+                "enable them."
+            )
+        for name, stats in self.instrumentation.cache_stats().items():
+            lookups = stats["hits"] + stats["misses"]
+            size = stats.get("size", stats.get("guilds"))
+            embed.add_field(
+                name=name,
+                value=f"{stats['hit_rate']:.0%} of {lookups} lookups hit, "
+                f"{size} items",
+            )
+        await ctx.send(embed=embed)
+
+    def render_command_stats(self) -> str:
+        commands_stats = sorted(
+            self.instrumentation.commands.items(),
+            key=lambda item: item[1].latency.total,
+            reverse=True,
+        )
+        lines = [
+            f"{'command':<16} {'calls':>6} {'err':>4} {'p50':>6} {'p99':>6} "
+            f"{'db':>4} {'db ms':>6} {'api':>4} {'imdb ms':>7}"
+        ]
+        for name, stats in commands_stats[:STATS_MAX_COMMANDS]:
+            calls = stats.latency.count
+            lines.append(
+                f"{name[:16]:<16} {calls:>6} {stats.errors:>4} "
+                f"{stats.latency.percentile(0.5):>6.0f} "
+                f"{stats.latency.percentile(0.99):>6.0f} "
+                f"{stats.queries / calls:>4.1f} "
+                f"{stats.query_ms / calls:>6.1f} "
+                f"{stats.api_calls / calls:>4.1f} "
+                f"{stats.imdb_ms / calls:>7.0f}"
+            )
+        return "```\n" + "\n".join(lines) + "\n```"
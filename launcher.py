@@ -0,0 +1,110 @@
+"""
+Runs the bot split across several processes.
+
+The shards are divided in contiguous ranges, one per worker process, and
+every worker opens its own gateway connections and its own database pool.
+Migrations run once here, before any worker starts, and only the first
+worker syncs the slash commands.
+
+Set ``WORKERS`` to the number of processes and optionally ``SHARD_COUNT``,
+otherwise the shard count Discord recommends is used.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from typing import List, Sequence
+
+import aiohttp
+from dotenv import load_dotenv
+
+import migrations
+from bot import create_bot
+from utils.database import create_database_engine
+from utils.functions import get_env_variable
+
+# Discord allows one IDENTIFY every 5 seconds, the next worker only starts
+# after the previous one identified all of its shards.
+IDENTIFY_INTERVAL = 5
+
+
+async def fetch_recommended_shard_count(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v8/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def split_shards(shard_count: int, workers: int) -> List[List[int]]:
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        end = start + size + (1 if worker < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def run_worker(worker: int, shard_ids: Sequence[int], shard_count: int):
+    load_dotenv()
+    bot = create_bot(
+        create_database_engine(),
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        sync_commands=worker == 0,
+        # There is a single host for the servers, so a single worker.
+        host_minecraft=worker == 0 and bool(os.getenv("JAVA_EXECUTABLE")),
+    )
+    print(f"Worker {worker} running shards {list(shard_ids)}")
+    bot.run(get_env_variable("TOKEN"))
+
+
+def main():
+    load_dotenv()
+    token = get_env_variable("TOKEN")
+    workers = int(os.getenv("WORKERS", "1"))
+
+    engine = create_database_engine()
+    migrations.upgrade(engine)
+    engine.dispose()
+
+    if workers == 1 and not os.getenv("SHARD_COUNT"):
+        create_bot(create_database_engine()).run(token)
+        return
+
+    shard_count = int(
+        os.getenv("SHARD_COUNT")
+        or asyncio.run(fetch_recommended_shard_count(token))
+    )
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for worker, shard_ids in enumerate(
+        split_shards(shard_count, min(workers, shard_count))
+    ):
+        process = context.Process(
+            target=run_worker,
+            args=(worker, shard_ids, shard_count),
+            name=f"governo-worker-{worker}",
+        )
+        process.start()
+        processes.append(process)
+        time.sleep(IDENTIFY_INTERVAL * len(shard_ids))
+
+    # If a worker dies its shards are offline, stop everything so the
+    # dyno is restarted with every shard.
+    while all(process.is_alive() for process in processes):
+        time.sleep(1)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+    raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Versioned schema migrations.
+
+Each module listed in ``MIGRATIONS`` has an ``upgrade(connection)`` function
+that moves the schema one version forward. The version a database is at is
+stored in the ``schema_version`` table, so ``upgrade`` only runs the
+migrations that were not applied yet and can be called on every start.
+
+New migrations must be appended to the list and never edited once they were
+deployed, the Heroku database has already run them.
+"""
+
+import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    select,
+)
+from sqlalchemy.future import Engine
+
+from migrations import (
+    m0001_initial,
+    m0002_indexes_and_config_keys,
+    m0003_imdb_titles,
+    m0004_movies_keyset_index,
+    m0005_watch_sessions,
+)
+
+MIGRATIONS = [
+    m0001_initial,
+    m0002_indexes_and_config_keys,
+    m0003_imdb_titles,
+    m0004_movies_keyset_index,
+    m0005_watch_sessions,
+]
+
+metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def current_version(engine: Engine) -> int:
+    with engine.begin() as connection:
+        schema_version.create(connection, checkfirst=True)
+        return (
+            connection.execute(
+                select(func.max(schema_version.c.version))
+            ).scalar()
+            or 0
+        )
+
+
+def upgrade(engine: Engine):
+    version = current_version(engine)
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        name = migration.__name__.rsplit(".", 1)[-1]
+        # One transaction per migration, so a failure leaves the database
+        # at the last version that was fully applied.
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            connection.execute(
+                insert(schema_version).values(
+                    version=number,
+                    name=name,
+                    applied_at=datetime.datetime.utcnow(),
+                )
+            )
+        print(f"Applied migration {number}: {name}")
@@ -0,0 +1,9 @@
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+from migrations import upgrade
+from utils.functions import get_database_url
+
+load_dotenv()
+
+upgrade(create_engine(get_database_url(), future=True))
@@ -0,0 +1,43 @@
+"""
+The schema as ``Base.metadata.create_all`` used to create it.
+
+Databases that were created before migrations existed already have these
+tables, so they are only created when missing.
+"""
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+)
+
+metadata = MetaData()
+
+Table(
+    "movies",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("imdb_id", Integer),
+    Column("title", String),
+    Column("year", Integer),
+    Column("rating", Float),
+    Column("guild_id", BigInteger),
+    Column("watched_date", Date, nullable=True),
+)
+
+Table(
+    "configs",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("key", String),
+    Column("value", String, nullable=True),
+    Column("guild_id", String),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
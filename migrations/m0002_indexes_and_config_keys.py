@@ -0,0 +1,91 @@
+"""
+Indexes the movie lookups and keys config variables by ``(guild_id, key)``.
+
+Duplicated movies and config variables are collapsed first, keeping the most
+recent row, otherwise the unique index and the primary key can't be created.
+The config table has to be rebuilt because SQLite can't change a primary key
+or a column type in place.
+"""
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Index,
+    Integer,
+    MetaData,
+    PrimaryKeyConstraint,
+    String,
+    Table,
+    cast,
+    delete,
+    func,
+    insert,
+    select,
+    text,
+)
+
+metadata = MetaData()
+
+movies = Table(
+    "movies",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("imdb_id", Integer),
+    Column("guild_id", BigInteger),
+    Column("watched_date"),
+)
+old_configs = Table(
+    "configs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("key", String),
+    Column("value", String),
+    Column("guild_id", String),
+)
+new_configs = Table(
+    "configs_new",
+    metadata,
+    Column("guild_id", BigInteger, nullable=False),
+    Column("key", String, nullable=False),
+    Column("value", String, nullable=True),
+    PrimaryKeyConstraint("guild_id", "key", name="pk_configs"),
+)
+
+
+def upgrade(connection):
+    latest_movies = (
+        select(func.max(movies.c.id))
+        .group_by(movies.c.guild_id, movies.c.imdb_id)
+        .scalar_subquery()
+    )
+    connection.execute(delete(movies).where(movies.c.id.not_in(latest_movies)))
+    Index(
+        "uq_movies_guild_id_imdb_id",
+        movies.c.guild_id,
+        movies.c.imdb_id,
+        unique=True,
+    ).create(connection)
+    Index(
+        "ix_movies_guild_id_watched_date",
+        movies.c.guild_id,
+        movies.c.watched_date,
+    ).create(connection)
+
+    latest_configs = (
+        select(func.max(old_configs.c.id))
+        .where(old_configs.c.guild_id.is_not(None))
+        .group_by(old_configs.c.guild_id, old_configs.c.key)
+        .scalar_subquery()
+    )
+    new_configs.create(connection)
+    connection.execute(
+        insert(new_configs).from_select(
+            ["guild_id", "key", "value"],
+            select(
+                cast(old_configs.c.guild_id, BigInteger),
+                old_configs.c.key,
+                old_configs.c.value,
+            ).where(old_configs.c.id.in_(latest_configs)),
+        )
+    )
+    old_configs.drop(connection)
+    connection.execute(text("ALTER TABLE configs_new RENAME TO configs"))
@@ -0,0 +1,31 @@
+"""
+Persistent cache of the IMDb metadata shared by every guild.
+"""
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+)
+
+metadata = MetaData()
+
+Table(
+    "imdb_titles",
+    metadata,
+    Column("imdb_id", Integer, primary_key=True, autoincrement=False),
+    Column("title", String),
+    Column("year", Integer),
+    Column("rating", Float),
+    Column("directors", String, nullable=True),
+    Column("cover_url", String, nullable=True),
+    Column("original_air_date", String, nullable=True),
+    Column("fetched_at", DateTime),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection)
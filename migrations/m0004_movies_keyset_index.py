@@ -0,0 +1,19 @@
+"""
+Index used to seek the watchlist pages of a guild.
+"""
+from sqlalchemy import BigInteger, Column, Index, Integer, MetaData, Table
+
+metadata = MetaData()
+
+movies = Table(
+    "movies",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("guild_id", BigInteger),
+)
+
+
+def upgrade(connection):
+    Index("ix_movies_guild_id_id", movies.c.guild_id, movies.c.id).create(
+        connection
+    )
@@ -0,0 +1,34 @@
+"""
+Movies being watched, so sessions survive restarts and are shared by every
+bot process.
+"""
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    Table,
+)
+
+metadata = MetaData()
+
+Table("movies", metadata, Column("id", Integer, primary_key=True))
+
+watch_sessions = Table(
+    "watch_sessions",
+    metadata,
+    Column("guild_id", BigInteger, primary_key=True, autoincrement=False),
+    Column(
+        "movie_id",
+        Integer,
+        ForeignKey("movies.id", ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column("started_at", DateTime, nullable=False),
+)
+
+
+def upgrade(connection):
+    watch_sessions.create(connection)
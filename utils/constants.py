@@ -14,6 +14,11 @@ EMBED_COLORS = {
 }
 LOADING_MESSAGES = ["Hold on a sec", "What are you waiting for?"]
 GUILD_CONFIG_VARIABLES = ["cinema_channel_id", "cinema_role_id"]
+MOVIES_PAGE_SIZE = 10
+MOVIES_PAGE_CACHE_SIZE = 4096
+MOVIES_BULK_ADD_LIMIT = 50
+IMDB_FETCH_CONCURRENCY = 5
+MINECRAFT_SERVER_MEMORY = "4096M"
 TRUSTED_GUILD_IDS = [829422702968045568, 691057767024295997]
 
 AternosStatus = namedtuple(
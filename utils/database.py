@@ -0,0 +1,113 @@
+import logging
+import math
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.future import Engine
+
+from utils.functions import get_database_url
+from utils.instrumentation import record_query
+
+logger = logging.getLogger("governo.database")
+
+# Name of the command being handled, so slow queries can be traced back to
+# it. Set by the invoke hooks in bot.py and copied to the repository threads.
+current_command: ContextVar[Optional[str]] = ContextVar(
+    "current_command", default=None
+)
+
+
+def get_pool_size() -> int:
+    return int(os.getenv("DATABASE_POOL_SIZE", "5"))
+
+
+def create_database_engine(url: Optional[str] = None) -> Engine:
+    """
+    Creates the engine configured by the environment:
+
+    - ``DATABASE_POOL_SIZE``, ``DATABASE_MAX_OVERFLOW``,
+      ``DATABASE_POOL_PRE_PING`` and ``DATABASE_POOL_RECYCLE`` (seconds)
+      tune the connection pool.
+    - ``SQLITE_BUSY_TIMEOUT_MS`` and ``SQLITE_SYNCHRONOUS`` tune SQLite,
+      which always runs in WAL mode.
+    - ``SLOW_QUERY_MS`` is the duration above which statements are logged.
+      ``DATABASE_ECHO=true`` logs every statement instead.
+    """
+    url = url or get_database_url()
+    options = dict(future=True, echo=os.getenv("DATABASE_ECHO") == "true")
+    is_sqlite = url.startswith("sqlite")
+    if not is_sqlite:
+        options.update(
+            pool_size=get_pool_size(),
+            max_overflow=int(os.getenv("DATABASE_MAX_OVERFLOW", "10")),
+            pool_pre_ping=os.getenv("DATABASE_POOL_PRE_PING", "true")
+            == "true",
+            pool_recycle=int(os.getenv("DATABASE_POOL_RECYCLE", "1800")),
+        )
+
+    engine = create_engine(url, **options)
+    if is_sqlite:
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        event.listen(engine, "connect", add_sqlite_math_functions)
+    log_slow_queries(engine, float(os.getenv("SLOW_QUERY_MS", "100")))
+    return engine
+
+
+def set_sqlite_pragmas(dbapi_connection, _):
+    cursor = dbapi_connection.cursor()
+    # WAL lets the readers keep going while the repository threads write.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(
+        f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}"
+    )
+    synchronous = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+    if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {synchronous}")
+    cursor.execute(f"PRAGMA synchronous={synchronous}")
+    cursor.close()
+
+
+def add_sqlite_math_functions(dbapi_connection, _):
+    """
+    SQLite only has ``ln``, used by the weighted movie picks, when it was
+    built with its math functions.
+    """
+    try:
+        dbapi_connection.execute("SELECT ln(1)")
+    except sqlite3.OperationalError:
+        dbapi_connection.create_function("ln", 1, math.log, deterministic=True)
+
+
+def log_slow_queries(engine: Engine, threshold_ms: float):
+    """
+    Times every statement, logs the slow ones and adds them all to the
+    measurement of the command that issued them.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def log_if_slow(conn, cursor, statement, parameters, context, many):
+        elapsed = (
+            time.perf_counter() - conn.info["query_started"].pop()
+        ) * 1000
+        record_query(elapsed)
+        if elapsed >= threshold_ms:
+            logger.warning(
+                "Slow query (%.1f ms) issued by %s: %s",
+                elapsed,
+                current_command.get() or "no command",
+                statement,
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def discard_timer(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
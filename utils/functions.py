@@ -21,6 +21,14 @@ def get_env_variable(name: str):
         )
 
 
+def get_database_url() -> str:
+    if os.getenv("I_AM_HEROKU") == "true":
+        return get_env_variable("DATABASE_URL").replace(
+            "postgres", "postgresql"
+        )
+    return "sqlite:///db.sqlite3"
+
+
 def generate_loading_embed(message: Optional[str] = None):
     return discord.Embed(
         title=message if message else choice(LOADING_MESSAGES),
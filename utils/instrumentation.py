@@ -0,0 +1,217 @@
+"""
+What each command costs.
+
+The invoke hooks in bot.py start a measurement when a prefix or slash
+command is invoked and record it when it's done. Everything the command does
+in between is added to the measurement of the context it runs in: the
+queries it issues (timed by the listeners of ``utils.database``), the calls
+it makes to the Discord API and the time it waits for IMDb.
+
+While disabled no measurement is ever started, and recording is a single
+context var lookup.
+"""
+
+import asyncio
+import bisect
+import json
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+# Upper bounds of the latency buckets, a last one holds the rest.
+BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Measurement:
+    def __init__(self, command: str):
+        self.command = command
+        self.started = time.perf_counter()
+        # Appended to by the repository threads as well, appending to a
+        # list is atomic.
+        self.queries: List[float] = []
+        self.imdb_fetches: List[float] = []
+        self.api_calls = 0
+        self.failed = False
+
+
+current_measurement: ContextVar[Optional[Measurement]] = ContextVar(
+    "current_measurement", default=None
+)
+
+
+def record_query(elapsed_ms: float):
+    measurement = current_measurement.get()
+    if measurement is not None:
+        measurement.queries.append(elapsed_ms)
+
+
+def record_imdb_fetch(elapsed_ms: float):
+    measurement = current_measurement.get()
+    if measurement is not None:
+        measurement.imdb_fetches.append(elapsed_ms)
+
+
+def record_api_call():
+    measurement = current_measurement.get()
+    if measurement is not None:
+        measurement.api_calls += 1
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Estimated by interpolating inside the bucket the percentile falls
+        in, as Prometheus does.
+        """
+        rank = fraction * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(BUCKETS_MS, self.counts):
+            if count and seen + count >= rank:
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.max
+
+
+class CommandStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.queries = 0
+        self.query_ms = 0.0
+        self.imdb_fetches = 0
+        self.imdb_ms = 0.0
+        self.api_calls = 0
+
+    def add(self, measurement: Measurement, elapsed_ms: float):
+        self.latency.add(elapsed_ms)
+        self.errors += int(measurement.failed)
+        self.queries += len(measurement.queries)
+        self.query_ms += sum(measurement.queries)
+        self.imdb_fetches += len(measurement.imdb_fetches)
+        self.imdb_ms += sum(measurement.imdb_fetches)
+        self.api_calls += measurement.api_calls
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.latency.count,
+            "errors": self.errors,
+            "total_ms": round(self.latency.total, 1),
+            "p50_ms": round(self.latency.percentile(0.5), 1),
+            "p99_ms": round(self.latency.percentile(0.99), 1),
+            "max_ms": round(self.latency.max, 1),
+            "queries": self.queries,
+            "query_ms": round(self.query_ms, 1),
+            "imdb_fetches": self.imdb_fetches,
+            "imdb_ms": round(self.imdb_ms, 1),
+            "api_calls": self.api_calls,
+            "buckets": dict(
+                zip([*map(str, BUCKETS_MS), "inf"], self.latency.counts)
+            ),
+        }
+
+
+class Instrumentation:
+    """
+    The stats of every command since the bot started, and the hit rates of
+    the caches registered with ``add_cache``. Every ``export_interval``
+    seconds, when set, they are printed as a JSON line.
+    """
+
+    def __init__(self, enabled: bool, export_interval: float = 0):
+        self.enabled = enabled
+        self.export_interval = export_interval
+        self.commands: Dict[str, CommandStats] = {}
+        self.caches: Dict[str, Callable[[], dict]] = {}
+        self.since = time.time()
+        self.export_task: Optional[asyncio.Task] = None
+
+    def start(self, command: str):
+        if not self.enabled:
+            return
+        measurement = current_measurement.get()
+        if measurement is not None:
+            # A group invoking its subcommand, which is what gets measured.
+            measurement.command = command
+        else:
+            current_measurement.set(Measurement(command))
+
+    def fail(self):
+        measurement = current_measurement.get()
+        if measurement is not None:
+            measurement.failed = True
+
+    def finish(self):
+        measurement = current_measurement.get()
+        if measurement is None:
+            return
+        current_measurement.set(None)
+        stats = self.commands.get(measurement.command)
+        if stats is None:
+            stats = self.commands[measurement.command] = CommandStats()
+        stats.add(
+            measurement, (time.perf_counter() - measurement.started) * 1000
+        )
+
+    def add_cache(self, name: str, stats: Callable[[], dict]):
+        """
+        Reports ``stats()`` as the stats of the cache ``name``. Caches keep
+        their counters whether the instrumentation is enabled or not.
+        """
+        self.caches[name] = stats
+
+    def cache_stats(self) -> Dict[str, dict]:
+        return {name: stats() for name, stats in self.caches.items()}
+
+    def watch_http(self, http):
+        """
+        Counts the requests of the bot's HTTP client. Call it again if
+        ``http.request`` is replaced.
+        """
+        if not self.enabled:
+            return
+        request = http.request
+
+        async def counted_request(*args, **kwargs):
+            record_api_call()
+            return await request(*args, **kwargs)
+
+        http.request = counted_request
+
+    def snapshot(self) -> dict:
+        return {
+            "since": self.since,
+            "commands": {
+                name: stats.as_dict()
+                for name, stats in sorted(self.commands.items())
+            },
+            "caches": self.cache_stats(),
+        }
+
+    def start_export(self):
+        if self.enabled and self.export_interval and self.export_task is None:
+            self.export_task = asyncio.create_task(self.export())
+
+    def stop_export(self):
+        if self.export_task is not None:
+            self.export_task.cancel()
+            self.export_task = None
+
+    async def export(self):
+        while True:
+            await asyncio.sleep(self.export_interval)
+            print(json.dumps({"command_stats": self.snapshot()}), flush=True)
@@ -0,0 +1,59 @@
+import discord_slash
+
+from utils.database import current_command
+from utils.instrumentation import Instrumentation
+
+
+class SlashCommand(discord_slash.SlashCommand):
+    """
+    ``discord_slash`` has no invoke hooks, the commands are wrapped here
+    instead, so they get the same context and instrumentation as the prefix
+    commands.
+
+    Component callbacks also handle the custom IDs that start with theirs
+    and a colon, the rest of the ID is state for the callback to decode.
+    """
+
+    def __init__(self, client, instrumentation: Instrumentation, **kwargs):
+        self.instrumentation = instrumentation
+        super().__init__(client, **kwargs)
+
+    async def invoke_command(self, func, ctx, args):
+        name = " ".join(
+            part
+            for part in (ctx.name, ctx.subcommand_group, ctx.subcommand_name)
+            if part
+        )
+        current_command.set(f"/{name}")
+        self.instrumentation.start(f"/{name}")
+        try:
+            await super().invoke_command(func, ctx, args)
+        finally:
+            self.instrumentation.finish()
+
+    def get_component_callback(
+        self, message_id=None, custom_id=None, component_type=None
+    ):
+        callback = super().get_component_callback(
+            message_id, custom_id, component_type
+        )
+        if callback is None and custom_id and ":" in custom_id:
+            callback = super().get_component_callback(
+                message_id, custom_id.partition(":")[0], component_type
+            )
+        return callback
+
+    async def invoke_component_callback(self, func, ctx):
+        name = f"component {ctx.custom_id.partition(':')[0]}"
+        current_command.set(name)
+        self.instrumentation.start(name)
+        try:
+            await super().invoke_component_callback(func, ctx)
+        finally:
+            self.instrumentation.finish()
+
+    async def _handle_invoke_error(self, func, ctx, ex):
+        # Every failed command and component callback goes through here,
+        # also the ones handled by their own ``on_error``.
+        self.instrumentation.fail()
+        return await super()._handle_invoke_error(func, ctx, ex)